@@ -1,29 +1,221 @@
+from functools import partial
+from urllib.parse import urlencode
+
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.http import QueryDict
+from django.utils.functional import cached_property
+
+from . import search, sharding
 from .models import Vendor, PurchaseOrder, HistoricalPerformance
+from .views import bulk_set_purchase_order_status
+
+# Admin searches are served from the full-text index, best matches first
+ADMIN_SEARCH_LIMIT = 1000
+# Query parameter naming the vendor shard an admin page works on
+SHARD_PARAM = 'shard'
+
+
+def estimate_row_count(model, using):
+    """
+    Cheap estimate of a table's row count, or None when none is available.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+            row = cursor.fetchone()
+        return int(row[0]) if row and row[0] >= 0 else None
+    # The largest id is one index lookup; it overcounts by the number of deleted rows.
+    # Ids on a shard start at the shard's range, see `sharding.reserve_id_ranges()`.
+    max_id = model._base_manager.using(using).aggregate(max_id=Max('pk'))['max_id']
+    if max_id is None:
+        return 0
+    shards = sharding.get_shards()
+    return max_id - (shards.index(using) << sharding.SHARD_ID_BITS if using in shards else 0)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts a large table in full. Unfiltered changelists
+    use the table size estimate once it passes `COUNT_LIMIT`; filtered ones
+    count at most `COUNT_LIMIT` rows, so only that many are paged through.
+    """
+    COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.COUNT_LIMIT:
+                return estimate
+        return queryset.order_by()[:self.COUNT_LIMIT].count()
+
+
+def requested_shard(request):
+    """
+    The shard chosen in the changelist's shard filter, also when an add
+    page carries the changelist's filters along. Defaults to the first shard.
+    """
+    shards = sharding.get_shards()
+    shard = request.GET.get(SHARD_PARAM)
+    if shard is None:
+        shard = QueryDict(request.GET.get('_changelist_filters', '')).get(SHARD_PARAM)
+    return shard if shard in shards else shards[0]
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """
+    Picks the shard a changelist shows. Shown only when there are several;
+    the queryset is already on the shard, see `ShardedModelAdmin.get_queryset()`.
+    """
+    title = 'shard'
+    parameter_name = SHARD_PARAM
+
+    def lookups(self, request, model_admin):
+        return [(shard, shard) for shard in sharding.get_shards()] if sharding.is_sharded() else []
+
+    def queryset(self, request, queryset):
+        return queryset
+
+    def choices(self, changelist):
+        # No "All": one shard is shown at a time
+        selected = requested_shard(self.request)
+        for shard, title in self.lookup_choices:
+            yield {
+                'selected': shard == selected,
+                'query_string': changelist.get_query_string({self.parameter_name: shard}),
+                'display': title,
+            }
+
+
+class ShardAutocompleteSelect(AutocompleteSelect):
+    """
+    Autocomplete that searches the shard of the object being edited.
+    """
 
+    def get_url(self):
+        return f"{super().get_url()}?{urlencode({SHARD_PARAM: self.db})}"
 
-class VendorAdmin(admin.ModelAdmin):
+
+class ShardedModelAdmin(admin.ModelAdmin):
+    """
+    Admin for vendor data, one shard at a time. Changelists, their actions
+    and autocomplete lookups work on the shard picked in the shard filter;
+    change, delete and history pages on the shard the object id belongs to.
+    Related vendors in a form come from the object's shard, since a
+    purchase order lives on the shard of its vendor.
+    """
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(requested_shard(request))
+
+    def get_list_filter(self, request):
+        return (ShardListFilter, *super().get_list_filter(request))
+
+    def get_object(self, request, object_id, from_field=None):
+        queryset = self.get_queryset(request)
+        model = queryset.model
+        field = model._meta.pk if from_field is None else model._meta.get_field(from_field)
+        try:
+            object_id = field.to_python(object_id)
+            if field.primary_key:
+                queryset = queryset.using(sharding.shard_for_id(object_id))
+            return queryset.get(**{field.name: object_id})
+        except (model.DoesNotExist, ValidationError, ValueError):
+            return None
+
+    def get_form(self, request, obj=None, change=False, **kwargs):
+        shard = obj._state.db if obj is not None else requested_shard(request)
+        kwargs.setdefault('formfield_callback', partial(self.formfield_for_dbfield, request=request, shard=shard))
+        return super().get_form(request, obj, change, **kwargs)
+
+    def formfield_for_dbfield(self, db_field, request, shard=None, **kwargs):
+        if shard is not None and db_field.is_relation and db_field.related_model._meta.app_label == sharding.APP_LABEL:
+            kwargs['using'] = shard
+            if db_field.name in self.get_autocomplete_fields(request):
+                kwargs['widget'] = ShardAutocompleteSelect(db_field, self.admin_site, using=shard)
+        return super().formfield_for_dbfield(db_field, request, **kwargs)
+
+
+class LargeTableAdmin(ShardedModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Skip the unfiltered COUNT(*) shown next to filtered result counts
+    show_full_result_count = False
+
+
+class VendorAdmin(LargeTableAdmin):
     list_display = ('name', 'vendor_code', 'contact_details', 'address')
     search_fields = ('name', 'vendor_code')
+    ordering = ('pk',)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        vendor_ids = search.search_vendor_ids(search_term, limit=ADMIN_SEARCH_LIMIT, using=queryset.db)
+        return queryset.filter(pk__in=vendor_ids), False
 
 
-class PurchaseOrderAdmin(admin.ModelAdmin):
+class PurchaseOrderAdmin(LargeTableAdmin):
     list_display = (
         'po_number', 'vendor', 'order_date', 'delivery_date', 'status'
     )
+    list_select_related = ('vendor',)
     list_filter = ('status', 'order_date')
     search_fields = ('po_number', 'vendor__name')
+    autocomplete_fields = ('vendor',)
+    date_hierarchy = 'order_date'
+    actions = ('mark_completed', 'mark_canceled')
+
+    def get_readonly_fields(self, request, obj=None):
+        # The response time of an acknowledged order is already in the vendor's digests
+        if obj is not None and obj.acknowledgment_date is not None:
+            return (*super().get_readonly_fields(request, obj), 'issue_date', 'acknowledgment_date')
+        return super().get_readonly_fields(request, obj)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        po_ids = search.search_purchase_order_ids(search_term, limit=ADMIN_SEARCH_LIMIT, using=queryset.db)
+        vendor_ids = search.search_vendor_ids(search_term, limit=ADMIN_SEARCH_LIMIT, using=queryset.db)
+        return queryset.filter(pk__in=po_ids) | queryset.filter(vendor_id__in=vendor_ids), False
 
+    def update_status(self, request, queryset, new_status):
+        updated = bulk_set_purchase_order_status(queryset, new_status)
+        self.message_user(request, f"{updated} pending purchase orders marked as {new_status}.")
 
-class HistoricalPerformanceAdmin(admin.ModelAdmin):
+    @admin.action(description="Mark selected pending purchase orders as completed")
+    def mark_completed(self, request, queryset):
+        self.update_status(request, queryset, 'completed')
+
+    @admin.action(description="Mark selected pending purchase orders as canceled")
+    def mark_canceled(self, request, queryset):
+        self.update_status(request, queryset, 'canceled')
+
+
+class HistoricalPerformanceAdmin(LargeTableAdmin):
     list_display = (
-        'vendor', 'date', 'on_time_delivery_rate', 'quality_rating_avg',
+        'vendor', 'date', 'period', 'on_time_delivery_rate', 'quality_rating_avg',
         'average_response_time', 'fulfillment_rate'
     )
-    list_filter = ('date',)
+    list_select_related = ('vendor',)
+    list_filter = ('period', 'date')
     search_fields = ('vendor__name',)
+    autocomplete_fields = ('vendor',)
+    date_hierarchy = 'date'
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        vendor_ids = search.search_vendor_ids(search_term, limit=ADMIN_SEARCH_LIMIT, using=queryset.db)
+        return queryset.filter(vendor_id__in=vendor_ids), False
 
 
 admin.site.register(Vendor, VendorAdmin)
 admin.site.register(PurchaseOrder, PurchaseOrderAdmin)
-admin.site.register(HistoricalPerformance, HistoricalPerformanceAdmin)
\ No newline at end of file
+admin.site.register(HistoricalPerformance, HistoricalPerformanceAdmin)
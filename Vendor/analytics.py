@@ -0,0 +1,286 @@
+"""
+Columnar in-memory snapshot of purchase orders for vectorized vendor scoring.
+
+`PurchaseOrderSnapshot` holds one NumPy array per purchase order column.
+The first `refresh()` scans every shard in primary key batches; later ones
+only read the change log written in the same transaction as every purchase
+order change, and reload or drop the rows it names. Re-scoring all vendors
+with different parameters is then a handful of array operations instead of
+a new set of aggregate queries against the live database.
+
+Archived purchase orders are not in the snapshot; the archive totals of
+their vendors are reloaded in full on every refresh, one small query per
+shard, and so are the ids of the vendors that have not been deleted.
+Orders and totals of deleted vendors stay in the arrays until the vendor
+is purged, but are left out of scoring.
+
+`score_vendors` computes the four lifetime vendor metrics exactly as
+`calculate_vendor_metrics_bulk` in `views.py` does in SQL, plus weighted
+composites of them.
+"""
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db.models import Max
+
+from . import sharding
+from .models import Vendor, PurchaseOrder, VendorArchiveTotals, ChangeLogEntry
+
+LOAD_BATCH_SIZE = 10000
+STATUS_CODES = {'pending': 0, 'completed': 1, 'canceled': 2}
+COMPLETED = STATUS_CODES['completed']
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+NAT = np.iinfo(np.int64).min
+MICROSECONDS_PER_HOUR = 3600 * 10 ** 6
+
+COLUMNS = {
+    'id': np.int64,
+    'vendor_id': np.int64,
+    'status': np.int8,
+    'order_date': 'datetime64[us]',
+    'delivery_date': 'datetime64[us]',
+    'completed_at': 'datetime64[us]',
+    'acknowledgment_date': 'datetime64[us]',
+    # 1, 0, or -1 when not recorded
+    'was_on_time': np.int8,
+    # NaN when not rated
+    'quality_rating': np.float64,
+    # Acknowledgment latency in microseconds, NaN until acknowledged
+    'response_time': np.float64,
+}
+FIELDS = (
+    'id', 'vendor_id', 'status', 'order_date', 'delivery_date', 'completed_at',
+    'acknowledgment_date', 'was_on_time', 'quality_rating', 'issue_date',
+)
+
+
+def microseconds(value):
+    """
+    Microseconds since the epoch of an aware datetime, or NAT for None.
+    """
+    return NAT if value is None else (value - EPOCH) // MICROSECOND
+
+
+def rows_to_columns(rows):
+    """
+    Convert `values_list(*FIELDS)` rows into a dict of column arrays.
+    """
+    columns = {name: [] for name in COLUMNS}
+    for pk, vendor_id, status, order_date, delivery_date, completed_at, acknowledged, on_time, rating, issued in rows:
+        columns['id'].append(pk)
+        columns['vendor_id'].append(vendor_id)
+        columns['status'].append(STATUS_CODES.get(status, -1))
+        columns['order_date'].append(microseconds(order_date))
+        columns['delivery_date'].append(microseconds(delivery_date))
+        columns['completed_at'].append(microseconds(completed_at))
+        columns['acknowledgment_date'].append(microseconds(acknowledged))
+        columns['was_on_time'].append(-1 if on_time is None else int(on_time))
+        columns['quality_rating'].append(np.nan if rating is None else rating)
+        columns['response_time'].append(np.nan if acknowledged is None else (acknowledged - issued) // MICROSECOND)
+    return {
+        name: np.array(values, dtype=np.int64).view(dtype) if str(dtype).startswith('datetime')
+        else np.array(values, dtype=dtype)
+        for (name, dtype), values in zip(COLUMNS.items(), columns.values())
+    }
+
+
+def empty_columns():
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+
+def load_archive_totals():
+    """
+    The archive totals of every vendor as a dict of column arrays.
+    """
+    fields = ('vendor_id', *VendorArchiveTotals.TOTAL_FIELDS)
+    rows = [row for shard in sharding.get_shards() for row in VendorArchiveTotals.objects.using(shard).values_list(*fields)]
+    return {
+        name: np.array([row[index] for row in rows], dtype=np.int64 if name == 'vendor_id' else np.float64)
+        for index, name in enumerate(fields)
+    }
+
+
+def load_live_vendor_ids():
+    """
+    The ids of the vendors that have not been deleted, sorted.
+    """
+    ids = [pk for shard in sharding.get_shards() for pk in Vendor.objects.using(shard).values_list('id', flat=True)]
+    return np.sort(np.array(ids, dtype=np.int64))
+
+
+class PurchaseOrderSnapshot:
+
+    def __init__(self):
+        self.columns = empty_columns()
+        self.archive_totals = None
+        self.live_vendor_ids = None
+        # Last change log id applied, per shard; None until the first load
+        self.cursors = None
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def live(self):
+        """
+        Mask of the purchase orders whose vendor has not been deleted.
+        """
+        live_vendor_ids = self.live_vendor_ids if self.live_vendor_ids is not None else load_live_vendor_ids()
+        return np.isin(self.columns['vendor_id'], live_vendor_ids)
+
+    def refresh(self):
+        """
+        Bring the snapshot up to date. Returns the number of purchase orders
+        read from the database.
+        """
+        with self.lock:
+            if self.cursors is None:
+                loaded = self._load()
+            else:
+                loaded = self._apply_changes()
+            self.archive_totals = load_archive_totals()
+            self.live_vendor_ids = load_live_vendor_ids()
+            self.refreshed_at = datetime.now(dt_timezone.utc)
+        return loaded
+
+    def _load(self):
+        parts = []
+        cursors = {}
+        for shard in sharding.get_shards():
+            # Taken before the scan, so changes made during it are applied again on the next refresh
+            cursors[shard] = ChangeLogEntry.objects.using(shard).aggregate(last=Max('id'))['last'] or 0
+            last_id = 0
+            while True:
+                rows = list(
+                    PurchaseOrder.objects.using(shard).filter(id__gt=last_id).order_by('id').values_list(*FIELDS)[:LOAD_BATCH_SIZE]
+                )
+                if not rows:
+                    break
+                parts.append(rows_to_columns(rows))
+                last_id = rows[-1][0]
+        self.columns = self._concatenate(parts) if parts else empty_columns()
+        self.cursors = cursors
+        return len(self)
+
+    def _apply_changes(self):
+        changed = []
+        parts = []
+        for shard in sharding.get_shards():
+            cursor = self.cursors.get(shard, 0)
+            last = ChangeLogEntry.objects.using(shard).filter(id__gt=cursor).aggregate(last=Max('id'))['last']
+            if last is None:
+                continue
+            ids = list(set(ChangeLogEntry.objects.using(shard).filter(
+                id__gt=cursor, id__lte=last, model='purchase_order'
+            ).values_list('object_id', flat=True)))
+            changed.extend(ids)
+            # Deleted orders are simply not found again
+            for start in range(0, len(ids), LOAD_BATCH_SIZE):
+                rows = PurchaseOrder.objects.using(shard).filter(id__in=ids[start:start + LOAD_BATCH_SIZE]).values_list(*FIELDS)
+                parts.append(rows_to_columns(rows))
+            self.cursors[shard] = last
+        if changed:
+            keep = ~np.isin(self.columns['id'], np.array(changed, dtype=np.int64))
+            self.columns = self._concatenate([{name: column[keep] for name, column in self.columns.items()}, *parts])
+        return sum(len(part['id']) for part in parts)
+
+    @staticmethod
+    def _concatenate(parts):
+        return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+
+def score_vendors(snapshot, on_time_tolerance=None, composites=None):
+    """
+    Compute the four vendor metrics for every vendor in the snapshot in one
+    vectorized pass. Returns {vendor id: {metric: value}}; like
+    `calculate_vendor_metrics_bulk`, vendors without live or archived
+    purchase orders, and deleted vendors, are not included.
+
+    `on_time_tolerance` is a timedelta by which completion may be late and
+    still count as on time; without it the stored `was_on_time` flag is used,
+    as in SQL. Archived orders, and orders completed before completion times
+    were recorded, keep their flag either way.
+
+    `composites` maps a result name to {metric: weight}; each composite is
+    the weighted sum of the metrics, e.g. {'score': {'on_time_delivery_rate': 0.5, 'quality_rating_avg': 10}}.
+    """
+    live = snapshot.live()
+    columns = {name: column[live] for name, column in snapshot.columns.items()}
+    archive = snapshot.archive_totals if snapshot.archive_totals is not None else load_archive_totals()
+    live_vendor_ids = snapshot.live_vendor_ids if snapshot.live_vendor_ids is not None else load_live_vendor_ids()
+    archive_live = np.isin(archive['vendor_id'], live_vendor_ids)
+    archive = {name: column[archive_live] for name, column in archive.items()}
+    vendor_ids, positions = np.unique(np.concatenate([columns['vendor_id'], archive['vendor_id']]), return_inverse=True)
+    vendors, archived_vendors = positions[:len(columns['id'])], positions[len(columns['id']):]
+    count = len(vendor_ids)
+
+    def per_vendor(mask, weights=None):
+        return np.bincount(vendors[mask], weights=None if weights is None else weights[mask], minlength=count)
+
+    def archived(name):
+        return np.bincount(archived_vendors, weights=archive[name], minlength=count)
+
+    completed = columns['status'] == COMPLETED
+    if on_time_tolerance is None:
+        on_time = columns['was_on_time'] == 1
+    else:
+        recorded = ~np.isnat(columns['completed_at'])
+        deadline = columns['delivery_date'] + np.timedelta64(on_time_tolerance // MICROSECOND, 'us')
+        on_time = np.where(recorded, columns['completed_at'] <= deadline, columns['was_on_time'] == 1)
+    rated = completed & ~np.isnan(columns['quality_rating'])
+    acknowledged = ~np.isnan(columns['response_time'])
+
+    total_orders = np.bincount(vendors, minlength=count) + archived('orders')
+    total_completed = per_vendor(completed) + archived('completed_orders')
+    total_on_time = per_vendor(completed & on_time) + archived('on_time_orders')
+    total_rated = per_vendor(rated) + archived('rated_orders')
+    rating_sum = per_vendor(rated, columns['quality_rating']) + archived('quality_rating_sum')
+    total_acknowledged = per_vendor(acknowledged) + archived('acknowledged_orders')
+    response_sum = per_vendor(acknowledged, columns['response_time']) + archived('response_time_sum') * MICROSECONDS_PER_HOUR
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        metrics = {
+            'on_time_delivery_rate': np.where(total_completed > 0, total_on_time / total_completed * 100, 0.0),
+            'quality_rating_avg': np.where(total_rated > 0, rating_sum / total_rated, 0.0),
+            'average_response_time': np.where(
+                total_acknowledged > 0, response_sum / total_acknowledged / MICROSECONDS_PER_HOUR, 0.0
+            ),
+            'fulfillment_rate': total_completed / total_orders * 100,
+        }
+    for name, weights in (composites or {}).items():
+        unknown = set(weights) - set(Vendor.METRIC_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown metrics in composite {name!r}: {', '.join(sorted(unknown))}")
+        metrics[name] = sum((metrics[metric] * weight for metric, weight in weights.items()), np.zeros(count))
+
+    names = list(metrics)
+    return {
+        int(vendor_id): {name: float(value) for name, value in zip(names, values)}
+        for vendor_id, *values in zip(vendor_ids, *(metrics[name] for name in names))
+    }
+
+
+_snapshot = PurchaseOrderSnapshot()
+
+
+def get_snapshot():
+    """
+    The process-wide snapshot, brought up to date.
+    """
+    _snapshot.refresh()
+    return _snapshot
+
+
+def reset_snapshot():
+    """
+    Drop the process-wide snapshot so the next `get_snapshot()` loads it again.
+    """
+    global _snapshot
+    _snapshot = PurchaseOrderSnapshot()
@@ -3,10 +3,21 @@ from .views import (
     LoginAPIView, 
     VendorListCreateAPIView, 
     VendorDetailAPIView, 
+    VendorSearchAPIView,
+    VendorImportAPIView,
+    VendorOverviewAPIView,
     PurchaseOrderListCreateAPIView, 
     PurchaseOrderDetailAPIView, 
+    PurchaseOrderSearchAPIView,
     VendorPerformanceAPIView, 
-    PurchaseOrderAcknowledgeAPIView
+    VendorBatchPerformanceAPIView,
+    VendorScoresAPIView,
+    PurchaseOrderAcknowledgeAPIView,
+    DashboardSummaryAPIView,
+    ChangeFeedAPIView,
+    ReportJobListCreateAPIView,
+    ReportJobDetailAPIView,
+    ReportJobDownloadAPIView,
 )
 
 urlpatterns = [
@@ -14,10 +25,24 @@ urlpatterns = [
     # Vendor Profile Management URLs
     path('vendors/', VendorListCreateAPIView.as_view(), name='vendor-list-create'),
     path('vendors/<int:vendor_id>/', VendorDetailAPIView.as_view(), name='vendor-detail'),
+    path('vendors/search/', VendorSearchAPIView.as_view(), name='vendor-search'),
+    path('vendors/import/', VendorImportAPIView.as_view(), name='vendor-import'),
     # Purchase Order Management URLs
     path('purchase_orders/', PurchaseOrderListCreateAPIView.as_view(), name='purchase-orders-list-create'),
     path('purchase_orders/<int:po_id>/', PurchaseOrderDetailAPIView.as_view(), name='purchase-order-detail'),
+    path('purchase_orders/search/', PurchaseOrderSearchAPIView.as_view(), name='purchase-order-search'),
     # Vendor Performance URL
+    path('vendors/performance/', VendorBatchPerformanceAPIView.as_view(), name='vendor-performance-batch'),
+    path('vendors/scores/', VendorScoresAPIView.as_view(), name='vendor-scores'),
     path('vendors/<int:vendor_id>/performance/', VendorPerformanceAPIView.as_view(), name='vendor-performance'),
+    path('vendors/<int:vendor_id>/overview/', VendorOverviewAPIView.as_view(), name='vendor-overview'),
     path('purchase_orders/<int:po_id>/acknowledge/', PurchaseOrderAcknowledgeAPIView.as_view(), name='purchase-order-acknowledge'),
+    # Dashboard URL
+    path('dashboard/summary/', DashboardSummaryAPIView.as_view(), name='dashboard-summary'),
+    # Change Feed URL
+    path('changes/', ChangeFeedAPIView.as_view(), name='change-feed'),
+    # Report Job URLs
+    path('reports/', ReportJobListCreateAPIView.as_view(), name='report-job-list-create'),
+    path('reports/<int:job_id>/', ReportJobDetailAPIView.as_view(), name='report-job-detail'),
+    path('reports/<int:job_id>/download/', ReportJobDownloadAPIView.as_view(), name='report-job-download'),
 ]
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class VendorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Vendor'
+
+    def ready(self):
+        from .sharding import reserve_id_ranges
+
+        post_migrate.connect(reserve_id_ranges, sender=self)
@@ -0,0 +1,158 @@
+"""
+Sampled capture of API traffic for load testing with the `replay` command.
+
+`RequestCaptureMiddleware` is opt-in: it removes itself unless
+`REQUEST_CAPTURE['ENABLED']` is set. A sampled request is written as one
+JSON line after its response: start time, method, path, resolved route,
+body, status and duration. Logins are never captured. Headers are not
+recorded, so auth tokens never reach the file; body fields and query
+parameters that carry secrets are replaced by `REDACTED`. Lines go to a
+size-rotated file; with several worker processes put `{pid}` in `PATH` so
+each process writes its own file.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 0.01,
+    'PATH': 'captures/requests-{pid}.ndjson',
+    'MAX_BYTES': 50 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    'MAX_BODY_BYTES': 64 * 1024,
+}
+REDACTED = 'REDACTED'
+SENSITIVE_NAMES = ('password', 'token', 'secret', 'authorization')
+
+
+def get_setting(name):
+    return getattr(settings, 'REQUEST_CAPTURE', {}).get(name, DEFAULTS[name])
+
+
+def is_sensitive(name):
+    return any(part in name.lower() for part in SENSITIVE_NAMES)
+
+
+def redact(value):
+    """
+    Replace the values of secret-looking keys anywhere in parsed JSON.
+    """
+    if isinstance(value, dict):
+        return {key: REDACTED if is_sensitive(key) else redact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+def redact_query(query_string):
+    pairs = parse_qsl(query_string, keep_blank_values=True)
+    return urlencode([(name, REDACTED if is_sensitive(name) else value) for name, value in pairs])
+
+
+def redact_body(body, content_type):
+    """
+    The request body as text with secrets redacted, or None when it cannot be recorded safely.
+    """
+    try:
+        text = body.decode()
+    except UnicodeDecodeError:
+        return None
+    if content_type.startswith('application/json'):
+        try:
+            return json.dumps(redact(json.loads(text)))
+        except ValueError:
+            return None
+    if content_type.startswith('application/x-www-form-urlencoded'):
+        return redact_query(text)
+    if content_type.startswith(('text/csv', 'application/x-ndjson')):
+        return text
+    return None
+
+
+class CaptureWriter:
+    """
+    Appends lines to a size-rotated file; safe to share between threads.
+    """
+    _writers = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        path = Path(str(get_setting('PATH')).format(pid=os.getpid()))
+        with cls._lock:
+            if path not in cls._writers:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    path, maxBytes=get_setting('MAX_BYTES'), backupCount=get_setting('BACKUP_COUNT'), encoding='utf-8'
+                )
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                cls._writers[path] = handler
+            return cls._writers[path]
+
+    @classmethod
+    def close_all(cls):
+        with cls._lock:
+            for handler in cls._writers.values():
+                handler.close()
+            cls._writers.clear()
+
+
+class RequestCaptureMiddleware:
+
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= get_setting('SAMPLE_RATE'):
+            return self.get_response(request)
+        body, body_omitted = self.read_body(request)
+        started = time.time()
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration_ms = (time.perf_counter() - start) * 1000
+        match = request.resolver_match
+        if match is not None and match.url_name == 'api_login':
+            return response
+        record = {
+            'started': round(started, 6),
+            'method': request.method,
+            'path': request.path + (f"?{redact_query(request.META['QUERY_STRING'])}" if request.META.get('QUERY_STRING') else ''),
+            'route': match.route if match else None,
+            'view': match.view_name if match else None,
+            'authenticated': 'HTTP_AUTHORIZATION' in request.META,
+            'content_type': request.content_type if body is not None else None,
+            'body': body,
+            'body_omitted': body_omitted,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 3),
+        }
+        CaptureWriter.get().handle(logging.makeLogRecord({'msg': json.dumps(record)}))
+        return response
+
+    def read_body(self, request):
+        """
+        Return (redacted body, whether a body was left out). Large bodies are
+        left unread so streaming endpoints such as the vendor import keep streaming.
+        """
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if not length:
+            return None, False
+        if length > get_setting('MAX_BODY_BYTES'):
+            return None, True
+        body = redact_body(request.body, request.content_type or '')
+        return body, body is None
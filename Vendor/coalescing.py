@@ -0,0 +1,173 @@
+"""
+Single-flight coalescing of identical concurrent read requests.
+
+When many clients ask for the same thing at once, e.g. a dashboard refresh
+storm before any cache is warm, `RequestCoalescingMiddleware` lets one
+request run the view and gives the identical requests that arrive while it
+runs a copy of its response bytes if it succeeds. Only GET and HEAD
+requests to the URL names in `REQUEST_COALESCING['VIEWS']` are coalesced. Requests are
+identical when their method, path, query parameters and the
+Authorization, Cookie, Accept and Accept-Language headers all match, so a
+response is only shared between requests made with the same credentials.
+A request given a copy takes a token from the `TokenBucketThrottle` bucket
+the running request was charged to, and gets a 429 when it is empty, so
+coalescing does not get around the rate limits.
+
+Coalescing is per process. Under threaded WSGI waiting requests block on
+an event; under ASGI they await a future of the running request. Nothing
+is kept once the response is out: this is not a cache.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from urllib.parse import parse_qsl
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+from rest_framework.exceptions import Throttled
+
+from .throttling import TokenBucketThrottle
+
+DEFAULTS = {
+    'VIEWS': [],
+    'TIMEOUT': 30.0,
+}
+KEY_HEADERS = ('HTTP_AUTHORIZATION', 'HTTP_COOKIE', 'HTTP_ACCEPT', 'HTTP_ACCEPT_LANGUAGE')
+
+
+def get_setting(name):
+    return getattr(settings, 'REQUEST_COALESCING', {}).get(name, DEFAULTS[name])
+
+
+def request_key(request):
+    """
+    The key identical requests share, or None when the request is not coalesced.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return None
+    if match.url_name not in get_setting('VIEWS'):
+        return None
+    query = sorted(parse_qsl(request.META.get('QUERY_STRING', ''), keep_blank_values=True))
+    headers = [request.META.get(name, '') for name in KEY_HEADERS]
+    # Hashed so credentials are not held as dictionary keys
+    return hashlib.sha256(json.dumps([request.method, request.path_info, query, headers]).encode()).hexdigest()
+
+
+def snapshot(response):
+    """
+    What a waiting request needs to rebuild `response`, or None when it
+    cannot be shared: unsuccessful, streamed and cookie-setting responses.
+    Django has already turned a failing view into a 500 response here, so
+    the status is the only sign the request failed.
+    """
+    if not 200 <= response.status_code < 300 or response.streaming or response.cookies:
+        return None
+    return response.content, response.status_code, response.reason_phrase, list(response.items())
+
+
+def rebuild(shared):
+    content, status_code, reason, headers = shared
+    response = HttpResponse(content, status=status_code, reason=reason)
+    for header, value in headers:
+        response[header] = value
+    return response
+
+
+def charge(bucket):
+    """
+    Take a token from the throttle bucket of the request whose response is
+    shared. Returns the 429 response to send instead when it is empty.
+    """
+    if bucket is None:
+        return None
+    throttle = TokenBucketThrottle()
+    if throttle.take(*bucket):
+        return None
+    exc = Throttled(throttle.wait())
+    response = JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+    response['Retry-After'] = '%d' % exc.wait
+    return response
+
+
+class Flight:
+    """
+    A response being computed, waited for by identical requests in other threads.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.shared = None
+        self.bucket = None
+
+
+class RequestCoalescingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_setting('VIEWS'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        key = request_key(request)
+        if key is None:
+            return self.get_response(request)
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+        if not leader:
+            if flight.done.wait(get_setting('TIMEOUT')) and flight.shared is not None:
+                return charge(flight.bucket) or rebuild(flight.shared)
+            # The response could not be shared or took too long; compute our own
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+            flight.shared = snapshot(response)
+            flight.bucket = getattr(request, 'throttle_bucket', None)
+            return response
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    async def __acall__(self, request):
+        key = request_key(request)
+        if key is None:
+            return await self.get_response(request)
+        # Requests of one event loop never run this concurrently, so no lock
+        flight = self.flights.get(key)
+        if flight is not None:
+            try:
+                shared, bucket = await asyncio.wait_for(asyncio.shield(flight), get_setting('TIMEOUT'))
+            except asyncio.TimeoutError:
+                shared = None
+            if shared is not None:
+                return charge(bucket) or rebuild(shared)
+            return await self.get_response(request)
+        flight = self.flights[key] = asyncio.get_running_loop().create_future()
+        shared = None
+        try:
+            response = await self.get_response(request)
+            shared = snapshot(response)
+            return response
+        finally:
+            del self.flights[key]
+            flight.set_result((shared, getattr(request, 'throttle_bucket', None)))
@@ -0,0 +1,155 @@
+"""
+Streaming bulk import of vendors from CSV or NDJSON.
+
+Records are read lazily and processed in chunks, so memory use depends on
+the chunk size and not on the size of the input. Each chunk's vendor codes
+are checked with one `IN` query per shard plus an in-chunk duplicate check,
+and the valid rows are written with one `bulk_create` per shard.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+from . import search, sharding
+from .models import Vendor
+from .serializers import VendorSerializer
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+FORMATS = ('csv', 'ndjson')
+
+
+class VendorImportSerializer(VendorSerializer):
+    """
+    Validates one imported row without touching the database. Uniqueness of
+    vendor codes is checked for a whole chunk at once by `import_vendors`.
+    """
+    class Meta(VendorSerializer.Meta):
+        extra_kwargs = {**VendorSerializer.Meta.extra_kwargs, 'vendor_code': {'validators': []}}
+
+    def validate_vendor_code(self, value):
+        if not value.isalnum():
+            raise serializers.ValidationError("Vendor code must be alphanumeric.")
+        return value
+
+
+def iter_csv_records(lines):
+    """
+    Yield (line number, row dict) from CSV text lines with a header row.
+    """
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def iter_ndjson_records(lines):
+    """
+    Yield (line number, object) from newline-delimited JSON text lines.
+    Lines that are not JSON objects are yielded as None.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_number, record if isinstance(record, dict) else None
+
+
+def iter_records(lines, data_format):
+    if data_format == 'csv':
+        return iter_csv_records(lines)
+    return iter_ndjson_records(lines)
+
+
+def import_vendors(records, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Import (line number, record) pairs in chunks of `batch_size`. Returns the
+    number of created and failed rows and the errors of the first
+    `MAX_REPORTED_ERRORS` failed rows.
+    """
+    summary = {'created': 0, 'failed': 0, 'errors': []}
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+        import_chunk(chunk, summary)
+    summary['errors_truncated'] = summary['failed'] > len(summary['errors'])
+    return summary
+
+
+def import_chunk(chunk, summary):
+    def fail(line_number, errors):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({
+                'line': line_number,
+                'errors': {field: [str(message) for message in messages] for field, messages in errors.items()},
+            })
+
+    valid = []
+    for line_number, record in chunk:
+        if record is None:
+            fail(line_number, {'non_field_errors': ['Line is not a JSON object.']})
+            continue
+        serializer = VendorImportSerializer(data=record)
+        if serializer.is_valid():
+            valid.append((line_number, serializer.validated_data))
+        else:
+            fail(line_number, serializer.errors)
+
+    codes = [data['vendor_code'] for _, data in valid]
+    taken = {
+        code for shard in sharding.get_shards()
+        for code in Vendor.all_objects.using(shard).filter(vendor_code__in=codes).values_list('vendor_code', flat=True)
+    }
+    pending = []
+    for line_number, data in valid:
+        if data['vendor_code'] in taken:
+            fail(line_number, {'vendor_code': ['Vendor code must be unique.']})
+            continue
+        taken.add(data['vendor_code'])
+        pending.append((line_number, Vendor(**data)))
+
+    try:
+        created = save_vendors([vendor for _, vendor in pending])
+    except IntegrityError:
+        # A code was taken between the check and the insert; fall back to row by row
+        # for the vendors whose shard was rolled back
+        created = [vendor for _, vendor in pending if vendor.pk is not None]
+        for line_number, vendor in pending:
+            if vendor.pk is not None:
+                continue
+            try:
+                created.extend(save_vendors([vendor]))
+            except IntegrityError:
+                fail(line_number, {'vendor_code': ['Vendor code must be unique.']})
+    summary['created'] += len(created)
+
+
+def save_vendors(vendors):
+    """
+    Insert vendors with one `bulk_create` per shard and do the bookkeeping the
+    skipped `post_save` signals would have done.
+    """
+    from .views import record_changes, mark_dashboard_summary_dirty
+
+    if not vendors:
+        return []
+    by_shard = {}
+    for vendor in vendors:
+        by_shard.setdefault(sharding.shard_for_vendor_code(vendor.vendor_code), []).append(vendor)
+    created = []
+    for shard, shard_vendors in by_shard.items():
+        with transaction.atomic(using=shard):
+            shard_created = Vendor.objects.using(shard).bulk_create(shard_vendors)
+            record_changes(Vendor, [vendor.pk for vendor in shard_created], 'create', using=shard)
+            search.index_vendors(shard_created, using=shard)
+        created.extend(shard_created)
+    mark_dashboard_summary_dirty(Vendor)
+    return created
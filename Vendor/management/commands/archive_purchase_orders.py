@@ -0,0 +1,96 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import DateTimeField, F, Value
+from django.utils import timezone
+
+from Vendor import search, sharding
+from Vendor.models import PurchaseOrder, ArchivedPurchaseOrder, VendorArchiveTotals
+from Vendor.views import calculate_order_totals, mark_dashboard_summary_dirty, record_changes
+
+CLOSED_STATUSES = ('completed', 'canceled')
+
+
+def archive_batch(using, ids, now):
+    """
+    Move the closed purchase orders among `ids` to the archive in one
+    transaction and add them to their vendors' archive totals. Returns the
+    number of orders moved.
+    """
+    columns = [field.attname for field in ArchivedPurchaseOrder._meta.concrete_fields]
+    rows = PurchaseOrder.objects.using(using).filter(id__in=ids, status__in=CLOSED_STATUSES).annotate(
+        archived_at=Value(now, output_field=DateTimeField())
+    ).values_list(*columns)
+    select, params = rows.query.sql_with_params()
+    connection = connections[using]
+    table = connection.ops.quote_name(ArchivedPurchaseOrder._meta.db_table)
+    with transaction.atomic(using=using):
+        # Write first: SQLite cannot upgrade a read transaction once another writer got in
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(map(connection.ops.quote_name, columns))}) {select}", params
+            )
+        archived = ArchivedPurchaseOrder.objects.using(using).filter(id__in=ids, archived_at=now)
+        archived_ids = list(archived.values_list('id', flat=True))
+        if not archived_ids:
+            return 0
+        totals = calculate_order_totals(archived)
+        VendorArchiveTotals.objects.using(using).bulk_create(
+            [VendorArchiveTotals(vendor_id=vendor_id) for vendor_id in totals], ignore_conflicts=True
+        )
+        for vendor_id, vendor_totals in totals.items():
+            VendorArchiveTotals.objects.using(using).filter(vendor_id=vendor_id).update(
+                **{field: F(field) + value for field, value in vendor_totals.items()}
+            )
+        # Bookkeeping of the skipped post_delete receivers
+        search.remove_purchase_orders(archived_ids, using=using)
+        record_changes(PurchaseOrder, archived_ids, 'archive', using=using)
+        # Nothing references purchase orders, so no collector is needed
+        PurchaseOrder.objects.using(using).filter(id__in=archived_ids)._raw_delete(using)
+    return len(archived_ids)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move completed and canceled purchase orders placed more than --older-than days ago "
+        "to the archive, one short transaction per batch. Vendor metrics are unchanged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, required=True,
+            help="Archive closed orders whose order date is more than this many days ago."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Orders moved per transaction (default: 1000)."
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.05,
+            help="Seconds to wait between batches so other writers get the lock (default: 0.05)."
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--older-than and --batch-size must be at least 1.")
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        archived = 0
+        for shard in sharding.get_shards():
+            old = PurchaseOrder.objects.using(shard).live().filter(status__in=CLOSED_STATUSES, order_date__lt=cutoff)
+            total = old.count()
+            moved = 0
+            last_id = 0
+            while True:
+                ids = list(old.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['batch_size']])
+                if not ids:
+                    break
+                last_id = ids[-1]
+                moved += archive_batch(shard, ids, timezone.now())
+                self.stdout.write(f"{shard}: {moved}/{total} purchase orders archived.")
+                time.sleep(options['pause'])
+            archived += moved
+        if archived:
+            mark_dashboard_summary_dirty(PurchaseOrder)
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} purchase orders placed before {cutoff:%Y-%m-%d}."))
@@ -0,0 +1,105 @@
+import multiprocessing
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from Vendor.models import Vendor, PurchaseOrder
+
+
+def write_orders(args):
+    """
+    Writer process: create purchase orders for random vendors and complete
+    them, each through the normal save path and its signals.
+    Returns the number of retries after lock timeouts.
+    """
+    writer, vendor_ids, orders = args
+    rng = random.Random(writer)
+    retries = 0
+    for i in range(orders):
+        now = timezone.now()
+        purchase_order = PurchaseOrder(
+            vendor_id=rng.choice(vendor_ids), po_number=f"W{writer}-{i}", order_date=now,
+            delivery_date=now + timezone.timedelta(days=1), items={'item': 'widget'}, quantity=1,
+        )
+        for step in ('create', 'complete'):
+            if step == 'complete':
+                purchase_order.status = 'completed'
+            while True:
+                try:
+                    purchase_order.save()
+                    break
+                except OperationalError:
+                    retries += 1
+    connections.close_all()
+    return retries
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent purchase order write throughput with the vendor data "
+        "split across 1, 2, 4, ... temporary SQLite shards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shards', type=int, nargs='+', default=[1, 2, 4, 8],
+            help="Shard counts to measure (default: 1 2 4 8)."
+        )
+        parser.add_argument('--writers', type=int, default=8, help="Concurrent writer processes (default: 8).")
+        parser.add_argument('--orders', type=int, default=100, help="Purchase orders per writer (default: 100).")
+        parser.add_argument('--vendors', type=int, default=64, help="Vendors the orders are spread over (default: 64).")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'shards':>6} {'orders':>7} {'seconds':>8} {'orders/s':>9} {'speedup':>8} {'retries':>8}")
+        baseline = None
+        for count in options['shards']:
+            with tempfile.TemporaryDirectory() as directory:
+                seconds, retries = self.run(count, Path(directory), options)
+            total = options['writers'] * options['orders']
+            throughput = total / seconds
+            baseline = baseline or throughput
+            self.stdout.write(
+                f"{count:>6} {total:>7} {seconds:>8.2f} {throughput:>9.1f} {throughput / baseline:>7.2f}x {retries:>8}"
+            )
+
+    def run(self, count, directory, options):
+        aliases = [f'benchmark{i}' for i in range(count)]
+        for alias in aliases:
+            connections.settings[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': str(directory / f'{alias}.sqlite3'),
+                'OPTIONS': {'timeout': 60},
+            }
+        connections.configure_settings(connections.settings)
+        try:
+            with override_settings(VENDOR_SHARDS=aliases):
+                for alias in aliases:
+                    call_command('migrate', 'Vendor', database=alias, verbosity=0)
+                vendor_ids = []
+                for i in range(options['vendors']):
+                    vendor = Vendor.objects.create(
+                        name=f"Vendor {i}", contact_details="Benchmark vendor", address="Benchmark address",
+                        vendor_code=f"B{i}",
+                    )
+                    vendor_ids.append(vendor.id)
+                # Children must not inherit open SQLite handles
+                connections.close_all()
+                jobs = [(writer, vendor_ids, options['orders']) for writer in range(options['writers'])]
+                with multiprocessing.get_context('fork').Pool(options['writers']) as pool:
+                    started = time.perf_counter()
+                    retries = sum(pool.map(write_orders, jobs))
+                    seconds = time.perf_counter() - started
+                assert sum(PurchaseOrder.objects.using(alias).count() for alias in aliases) == len(jobs) * options['orders']
+        finally:
+            for alias in aliases:
+                connections[alias].close()
+                del connections[alias]
+                del connections.settings[alias]
+        return seconds, retries
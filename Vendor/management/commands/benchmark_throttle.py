@@ -0,0 +1,70 @@
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from Vendor.throttling import TokenBucketThrottle
+
+
+class PingAPIView(APIView):
+    """
+    The cheapest possible API request, so the limiter's share of it shows.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response({})
+
+
+class UnthrottledPingAPIView(PingAPIView):
+    throttle_classes = []
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cost of the token bucket rate limiter: checks per second across many "
+        "clients, and a minimal API request with and without the limiter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000, help="Distinct API tokens (default: 1000).")
+        parser.add_argument('--checks', type=int, default=50000, help="Limiter checks to time (default: 50000).")
+        parser.add_argument('--requests', type=int, default=5000, help="Requests to time per view (default: 5000).")
+
+    def handle(self, *args, **options):
+        if min(options['clients'], options['checks'], options['requests']) < 1:
+            raise CommandError("--clients, --checks and --requests must be at least 1.")
+        tokens = [SimpleNamespace(key=f"token{i}") for i in range(options['clients'])]
+
+        TokenBucketThrottle.reset()
+        throttle = TokenBucketThrottle()
+        view = PingAPIView()
+        requests = [SimpleNamespace(method='GET', auth=token, _request=SimpleNamespace()) for token in tokens]
+        started = time.perf_counter()
+        for i in range(options['checks']):
+            throttle.allow_request(requests[i % len(requests)], view)
+        check_us = (time.perf_counter() - started) / options['checks'] * 1e6
+        self.stdout.write(f"Limiter: {1e6 / check_us:.0f} checks/s, {check_us:.2f}us per check.")
+
+        factory = APIRequestFactory()
+        timings = {}
+        for name, view_class in (('without limiter', UnthrottledPingAPIView), ('with limiter', PingAPIView)):
+            TokenBucketThrottle.reset()
+            view_func = view_class.as_view()
+            started = time.perf_counter()
+            for i in range(options['requests']):
+                request = factory.get('/ping/')
+                force_authenticate(request, token=tokens[i % len(tokens)])
+                view_func(request)
+            timings[name] = (time.perf_counter() - started) / options['requests'] * 1e6
+            self.stdout.write(f"Request {name}: {timings[name]:.1f}us.")
+        TokenBucketThrottle.reset()
+        overhead = timings['with limiter'] - timings['without limiter']
+        self.stdout.write(
+            f"Limiter overhead: {overhead:.1f}us per request "
+            f"({overhead / timings['without limiter'] * 100:.1f}% of a minimal request)."
+        )
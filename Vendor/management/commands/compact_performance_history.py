@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from Vendor import sharding
+from Vendor.models import HistoricalPerformance
+from Vendor.sketches import merge_digests
+
+# Figure: the order count it is averaged over
+WEIGHTS = {
+    'on_time_delivery_rate': 'completed_orders',
+    'quality_rating_avg': 'rated_orders',
+    'average_response_time': 'acknowledged_orders',
+    'fulfillment_rate': 'completed_orders',
+}
+COUNTS = ('completed_orders', 'rated_orders', 'acknowledged_orders')
+
+
+def week_start(date):
+    return date - timedelta(days=date.weekday())
+
+
+def month_start(date):
+    return date.replace(day=1)
+
+
+def combine(vendor_id, date, period, records):
+    """
+    One rollup record for `records`: each figure is the average of the
+    records' figures weighted by the number of orders behind it, and the
+    digests are merged.
+    """
+    rollup = HistoricalPerformance(vendor_id=vendor_id, date=date, period=period)
+    for count in COUNTS:
+        setattr(rollup, count, sum(getattr(record, count) for record in records))
+    for field, weight in WEIGHTS.items():
+        total = getattr(rollup, weight)
+        weighted = sum(getattr(record, field) * getattr(record, weight) for record in records)
+        setattr(rollup, field, weighted / total if total else 0.0)
+    rollup.response_time_digest = merge_digests(record.response_time_digest for record in records).to_dict()
+    return rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll daily vendor performance records older than --keep-daily days into weekly "
+        "records, and weekly records older than --keep-weekly days into monthly ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-daily', type=int, default=90, help="Days of daily records to keep (default: 90).")
+        parser.add_argument('--keep-weekly', type=int, default=365, help="Days of weekly records to keep (default: 365).")
+        parser.add_argument('--batch-size', type=int, default=100, help="Vendors compacted per transaction (default: 100).")
+
+    def handle(self, *args, **options):
+        if not 0 <= options['keep_daily'] <= options['keep_weekly']:
+            raise CommandError("--keep-daily must be between 0 and --keep-weekly.")
+        today = timezone.localdate()
+        # Only whole weeks and months are rolled up
+        week_cutoff = week_start(today - timedelta(days=options['keep_daily']))
+        month_cutoff = month_start(today - timedelta(days=options['keep_weekly']))
+        for shard in sharding.get_shards():
+            weeks = self.compact(shard, 'day', 'week', week_start, week_cutoff, options['batch_size'])
+            months = self.compact(shard, 'week', 'month', month_start, month_cutoff, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{shard}: rolled daily records before {week_cutoff} into {weeks} weekly records "
+                f"and weekly records before {month_cutoff} into {months} monthly records."
+            ))
+
+    def compact(self, using, source, target, period_start, cutoff, batch_size):
+        """
+        Replace the `source` records dated before `cutoff` by `target`
+        records, `batch_size` vendors per transaction. A week belongs to the
+        month it starts in. Returns the number of records written.
+        """
+        old = HistoricalPerformance.objects.using(using).filter(period=source, date__lt=cutoff)
+        written = 0
+        last_vendor_id = 0
+        while True:
+            vendor_ids = list(
+                old.filter(vendor_id__gt=last_vendor_id).order_by('vendor_id')
+                .values_list('vendor_id', flat=True).distinct()[:batch_size]
+            )
+            if not vendor_ids:
+                return written
+            last_vendor_id = vendor_ids[-1]
+            with transaction.atomic(using=using):
+                groups = {}
+                for record in old.filter(vendor_id__in=vendor_ids):
+                    groups.setdefault((record.vendor_id, period_start(record.date)), []).append(record)
+                # Fold in rollups written by an earlier run for the same periods
+                for record in HistoricalPerformance.objects.using(using).filter(
+                    vendor_id__in=vendor_ids, period=target, date__in={date for _, date in groups}
+                ):
+                    groups.get((record.vendor_id, record.date), []).append(record)
+                ids = [record.id for records in groups.values() for record in records]
+                HistoricalPerformance.objects.using(using).filter(id__in=ids).delete()
+                HistoricalPerformance.objects.using(using).bulk_create([
+                    combine(vendor_id, date, target, records) for (vendor_id, date), records in groups.items()
+                ])
+            written += len(groups)
+            self.stdout.write(f"{using}: {len(ids)} {source} records of {len(vendor_ids)} vendors rolled into {len(groups)} {target} records.")
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Vendor import importers
+
+
+class Command(BaseCommand):
+    help = "Bulk import vendors from a CSV file (with a header row) or an NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import.")
+        parser.add_argument(
+            '--format', choices=importers.FORMATS,
+            help="Input format. Defaults to the file extension (.csv or .ndjson/.jsonl)."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=importers.DEFAULT_BATCH_SIZE,
+            help=f"Rows validated and inserted per batch (default: {importers.DEFAULT_BATCH_SIZE})."
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        path = options['path']
+        data_format = options['format']
+        if data_format is None:
+            if path.endswith('.csv'):
+                data_format = 'csv'
+            elif path.endswith(('.ndjson', '.jsonl')):
+                data_format = 'ndjson'
+            else:
+                raise CommandError("Cannot tell the format from the file name; pass --format.")
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as lines:
+                summary = importers.import_vendors(importers.iter_records(lines, data_format), options['batch_size'])
+        except OSError as error:
+            raise CommandError(str(error))
+
+        for error in summary['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        if summary['errors_truncated']:
+            self.stderr.write(f"... {summary['failed'] - len(summary['errors'])} more failed rows not shown.")
+        self.stdout.write(self.style.SUCCESS(f"Imported {summary['created']} vendors, {summary['failed']} rows failed."))
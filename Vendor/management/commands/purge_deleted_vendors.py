@@ -0,0 +1,89 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Vendor import search, sharding
+from Vendor.models import (
+    Vendor, PurchaseOrder, ArchivedPurchaseOrder, VendorArchiveTotals, HistoricalPerformance, WebhookEvent,
+)
+from Vendor.views import record_changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove deleted vendors together with their purchase orders, archived orders, "
+        "performance history and webhook events, one short transaction per chunk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Rows deleted per transaction (default: 1000)."
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.05,
+            help="Seconds to wait between chunks so other writers get the lock (default: 0.05)."
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Purge the vendors deleted so far and exit instead of polling."
+        )
+        parser.add_argument(
+            '--interval', type=float, default=60.0,
+            help="Seconds to wait between polls when nothing is left to purge (default: 60)."
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            purged = 0
+            for shard in sharding.get_shards():
+                for vendor in Vendor.all_objects.using(shard).filter(deleted_at__isnull=False).order_by('deleted_at'):
+                    purged += self.purge_vendor(vendor, options['batch_size'], options['pause'])
+            if purged:
+                self.stdout.write(self.style.SUCCESS(f"Purged {purged} deleted vendors."))
+            if options['once']:
+                break
+            if not purged:
+                time.sleep(options['interval'])
+
+    def purge_vendor(self, vendor, batch_size, pause):
+        """
+        Delete the vendor's rows a chunk at a time, then the vendor itself.
+        Returns 1 once the vendor is gone, 0 if it has to be tried again.
+        """
+        using = vendor._state.db
+        purchase_orders = PurchaseOrder.objects.using(using).filter(vendor_id=vendor.pk)
+        total = purchase_orders.count()
+        removed = 0
+        while True:
+            ids = list(purchase_orders.order_by().values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic(using=using):
+                # Bookkeeping of the skipped post_delete receivers, once per chunk
+                search.remove_purchase_orders(ids, using=using)
+                record_changes(PurchaseOrder, ids, 'delete', using=using)
+                # Nothing references purchase orders, so no collector is needed
+                removed += purchase_orders.filter(id__in=ids)._raw_delete(using)
+            self.stdout.write(f"{vendor}: {removed}/{total} purchase orders removed.")
+            time.sleep(pause)
+
+        for model in (ArchivedPurchaseOrder, VendorArchiveTotals, HistoricalPerformance, WebhookEvent):
+            rows = model.objects.using(using).filter(vendor_id=vendor.pk)
+            while True:
+                ids = list(rows.order_by().values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                rows.filter(pk__in=ids).delete()
+                self.stdout.write(f"{vendor}: {len(ids)} {model._meta.verbose_name_plural} removed.")
+                time.sleep(pause)
+
+        with transaction.atomic(using=using):
+            if PurchaseOrder.objects.using(using).filter(vendor_id=vendor.pk).exists():
+                # An order was added after the vendor was deleted; pick it up on the next run
+                return 0
+            # The delete was already logged and unindexed when the vendor was marked deleted
+            Vendor.all_objects.using(using).filter(pk=vendor.pk)._raw_delete(using)
+        self.stdout.write(f"{vendor}: purged.")
+        return 1
@@ -0,0 +1,77 @@
+import math
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Vendor import sharding
+from Vendor.models import Vendor
+from Vendor.views import calculate_vendor_metrics_bulk, record_changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the performance metrics of every vendor from its purchase orders "
+        "and repair values that drifted, e.g. after bulk updates or deletes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report the vendors whose stored metrics drifted without writing anything."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of vendors read and written per batch (default: 500)."
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+        computed = calculate_vendor_metrics_bulk()
+        no_orders = dict.fromkeys(Vendor.METRIC_FIELDS, 0.0)
+
+        total = drifted = 0
+        for shard in sharding.get_shards():
+            shard_total, shard_drifted = self.recompute_shard(shard, computed, no_orders, dry_run, batch_size)
+            total += shard_total
+            drifted += shard_drifted
+
+        if dry_run:
+            self.stdout.write(f"{drifted} of {total} vendors have drifted metrics.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Recomputed metrics for {total} vendors, {drifted} updated."))
+
+    def recompute_shard(self, using, computed, no_orders, dry_run, batch_size):
+        total = drifted = 0
+        last_id = 0
+        vendors = Vendor.objects.using(using).only('id', 'name', 'vendor_code', *Vendor.METRIC_FIELDS).order_by('id')
+        while True:
+            # Page on the primary key so rows are never written while a cursor is open on them
+            batch = list(vendors.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            total += len(batch)
+            changed = []
+            for vendor in batch:
+                metrics = computed.get(vendor.id, no_orders)
+                changes = {
+                    field: (getattr(vendor, field), value) for field, value in metrics.items()
+                    if not math.isclose(getattr(vendor, field), value, abs_tol=1e-6)
+                }
+                if not changes:
+                    continue
+                if dry_run:
+                    details = ', '.join(
+                        f"{field} {old:.4f} -> {new:.4f} ({new - old:+.4f})" for field, (old, new) in changes.items()
+                    )
+                    self.stdout.write(f"{vendor}: {details}")
+                for field, (_, new) in changes.items():
+                    setattr(vendor, field, new)
+                changed.append(vendor)
+            drifted += len(changed)
+            if changed and not dry_run:
+                with transaction.atomic(using=using):
+                    Vendor.objects.using(using).bulk_update(changed, Vendor.METRIC_FIELDS)
+                    record_changes(Vendor, [vendor.id for vendor in changed], 'update', using=using)
+        return total, drifted
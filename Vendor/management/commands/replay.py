@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a non-empty list.
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def read_capture(paths):
+    """
+    Replayable records from capture files, in the order they were received.
+    Returns (records, number skipped because their body was not captured).
+    """
+    records = []
+    skipped = 0
+    for path in paths:
+        with open(path, encoding='utf-8') as capture:
+            for line in capture:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get('body_omitted'):
+                    skipped += 1
+                    continue
+                records.append(record)
+    records.sort(key=lambda record: record['started'])
+    return records, skipped
+
+
+def is_error(status):
+    # Connection failures are recorded as status None
+    return status is None or status >= 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay requests recorded by RequestCaptureMiddleware against a running server "
+        "and compare latency and error rates with the recorded run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('captures', nargs='+', help="Capture files (NDJSON), e.g. a file and its rotated backups.")
+        parser.add_argument(
+            '--base-url', default='http://127.0.0.1:8000',
+            help="Server to replay against (default: http://127.0.0.1:8000)."
+        )
+        parser.add_argument(
+            '--speed', type=float, default=1.0,
+            help="Replay speed relative to the recorded run, e.g. 2 for twice as fast; 0 sends as fast as possible (default: 1)."
+        )
+        parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight at most (default: 8).")
+        parser.add_argument(
+            '--token', default='',
+            help="API token sent with requests that were authenticated when recorded; tokens are never captured."
+        )
+        parser.add_argument('--timeout', type=float, default=30.0, help="Seconds to wait for each response (default: 30).")
+
+    def handle(self, *args, **options):
+        if options['speed'] < 0 or options['concurrency'] < 1:
+            raise CommandError("--speed must be 0 or more and --concurrency at least 1.")
+        try:
+            records, skipped = read_capture(options['captures'])
+        except (OSError, ValueError) as error:
+            raise CommandError(f"Cannot read capture: {error}")
+        if not records:
+            raise CommandError("The capture holds no replayable requests.")
+
+        results = []
+        lock = threading.Lock()
+
+        def send(record, due):
+            # Time spent behind schedule, waiting for the loop or for a free worker
+            wait_ms = max(0.0, time.monotonic() - due) * 1000
+            status, duration_ms = self.send(record, options)
+            with lock:
+                results.append((record, status, duration_ms, wait_ms))
+
+        first = records[0]['started']
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for record in records:
+                if options['speed']:
+                    due = started + (record['started'] - first) / options['speed']
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                else:
+                    due = time.monotonic()
+                executor.submit(send, record, due)
+        elapsed = time.monotonic() - started
+
+        if skipped:
+            self.stdout.write(f"Skipped {skipped} requests whose body was not captured.")
+        self.stdout.write(
+            f"Replayed {len(results)} requests in {elapsed:.1f}s "
+            f"(recorded over {records[-1]['started'] - first:.1f}s, "
+            f"max delay behind schedule {max(wait_ms for *_, wait_ms in results) / 1000:.2f}s)."
+        )
+        self.report(results)
+
+    def send(self, record, options):
+        """
+        Send one recorded request. Returns (status or None, duration in ms).
+        """
+        body = record['body'].encode() if record.get('body') is not None else None
+        request = urllib.request.Request(
+            options['base_url'].rstrip('/') + record['path'], data=body, method=record['method']
+        )
+        if body is not None:
+            request.add_header('Content-Type', record['content_type'])
+        if record.get('authenticated') and options['token']:
+            request.add_header('Authorization', f"Token {options['token']}")
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=options['timeout']) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            status = error.code
+        except (urllib.error.URLError, OSError):
+            status = None
+        return status, (time.perf_counter() - start) * 1000
+
+    def report(self, results):
+        groups = defaultdict(list)
+        for result in results:
+            record = result[0]
+            groups[f"{record['method']} {record['route'] or record['path']}"].append(result)
+        groups['TOTAL'] = results
+
+        self.stdout.write(
+            f"{'request':<48} {'count':>6} {'p50 rec':>8} {'p50 now':>8} {'p95 rec':>8} {'p95 now':>8} "
+            f"{'err% rec':>8} {'err% now':>8} {'p95 wait':>8}"
+        )
+        for name, rows in sorted(groups.items(), key=lambda item: (item[0] == 'TOTAL', -len(item[1]))):
+            recorded = [record['duration_ms'] for record, _, _, _ in rows]
+            replayed = [duration_ms for _, _, duration_ms, _ in rows]
+            waits = [wait_ms for _, _, _, wait_ms in rows]
+            recorded_errors = 100 * sum(is_error(record['status']) for record, _, _, _ in rows) / len(rows)
+            replayed_errors = 100 * sum(is_error(status) for _, status, _, _ in rows) / len(rows)
+            self.stdout.write(
+                f"{name[:48]:<48} {len(rows):>6} {percentile(recorded, 0.5):>8.1f} {percentile(replayed, 0.5):>8.1f} "
+                f"{percentile(recorded, 0.95):>8.1f} {percentile(replayed, 0.95):>8.1f} "
+                f"{recorded_errors:>8.1f} {replayed_errors:>8.1f} {percentile(waits, 0.95):>8.1f}"
+            )
+        changed = sum(record['status'] != status for record, status, _, _ in results)
+        if changed:
+            self.stdout.write(f"{changed} requests got a different status than when recorded.")
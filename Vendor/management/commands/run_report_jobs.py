@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Vendor.reports import claim_next_job, get_setting, run_job
+
+
+class Command(BaseCommand):
+    help = "Build the report jobs requested through the API, splitting each across a pool of processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help="Processes building a report; 0 builds it in this process (default: REPORTS['WORKERS'])."
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Build the jobs pending now and exit instead of polling."
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help="Seconds to wait between polls when no jobs are pending (default: 5)."
+        )
+
+    def handle(self, *args, **options):
+        workers = get_setting('WORKERS') if options['workers'] is None else options['workers']
+        if workers < 0:
+            raise CommandError("--workers must be 0 or more.")
+        while True:
+            job = claim_next_job()
+            if job is not None:
+                started = time.monotonic()
+                job = run_job(job, workers=workers)
+                if job.status == 'completed':
+                    self.stdout.write(
+                        f"Built {job} for {job.vendors_done} vendors in {time.monotonic() - started:.1f}s."
+                    )
+                else:
+                    self.stderr.write(f"{job}: {job.error}")
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Vendor.webhooks import dispatch_due_events
+
+
+class Command(BaseCommand):
+    help = "Deliver pending purchase order webhook events to vendors, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Send the events that are due now and exit instead of polling."
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help="Seconds to wait between polls when no events are due (default: 5)."
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            result = dispatch_due_events()
+            if result['delivered'] or result['failed']:
+                self.stdout.write(f"Delivered {result['delivered']} events, {result['failed']} failed.")
+            if options['once']:
+                break
+            if not (result['delivered'] or result['failed']):
+                time.sleep(options['interval'])
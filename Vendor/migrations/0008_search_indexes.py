@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Vendor = apps.get_model('Vendor', 'Vendor')
+    PurchaseOrder = apps.get_model('Vendor', 'PurchaseOrder')
+    statements = [
+        "CREATE VIRTUAL TABLE vendor_search USING fts5("
+        "name, vendor_code, address, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')",
+        # Matches on name and vendor code outrank matches on the address.
+        "INSERT INTO vendor_search (vendor_search, rank) VALUES ('rank', 'bm25(10.0, 10.0, 1.0)')",
+        f"INSERT INTO vendor_search (rowid, name, vendor_code, address) "
+        f"SELECT id, name, vendor_code, address FROM {Vendor._meta.db_table}",
+        "CREATE VIRTUAL TABLE purchase_order_search USING fts5("
+        "po_number, vendor_id UNINDEXED, tokenize = 'unicode61', prefix = '2 3 4')",
+        f"INSERT INTO purchase_order_search (rowid, po_number, vendor_id) "
+        f"SELECT id, po_number, vendor_id FROM {PurchaseOrder._meta.db_table}",
+    ]
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS vendor_search")
+    schema_editor.execute("DROP TABLE IF EXISTS purchase_order_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Vendor', '0007_alter_historicalperformance_average_response_time_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.4 on 2026-10-19 13:12
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Vendor', '0008_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vendor',
+            name='average_response_time',
+            field=models.FloatField(db_index=True, default=0.0, validators=[django.core.validators.MinValueValidator(0.0)]),
+        ),
+        migrations.AlterField(
+            model_name='vendor',
+            name='fulfillment_rate',
+            field=models.FloatField(db_index=True, default=0.0, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)]),
+        ),
+        migrations.AlterField(
+            model_name='vendor',
+            name='on_time_delivery_rate',
+            field=models.FloatField(db_index=True, default=0.0, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)]),
+        ),
+        migrations.AlterField(
+            model_name='vendor',
+            name='quality_rating_avg',
+            field=models.FloatField(db_index=True, default=0.0, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(5.0)]),
+        ),
+    ]
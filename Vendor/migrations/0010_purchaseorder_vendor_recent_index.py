@@ -0,0 +1,17 @@
+# Generated by Django 5.0.4 on 2026-10-19 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Vendor', '0009_vendor_metric_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['vendor', '-order_date'], name='po_vendor_recent_idx'),
+        ),
+    ]
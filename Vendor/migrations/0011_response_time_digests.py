@@ -0,0 +1,78 @@
+# Generated by Django 5.0.4 on 2026-10-19 13:16
+
+import math
+from itertools import groupby
+
+from django.db import migrations, models
+
+# The t-digest of Vendor/sketches.py as it was when this migration was
+# written, frozen here so later changes to the sketch cannot change what
+# the migration writes.
+COMPRESSION = 100
+
+
+def scale(q):
+    return COMPRESSION / (2 * math.pi) * math.asin(2 * min(q, 1.0) - 1)
+
+
+def digest_dict(values):
+    """
+    The serialised t-digest of a non-empty list of values.
+    """
+    values = sorted(values)
+    total = len(values)
+    centroids = [[values[0], 1]]
+    cumulative = 0
+    k_left = scale(0)
+    for value in values[1:]:
+        current = centroids[-1]
+        proposed = current[1] + 1
+        # A centroid may span at most one unit of the k1 scale function
+        if scale((cumulative + proposed) / total) - k_left <= 1:
+            current[0] += (value - current[0]) / proposed
+            current[1] = proposed
+        else:
+            cumulative += current[1]
+            k_left = scale(cumulative / total)
+            centroids.append([value, 1])
+    return {
+        'compression': COMPRESSION,
+        'centroids': [[round(mean, 6), count] for mean, count in centroids],
+        'min': values[0],
+        'max': values[-1],
+    }
+
+
+def build_vendor_digests(apps, schema_editor):
+    """
+    Seed each vendor's digest with the latencies of its acknowledged purchase orders.
+    """
+    Vendor = apps.get_model('Vendor', 'Vendor')
+    PurchaseOrder = apps.get_model('Vendor', 'PurchaseOrder')
+    db_alias = schema_editor.connection.alias
+    acknowledged = PurchaseOrder.objects.using(db_alias).filter(acknowledgment_date__isnull=False).order_by('vendor_id')
+    rows = acknowledged.values_list('vendor_id', 'issue_date', 'acknowledgment_date').iterator()
+    for vendor_id, vendor_rows in groupby(rows, key=lambda row: row[0]):
+        hours = [max((acknowledged_at - issued).total_seconds() / 3600, 0.0) for _, issued, acknowledged_at in vendor_rows]
+        Vendor.objects.using(db_alias).filter(pk=vendor_id).update(response_time_digest=digest_dict(hours))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Vendor', '0010_purchaseorder_vendor_recent_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalperformance',
+            name='response_time_digest',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='vendor',
+            name='response_time_digest',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(build_vendor_digests, migrations.RunPython.noop),
+    ]
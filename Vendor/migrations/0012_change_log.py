@@ -0,0 +1,46 @@
+# Generated by Django 5.0.4 on 2026-10-19 13:17
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def log_existing_rows(apps, schema_editor):
+    """
+    Start the change log with a create entry for every existing vendor and
+    purchase order, so a client syncing from cursor 0 receives everything.
+    """
+    ChangeLogEntry = apps.get_model('Vendor', 'ChangeLogEntry')
+    db_alias = schema_editor.connection.alias
+    for model_name, label in (('Vendor', 'vendor'), ('PurchaseOrder', 'purchase_order')):
+        model = apps.get_model('Vendor', model_name)
+        ids = model.objects.using(db_alias).order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last_id)[:2000])
+            if not batch:
+                break
+            ChangeLogEntry.objects.using(db_alias).bulk_create(
+                [ChangeLogEntry(model=label, object_id=pk, action='create') for pk in batch]
+            )
+            last_id = batch[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Vendor', '0011_response_time_digests'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('vendor', 'Vendor'), ('purchase_order', 'Purchase Order')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=10)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(log_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.4 on 2026-10-19 13:22
+
+from django.db import migrations, models
+from django.db.models import Case, F, When
+
+
+def backfill_was_on_time(apps, schema_editor):
+    """
+    Completion times of existing orders were never recorded, so completed_at
+    stays empty and was_on_time keeps the rule the metrics used until now.
+    """
+    PurchaseOrder = apps.get_model('Vendor', 'PurchaseOrder')
+    PurchaseOrder.objects.using(schema_editor.connection.alias).filter(status='completed').update(
+        was_on_time=Case(When(delivery_date__lte=F('order_date'), then=True), default=False)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Vendor', '0013_webhook_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='was_on_time',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['vendor', 'status', 'was_on_time'], name='po_vendor_on_time_idx'),
+        ),
+        migrations.RunPython(backfill_was_on_time, migrations.RunPython.noop),
+    ]
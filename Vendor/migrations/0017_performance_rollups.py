@@ -0,0 +1,55 @@
+# Generated by Django 5.0.4 on 2026-10-19 13:54
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+
+def backfill_order_counts(apps, schema_editor):
+    """
+    Count the orders behind each existing daily record from the purchase
+    orders placed that day, as the daily upsert now records them.
+    """
+    HistoricalPerformance = apps.get_model('Vendor', 'HistoricalPerformance')
+    PurchaseOrder = apps.get_model('Vendor', 'PurchaseOrder')
+    db_alias = schema_editor.connection.alias
+    days = PurchaseOrder.objects.using(db_alias).annotate(day=TruncDate('order_date')).values('vendor_id', 'day').annotate(
+        completed=Count('id', filter=Q(status='completed')),
+        rated=Count('quality_rating'),
+        acknowledged=Count('acknowledgment_date'),
+    ).filter(completed__gt=0).order_by()
+    for row in days.iterator():
+        HistoricalPerformance.objects.using(db_alias).filter(vendor_id=row['vendor_id'], date=row['day']).update(
+            completed_orders=row['completed'], rated_orders=row['rated'], acknowledged_orders=row['acknowledged']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Vendor', '0016_vendor_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalperformance',
+            name='acknowledged_orders',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='historicalperformance',
+            name='completed_orders',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='historicalperformance',
+            name='period',
+            field=models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month')], default='day', max_length=5),
+        ),
+        migrations.AddField(
+            model_name='historicalperformance',
+            name='rated_orders',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_order_counts, migrations.RunPython.noop),
+    ]
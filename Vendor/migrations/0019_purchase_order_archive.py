@@ -0,0 +1,55 @@
+# Generated by Django 5.0.4 on 2026-10-19 14:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Vendor', '0018_report_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendorArchiveTotals',
+            fields=[
+                ('vendor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive_totals', serialize=False, to='Vendor.vendor')),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('completed_orders', models.PositiveIntegerField(default=0)),
+                ('on_time_orders', models.PositiveIntegerField(default=0)),
+                ('rated_orders', models.PositiveIntegerField(default=0)),
+                ('quality_rating_sum', models.FloatField(default=0.0)),
+                ('acknowledged_orders', models.PositiveIntegerField(default=0)),
+                ('response_time_sum', models.FloatField(default=0.0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='changelogentry',
+            name='action',
+            field=models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('archive', 'Archive')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='ArchivedPurchaseOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('po_number', models.CharField(max_length=100, unique=True)),
+                ('order_date', models.DateTimeField()),
+                ('delivery_date', models.DateTimeField()),
+                ('items', models.JSONField()),
+                ('quantity', models.IntegerField()),
+                ('status', models.CharField(choices=[('completed', 'Completed'), ('canceled', 'Canceled')], max_length=20)),
+                ('quality_rating', models.FloatField(blank=True, null=True)),
+                ('issue_date', models.DateTimeField()),
+                ('acknowledgment_date', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('was_on_time', models.BooleanField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_purchase_orders', to='Vendor.vendor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['vendor', '-order_date'], name='archived_po_vendor_recent_idx')],
+            },
+        ),
+    ]
@@ -1,35 +1,174 @@
-from django.db import models
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, router, transaction
 from django.utils import  timezone
+from .sharding import ShardedQuerySet
 from django.core.validators import (
     MinLengthValidator, 
     MaxValueValidator, 
     MinValueValidator
     )
 
-class Vendor(models.Model):
+class AtomicSaveModel(models.Model):
+    """
+    Runs `save()` and its `post_save` receivers in one transaction, so rows
+    they write (such as change log entries) commit or roll back with the save.
+    """
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+
+class ChangeTrackingModel(models.Model):
+    """
+    Remembers the field values loaded from the database, so code can ask which
+    fields changed since then. During `post_save` the fields written by that
+    save are in `saved_changes` (None for a new row). Values are compared, so
+    a JSON value changed in place is not seen; assign a new value instead.
+    """
+    saved_changes = None
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # The reloaded values are the new baseline; `fields` may name fields or their attnames
+        deferred = self.get_deferred_fields()
+        loaded = getattr(self, '_loaded_values', {})
+        loaded.update({
+            field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+            if field.attname not in deferred and (fields is None or {field.name, field.attname} & set(fields))
+        })
+        loaded[self._meta.pk.attname] = self.pk
+        self._loaded_values = loaded
+
+    def loaded_value(self, name):
+        """
+        The value of field `name` when the row was loaded or last saved.
+        """
+        field = self._meta.get_field(name)
+        return getattr(self, '_loaded_values', {}).get(field.attname)
+
+    def changed_fields(self):
+        """
+        Names of the fields that differ from the loaded values; every field for a new row.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return {field.name for field in self._meta.concrete_fields if not field.primary_key}
+        return {
+            field.name for field in self._meta.concrete_fields
+            if field.attname in loaded and getattr(self, field.attname) != loaded[field.attname]
+        }
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        changes = self.changed_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            changes &= {self._meta.get_field(name).name for name in update_fields}
+        self.saved_changes = None if adding else changes
+        super().save(*args, **kwargs)
+        saved = self._meta.concrete_fields if adding or update_fields is None else [
+            self._meta.get_field(name) for name in update_fields
+        ]
+        deferred = self.get_deferred_fields()
+        loaded = getattr(self, '_loaded_values', {})
+        loaded.update({field.attname: getattr(self, field.attname) for field in saved if field.attname not in deferred})
+        loaded[self._meta.pk.attname] = self.pk
+        self._loaded_values = loaded
+
+    def save_changes(self, **kwargs):
+        """
+        Write only the fields changed since load. Does nothing, and sends no
+        signals, when nothing changed. Returns the changed field names.
+        """
+        changes = self.changed_fields()
+        if self._state.adding:
+            self.save(**kwargs)
+        elif changes:
+            self.save(update_fields=changes, **kwargs)
+        return changes
+
+
+class LiveVendorManager(models.Manager.from_queryset(ShardedQuerySet)):
+    """
+    Vendors that have not been deleted.
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class PurchaseOrderQuerySet(ShardedQuerySet):
+
+    def live(self):
+        """
+        Purchase orders whose vendor has not been deleted.
+        """
+        return self.filter(vendor__deleted_at__isnull=True)
+
+
+class Vendor(ChangeTrackingModel, AtomicSaveModel):
     name = models.CharField(max_length=255)
     contact_details = models.TextField(validators=[MinLengthValidator(10)])
     address = models.TextField(validators=[MinLengthValidator(10)])
     vendor_code = models.CharField(max_length=100, unique=True)
     on_time_delivery_rate = models.FloatField(
         default=0.0, 
+        db_index=True,
         validators=[MinValueValidator(0.0), MaxValueValidator(100.0)]
         )
     quality_rating_avg = models.FloatField(
         default=0.0, 
+        db_index=True,
         validators=[MinValueValidator(0.0), MaxValueValidator(5.0)]
         )
-    average_response_time = models.FloatField(default=0.0, validators=[MinValueValidator(0.0)])
+    average_response_time = models.FloatField(default=0.0, db_index=True, validators=[MinValueValidator(0.0)])
     fulfillment_rate = models.FloatField(
         default=0.0, 
+        db_index=True,
         validators=[MinValueValidator(0.0), MaxValueValidator(100.0)]
         )
     
+    # Serialised sketches.TDigest of acknowledgment latencies in hours
+    response_time_digest = models.JSONField(default=dict, blank=True)
+    # Purchase order events are POSTed here, signed with the secret
+    webhook_url = models.URLField(blank=True, default='')
+    webhook_secret = models.CharField(max_length=128, blank=True, default='')
+    # Set by a delete; the vendor's rows are removed later by `purge_deleted_vendors`
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = LiveVendorManager()
+    # Includes deleted vendors, e.g. for vendor code uniqueness
+    all_objects = ShardedQuerySet.as_manager()
+
+    METRIC_FIELDS = ('on_time_delivery_rate', 'quality_rating_avg', 'average_response_time', 'fulfillment_rate')
+
     def __str__(self):
         return f"{self.name} ({self.vendor_code})"
 
+    def soft_delete(self):
+        """
+        Mark the vendor deleted so it is no longer returned. Its purchase
+        orders and performance history stay until it is purged.
+        """
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at'])
 
-class PurchaseOrder(models.Model):
+
+class PurchaseOrder(ChangeTrackingModel, AtomicSaveModel):
     po_number = models.CharField(max_length=100, unique=True)
     vendor = models.ForeignKey(
         Vendor, 
@@ -50,12 +189,121 @@ class PurchaseOrder(models.Model):
         )
     issue_date = models.DateTimeField(default=timezone.now)
     acknowledgment_date = models.DateTimeField(null=True, blank=True)
+    # Recorded when the order moves to completed
+    completed_at = models.DateTimeField(null=True, blank=True)
+    was_on_time = models.BooleanField(null=True, blank=True)
+
+    objects = PurchaseOrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['vendor', '-order_date'], name='po_vendor_recent_idx'),
+            models.Index(fields=['vendor', 'status', 'was_on_time'], name='po_vendor_on_time_idx'),
+            # Back the admin's date hierarchy and status/date filters
+            models.Index(fields=['order_date'], name='po_order_date_idx'),
+            models.Index(fields=['status', 'order_date'], name='po_status_order_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.status == 'completed' and self.completed_at is None:
+            self.completed_at = timezone.now()
+            self.was_on_time = self.completed_at <= self.delivery_date
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'completed_at', 'was_on_time'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"PO {self.po_number} - {self.status}"
 
 
+class ArchivedPurchaseOrder(models.Model):
+    """
+    A closed purchase order moved out of `PurchaseOrder` by the
+    `archive_purchase_orders` command, with its id and fields unchanged.
+    Archived orders are read-only; their share of the lifetime vendor
+    metrics is kept in `VendorArchiveTotals`.
+    """
+    # Taken over from the purchase order
+    id = models.BigIntegerField(primary_key=True)
+    po_number = models.CharField(max_length=100, unique=True)
+    vendor = models.ForeignKey(
+        Vendor,
+        on_delete=models.CASCADE, related_name='archived_purchase_orders'
+        )
+    order_date = models.DateTimeField()
+    delivery_date = models.DateTimeField()
+    items = models.JSONField()
+    quantity = models.IntegerField()
+    status = models.CharField(max_length=20, choices=[('completed', 'Completed'), ('canceled', 'Canceled')])
+    quality_rating = models.FloatField(null=True, blank=True)
+    issue_date = models.DateTimeField()
+    acknowledgment_date = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    was_on_time = models.BooleanField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    objects = PurchaseOrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['vendor', '-order_date'], name='archived_po_vendor_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived PO {self.po_number} - {self.status}"
+
+
+class VendorArchiveTotals(models.Model):
+    """
+    Running totals of a vendor's archived purchase orders, added to those of
+    its live orders wherever lifetime vendor metrics are calculated.
+    """
+    # Named like the per-vendor totals of `views.calculate_order_totals`
+    TOTAL_FIELDS = (
+        'orders', 'completed_orders', 'on_time_orders', 'rated_orders',
+        'quality_rating_sum', 'acknowledged_orders', 'response_time_sum',
+    )
+
+    vendor = models.OneToOneField(
+        Vendor,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='archive_totals'
+        )
+    orders = models.PositiveIntegerField(default=0)
+    completed_orders = models.PositiveIntegerField(default=0)
+    on_time_orders = models.PositiveIntegerField(default=0)
+    rated_orders = models.PositiveIntegerField(default=0)
+    quality_rating_sum = models.FloatField(default=0.0)
+    acknowledged_orders = models.PositiveIntegerField(default=0)
+    # Sum of the acknowledgment latencies, in hours
+    response_time_sum = models.FloatField(default=0.0)
+
+    objects = ShardedQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Archive totals of {self.vendor_id}: {self.orders} orders"
+
+
+class HistoricalPerformanceQuerySet(ShardedQuerySet):
+
+    def overlapping(self, start, end):
+        """
+        Records whose period overlaps the dates from `start` to `end`, daily
+        records as well as weekly and monthly rollups. A monthly rollup also
+        holds the rest of the week the month ends in, up to six days of the
+        next month.
+        """
+        return self.filter(
+            models.Q(period='day', date__range=(start, end))
+            | models.Q(period='week', date__range=(start - timedelta(days=6), end))
+            | models.Q(period='month', date__range=((start - timedelta(days=6)).replace(day=1), end))
+        )
+
+
 class HistoricalPerformance(models.Model):
+    PERIOD_CHOICES = [('day', 'Day'), ('week', 'Week'), ('month', 'Month')]
+
     vendor = models.ForeignKey(
         Vendor, 
         on_delete=models.CASCADE, 
@@ -78,8 +326,115 @@ class HistoricalPerformance(models.Model):
         default=0.0, 
         validators=[MinValueValidator(0.0), MaxValueValidator(100.0)]
         )
+    # Serialised sketches.TDigest of the latencies of acknowledgments recorded that day
+    response_time_digest = models.JSONField(default=dict, blank=True)
+    # Old daily records are rolled up into weeks and months starting on `date`
+    # by `compact_performance_history`
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES, default='day')
+    # Number of orders the figures are averaged over, to weight them in rollups
+    completed_orders = models.PositiveIntegerField(default=0)
+    rated_orders = models.PositiveIntegerField(default=0)
+    acknowledged_orders = models.PositiveIntegerField(default=0)
+
+    objects = HistoricalPerformanceQuerySet.as_manager()
+
     class Meta:
         unique_together = ('vendor', 'date')
+        indexes = [
+            models.Index(fields=['date'], name='hp_date_idx'),
+        ]
 
     def __str__(self):
+        if self.period != 'day':
+            return f"Performance for the {self.period} of {self.date.strftime('%Y-%m-%d')} for {self.vendor.name}"
         return f"Performance on {self.date.strftime('%Y-%m-%d')} for {self.vendor.name}"
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Append-only record of vendor and purchase order changes. The id is the
+    cursor clients pass to the change feed to fetch what changed since.
+    """
+    MODEL_CHOICES = [('vendor', 'Vendor'), ('purchase_order', 'Purchase Order')]
+    ACTION_CHOICES = [('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('archive', 'Archive')]
+
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"#{self.pk} {self.action} {self.model} {self.object_id}"
+
+
+class WebhookEvent(models.Model):
+    """
+    Outbox of purchase order events waiting to be delivered to a vendor's
+    webhook. Rows are written in the transaction of the change and sent
+    later by the `send_webhooks` worker.
+    """
+    STATUS_CHOICES = [('pending', 'Pending'), ('sending', 'Sending'), ('delivered', 'Delivered'), ('failed', 'Failed')]
+
+    vendor = models.ForeignKey(
+        Vendor,
+        on_delete=models.CASCADE,
+        related_name='webhook_events'
+        )
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, default='pending', choices=STATUS_CHOICES)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    # Set while a dispatcher is sending the event
+    claimed_by = models.CharField(max_length=32, blank=True, default='')
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='webhook_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} for {self.vendor_id} - {self.status}"
+
+
+class ReportJob(models.Model):
+    """
+    A report requested through the API. The request only stores the job;
+    the `run_report_jobs` worker builds the file, see `reports.py`. Jobs
+    live on the first vendor shard.
+    """
+    KIND_CHOICES = [('scorecard', 'Vendor Scorecard')]
+    STATUS_CHOICES = [('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')]
+
+    # The first shard need not hold the user table
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='report_jobs',
+        db_constraint=False
+        )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    parameters = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, default='pending', choices=STATUS_CHOICES)
+    vendors_total = models.PositiveIntegerField(default=0)
+    vendors_done = models.PositiveIntegerField(default=0)
+    # File name in REPORTS['PATH'] once completed
+    file_name = models.CharField(max_length=100, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='report_job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} report #{self.pk} - {self.status}"
@@ -0,0 +1,32 @@
+"""
+Entry points of the report pool processes, see `reports.py`. Nothing from
+Django is imported at load time, so a spawned process can unpickle these
+before `init_worker` has set Django up.
+"""
+
+
+def init_worker(databases):
+    """
+    Set up a pool process: Django, when the process was spawned rather than
+    forked, and the parent's database settings. Connections are opened by
+    the process itself on first use.
+    """
+    import django
+    from django.apps import apps
+    from django.db import connections
+
+    if not apps.ready:
+        django.setup()
+    for alias, config in databases.items():
+        connections.settings[alias] = config
+    connections.configure_settings(connections.settings)
+
+
+def build_part(kind, parameters, using, vendor_ids, path):
+    """
+    Build one chunk of a report into its own file.
+    """
+    from .reports import REPORT_WRITERS
+
+    with open(path, 'w', encoding='utf-8') as out:
+        return REPORT_WRITERS[kind](out, parameters, using, vendor_ids)
@@ -0,0 +1,279 @@
+"""
+Background generation of reports too heavy to build inside a request.
+
+`POST /api/reports/` only stores a pending `ReportJob`. The `run_report_jobs`
+worker claims it and builds the report: the vendors are split into chunks
+of `VENDORS_PER_TASK`, which a process pool builds in parallel. Each worker
+process opens its own database connections and writes its chunk to a part
+file one vendor at a time; the parts are then joined, in vendor order, into
+one NDJSON file with a line per vendor. Memory use is bounded by a chunk of
+aggregates and one vendor's rows per process, whatever the number of vendors.
+
+With `workers=0` the chunks are built one after the other in the calling
+process, which is what the tests use: the in-memory test database is not
+visible to other processes.
+"""
+import datetime
+import heapq
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import groupby, islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import ExpressionWrapper, F, FloatField, Sum
+from django.db.models.functions import NullIf, TruncMonth
+from django.utils import timezone
+
+from . import sharding
+from .report_worker import build_part, init_worker
+from .models import Vendor, PurchaseOrder, ArchivedPurchaseOrder, HistoricalPerformance, ReportJob
+
+DEFAULTS = {
+    'PATH': 'reports',
+    'WORKERS': 4,
+    'VENDORS_PER_TASK': 100,
+    # Seconds after which a running job is assumed to have lost its worker
+    'CLAIM_TIMEOUT': 2 * 60 * 60,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'REPORTS', {}).get(name, DEFAULTS[name])
+
+
+def report_path(file_name):
+    return Path(get_setting('PATH')) / file_name
+
+
+def quarter_start(date):
+    return date.replace(month=(date.month - 1) // 3 * 3 + 1, day=1)
+
+
+def parse_scorecard_parameters(data):
+    """
+    Validated scorecard parameters: `start` and `end` dates, by default the
+    last full quarter. Raises ValueError.
+    """
+    default_end = quarter_start(timezone.localdate()) - datetime.timedelta(days=1)
+    try:
+        start = datetime.date.fromisoformat(str(data.get('start', quarter_start(default_end).isoformat())))
+        end = datetime.date.fromisoformat(str(data.get('end', default_end.isoformat())))
+    except ValueError:
+        raise ValueError("start and end must be dates in YYYY-MM-DD format.")
+    if start > end:
+        raise ValueError("start must not be after end.")
+    return {'start': start.isoformat(), 'end': end.isoformat()}
+
+
+def day_range(start, end):
+    """
+    Aware datetimes bounding the local days from `start` to `end`, end exclusive.
+    """
+    return (
+        timezone.make_aware(datetime.datetime.combine(start, datetime.time.min)),
+        timezone.make_aware(datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min)),
+    )
+
+
+def weighted_average(field, weight):
+    """
+    Average of `field` over records weighted by the order count `weight`, NULL without orders.
+    """
+    return ExpressionWrapper(Sum(F(field) * F(weight)) / NullIf(Sum(weight), 0), output_field=FloatField())
+
+
+def write_scorecards(out, parameters, using, vendor_ids):
+    """
+    Write one scorecard line per vendor: the metrics of the orders placed in
+    the period, archived ones included, the monthly trend of the performance
+    history, and the orders completed late. Returns the number of vendors
+    written.
+    """
+    from .views import calculate_metrics_from_totals, calculate_order_totals
+
+    start = datetime.date.fromisoformat(parameters['start'])
+    end = datetime.date.fromisoformat(parameters['end'])
+    placed_from, placed_before = day_range(start, end)
+    # Orders placed in the period, live and archived
+    totals = {}
+    late_order_streams = []
+    for model in (PurchaseOrder, ArchivedPurchaseOrder):
+        purchase_orders = model.objects.using(using).filter(
+            vendor_id__in=vendor_ids, order_date__gte=placed_from, order_date__lt=placed_before
+        )
+        for vendor_id, vendor_totals in calculate_order_totals(purchase_orders).items():
+            combined = totals.setdefault(vendor_id, dict.fromkeys(vendor_totals, 0))
+            for field, value in vendor_totals.items():
+                combined[field] += value
+        late_order_streams.append(
+            purchase_orders.filter(status='completed', was_on_time=False).order_by('vendor_id', 'delivery_date', 'id').values(
+                'vendor_id', 'id', 'po_number', 'order_date', 'delivery_date', 'completed_at'
+            ).iterator()
+        )
+
+    # Rollups belong to the month they start in, as in compact_performance_history
+    trends = {}
+    months = HistoricalPerformance.objects.using(using).filter(
+        vendor_id__in=vendor_ids, date__range=(start, end)
+    ).annotate(month=TruncMonth('date')).values('vendor_id', 'month').annotate(
+        completed=Sum('completed_orders'),
+        on_time=weighted_average('on_time_delivery_rate', 'completed_orders'),
+        quality=weighted_average('quality_rating_avg', 'rated_orders'),
+        response=weighted_average('average_response_time', 'acknowledged_orders'),
+    ).order_by('vendor_id', 'month')
+    for row in months:
+        trends.setdefault(row['vendor_id'], []).append({
+            'month': row['month'],
+            'completed_orders': row['completed'],
+            'on_time_delivery_rate': row['on_time'] or 0.0,
+            'quality_rating_avg': row['quality'] or 0.0,
+            'average_response_time': row['response'] or 0.0,
+        })
+
+    late_orders = heapq.merge(
+        *late_order_streams, key=lambda row: (row['vendor_id'], row['delivery_date'], row['id'])
+    )
+    late_by_vendor = groupby(late_orders, key=lambda row: row['vendor_id'])
+    late_vendor_id, late_rows = next(late_by_vendor, (None, iter(())))
+
+    written = 0
+    no_metrics = dict.fromkeys(Vendor.METRIC_FIELDS, 0.0)
+    for vendor in Vendor.objects.using(using).filter(id__in=vendor_ids).order_by('id').values('id', 'name', 'vendor_code'):
+        late = []
+        # Vendors and late orders are both in vendor id order, so walk them together
+        while late_vendor_id is not None and late_vendor_id <= vendor['id']:
+            if late_vendor_id == vendor['id']:
+                late = [{name: value for name, value in row.items() if name not in ('vendor_id', 'id')} for row in late_rows]
+            late_vendor_id, late_rows = next(late_by_vendor, (None, iter(())))
+        vendor_totals = totals.get(vendor['id'])
+        line = {
+            'vendor': vendor,
+            'start': start,
+            'end': end,
+            'total_orders': vendor_totals['orders'] if vendor_totals else 0,
+            'completed_orders': vendor_totals['completed_orders'] if vendor_totals else 0,
+            **(calculate_metrics_from_totals(vendor_totals) if vendor_totals else no_metrics),
+            'trend': trends.get(vendor['id'], []),
+            'late_orders': late,
+        }
+        out.write(json.dumps(line, cls=DjangoJSONEncoder) + '\n')
+        written += 1
+    return written
+
+
+REPORT_WRITERS = {
+    'scorecard': write_scorecards,
+}
+PARAMETER_PARSERS = {
+    'scorecard': parse_scorecard_parameters,
+}
+
+
+def vendor_chunks():
+    """
+    (shard, vendor ids) tasks covering every vendor, `VENDORS_PER_TASK` at a time.
+    """
+    size = get_setting('VENDORS_PER_TASK')
+    for shard in sharding.get_shards():
+        ids = Vendor.objects.using(shard).order_by('id').values_list('id', flat=True).iterator()
+        while chunk := list(islice(ids, size)):
+            yield shard, chunk
+
+
+def write_report(kind, parameters, path, workers=None, progress=None):
+    """
+    Build a report into `path` from chunks of vendors, in a pool of `workers`
+    processes or in this process when `workers` is 0. `progress` is called
+    with the number of vendors of each finished chunk. Returns the number of
+    vendors written.
+    """
+    workers = get_setting('WORKERS') if workers is None else workers
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tasks = [
+        (kind, parameters, shard, vendor_ids, path.with_name(f"{path.name}.part{index}"))
+        for index, (shard, vendor_ids) in enumerate(vendor_chunks())
+    ]
+    written = 0
+    try:
+        if workers:
+            databases = {shard: connections.settings[shard] for shard in sharding.get_shards()}
+            # Forked processes must not inherit open connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(databases,)) as executor:
+                futures = [executor.submit(build_part, *task) for task in tasks]
+                for future in as_completed(futures):
+                    count = future.result()
+                    written += count
+                    if progress:
+                        progress(count)
+        else:
+            for task in tasks:
+                count = build_part(*task)
+                written += count
+                if progress:
+                    progress(count)
+        with open(path, 'wb') as out:
+            for task in tasks:
+                with open(task[-1], 'rb') as part:
+                    shutil.copyfileobj(part, out)
+    finally:
+        for task in tasks:
+            if os.path.exists(task[-1]):
+                os.remove(task[-1])
+    return written
+
+
+def fail_stale_jobs():
+    """
+    Mark failed the jobs claimed more than `CLAIM_TIMEOUT` seconds ago and
+    still running: their worker most likely died mid-build. Returns how many.
+    """
+    now = timezone.now()
+    return ReportJob.objects.filter(
+        status='running', started_at__lt=now - datetime.timedelta(seconds=get_setting('CLAIM_TIMEOUT'))
+    ).update(status='failed', error="The worker stopped before the report was built.", finished_at=now)
+
+
+def claim_next_job():
+    """
+    Mark the oldest pending job running and return it, or None. Workers
+    racing for the same job update it only once. Stale claims are failed
+    first.
+    """
+    fail_stale_jobs()
+    jobs = ReportJob.objects.filter(status='pending').order_by('created_at', 'id')
+    for job in jobs[:10]:
+        now = timezone.now()
+        if ReportJob.objects.filter(pk=job.pk, status='pending').update(status='running', started_at=now):
+            job.status, job.started_at = 'running', now
+            return job
+    return None
+
+
+def run_job(job, workers=None):
+    """
+    Build a claimed job's report and record the outcome on the job.
+    """
+    vendors_total = sum(Vendor.objects.using(shard).count() for shard in sharding.get_shards())
+    ReportJob.objects.filter(pk=job.pk).update(vendors_total=vendors_total)
+    file_name = f"{job.kind}-{job.pk}.ndjson"
+
+    def progress(count):
+        ReportJob.objects.filter(pk=job.pk).update(vendors_done=F('vendors_done') + count)
+
+    # A job failed as stale meanwhile keeps its outcome
+    running = ReportJob.objects.filter(pk=job.pk, status='running')
+    try:
+        write_report(job.kind, job.parameters, report_path(file_name), workers=workers, progress=progress)
+    except Exception as error:
+        running.update(status='failed', error=str(error), finished_at=timezone.now())
+    else:
+        running.update(status='completed', file_name=file_name, finished_at=timezone.now())
+    job.refresh_from_db()
+    return job
@@ -0,0 +1,162 @@
+"""
+Full-text search over vendors and purchase orders.
+
+On SQLite the searchable columns are mirrored into FTS5 tables (created by
+migration ``0008_search_indexes``) and kept in sync by the signal receivers
+in ``views.py``. Every search term is matched as a prefix so that the same
+query serves both ranked search and typeahead. Each vendor shard has its
+own index; searches run on every shard and merge the results by rank.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+
+from . import sharding
+
+VENDOR_INDEX = 'vendor_search'
+PURCHASE_ORDER_INDEX = 'purchase_order_search'
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def fts_enabled(using='default'):
+    """
+    FTS5 indexes are only created on SQLite databases.
+    """
+    return connections[using].vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """
+    Turn free text into an FTS5 MATCH expression where every word is a quoted
+    prefix term, so user input can never be parsed as FTS5 query syntax.
+    """
+    terms = re.findall(r'\w+', text)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def index_vendor(vendor, using='default'):
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {VENDOR_INDEX} WHERE rowid = %s", [vendor.pk])
+        cursor.execute(
+            f"INSERT INTO {VENDOR_INDEX} (rowid, name, vendor_code, address) VALUES (%s, %s, %s, %s)",
+            [vendor.pk, vendor.name, vendor.vendor_code, vendor.address]
+        )
+
+
+def index_vendors(vendors, using='default'):
+    """
+    Index newly inserted vendors, e.g. after a `bulk_create` that sent no signals.
+    """
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {VENDOR_INDEX} (rowid, name, vendor_code, address) VALUES (%s, %s, %s, %s)",
+            [[vendor.pk, vendor.name, vendor.vendor_code, vendor.address] for vendor in vendors]
+        )
+
+
+def remove_vendor(vendor_id, using='default'):
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {VENDOR_INDEX} WHERE rowid = %s", [vendor_id])
+
+
+def index_purchase_order(purchase_order, using='default'):
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {PURCHASE_ORDER_INDEX} WHERE rowid = %s", [purchase_order.pk])
+        cursor.execute(
+            f"INSERT INTO {PURCHASE_ORDER_INDEX} (rowid, po_number, vendor_id) VALUES (%s, %s, %s)",
+            [purchase_order.pk, purchase_order.po_number, purchase_order.vendor_id]
+        )
+
+
+def remove_purchase_order(po_id, using='default'):
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {PURCHASE_ORDER_INDEX} WHERE rowid = %s", [po_id])
+
+
+def remove_purchase_orders(po_ids, using='default'):
+    """
+    Remove many purchase orders at once, e.g. before a delete that sends no signals.
+    """
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {PURCHASE_ORDER_INDEX} WHERE rowid = %s", [[po_id] for po_id in po_ids])
+
+
+def search_vendor_ids(text, limit=DEFAULT_LIMIT, using=None):
+    """
+    Return the ids of the best matching vendors, best match first. Without
+    `using`, every vendor shard is searched and the results merged by rank.
+    """
+    match = build_match_query(text)
+    if not match:
+        return []
+    shards = [using] if using else sharding.get_shards()
+    ranked = [hit for shard in shards for hit in rank_vendors(text, match, limit, shard)]
+    return [pk for _, pk in sorted(ranked)[:limit]]
+
+
+def rank_vendors(text, match, limit, using):
+    """
+    (rank, id) of the best matching vendors on one database, lower ranks first.
+    """
+    if not fts_enabled(using):
+        from .models import Vendor
+        lookup = Q(name__icontains=text) | Q(vendor_code__icontains=text) | Q(address__icontains=text)
+        return [(0, pk) for pk in Vendor.objects.using(using).filter(lookup).values_list('id', flat=True)[:limit]]
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT rank, rowid FROM {VENDOR_INDEX} WHERE {VENDOR_INDEX} MATCH %s ORDER BY rank LIMIT %s",
+            [match, limit]
+        )
+        return cursor.fetchall()
+
+
+def search_purchase_order_ids(text, vendor_id=None, limit=DEFAULT_LIMIT, using=None):
+    """
+    Return the ids of the best matching purchase orders, optionally restricted
+    to a single vendor, in which case only that vendor's shard is searched.
+    """
+    match = build_match_query(text)
+    if not match:
+        return []
+    if using:
+        shards = [using]
+    elif vendor_id is not None:
+        shards = [sharding.shard_for_vendor(vendor_id)]
+    else:
+        shards = sharding.get_shards()
+    ranked = [hit for shard in shards for hit in rank_purchase_orders(text, match, vendor_id, limit, shard)]
+    return [pk for _, pk in sorted(ranked)[:limit]]
+
+
+def rank_purchase_orders(text, match, vendor_id, limit, using):
+    if not fts_enabled(using):
+        from .models import PurchaseOrder
+        purchase_orders = PurchaseOrder.objects.using(using).filter(po_number__icontains=text)
+        if vendor_id is not None:
+            purchase_orders = purchase_orders.filter(vendor_id=vendor_id)
+        return [(0, pk) for pk in purchase_orders.values_list('id', flat=True)[:limit]]
+    sql = f"SELECT rank, rowid FROM {PURCHASE_ORDER_INDEX} WHERE {PURCHASE_ORDER_INDEX} MATCH %s"
+    params = [match]
+    if vendor_id is not None:
+        sql += " AND vendor_id = %s"
+        params.append(vendor_id)
+    sql += " ORDER BY rank LIMIT %s"
+    params.append(limit)
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
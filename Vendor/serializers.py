@@ -1,10 +1,27 @@
 from rest_framework import serializers
-from .models import Vendor, PurchaseOrder, HistoricalPerformance
+from . import reports, sharding
+from .models import Vendor, PurchaseOrder, ArchivedPurchaseOrder, HistoricalPerformance, ReportJob
+from .sketches import TDigest
 
 class VendorSerializer(serializers.ModelSerializer):
+    response_time_percentiles = serializers.SerializerMethodField()
+
     class Meta:
         model = Vendor
-        fields = ['id', 'name', 'contact_details', 'address', 'vendor_code']
+        fields = [
+            'id', 'name', 'contact_details', 'address', 'vendor_code',
+            'on_time_delivery_rate', 'quality_rating_avg', 'average_response_time', 'fulfillment_rate',
+            'response_time_percentiles', 'webhook_url', 'webhook_secret'
+        ]
+        read_only_fields = Vendor.METRIC_FIELDS
+        # Codes are checked on every shard by validate_vendor_code
+        extra_kwargs = {'webhook_secret': {'write_only': True}, 'vendor_code': {'validators': []}}
+
+    def get_response_time_percentiles(self, obj):
+        """
+        p50/p90/p99 acknowledgment latency in hours, estimated from the vendor's digest.
+        """
+        return TDigest.from_dict(obj.response_time_digest).percentiles()
 
     def validate_vendor_code(self, value):
         """
@@ -19,7 +36,7 @@ class VendorSerializer(serializers.ModelSerializer):
             # Skip uniqueness check if the vendor code is not being modified
             return value
 
-        if Vendor.objects.filter(vendor_code=value).exists():
+        if any(Vendor.all_objects.using(shard).filter(vendor_code=value).exists() for shard in sharding.get_shards()):
             raise serializers.ValidationError("Vendor code must be unique.")
         return value
 
@@ -53,22 +70,48 @@ class VendorSerializer(serializers.ModelSerializer):
         instance.contact_details = validated_data.get('contact_details', instance.contact_details)
         instance.address = validated_data.get('address', instance.address)
         instance.vendor_code = validated_data.get('vendor_code', instance.vendor_code)
-        instance.save()
+        instance.webhook_url = validated_data.get('webhook_url', instance.webhook_url)
+        instance.webhook_secret = validated_data.get('webhook_secret', instance.webhook_secret)
+        instance.save_changes()
         return instance
     
+class VendorPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """
+    Looks the vendor up on the shard its id belongs to.
+    """
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().using(sharding.shard_for_vendor(data)).get(pk=data)
+        except Vendor.DoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
 class PurchaseOrderSerializer(serializers.ModelSerializer):
+    vendor = VendorPrimaryKeyField(queryset=Vendor.objects.all())
+
     class Meta:
         model = PurchaseOrder
-        fields = ['id', 'po_number', 'vendor','issue_date', 'order_date', 'delivery_date', 'items', 'quantity', 'status']
+        fields = [
+            'id', 'po_number', 'vendor','issue_date', 'order_date', 'delivery_date', 'items', 'quantity', 'status',
+            'completed_at', 'was_on_time'
+        ]
+        read_only_fields = ['completed_at', 'was_on_time']
+        # Numbers are checked on every shard by validate_po_number
+        extra_kwargs = {'po_number': {'validators': []}}
     
     def validate(self, data):
         """
         Add custom validation for the PurchaseOrder data.
         """
-        # Ensure delivery date is after order date
-        
-        if 'delivery_date' in data and 'order_date' in data:
-            if data['delivery_date'] < data['order_date']:
+        # Ensure delivery date is after order date, taking omitted fields of a partial update from the instance
+        delivery_date = data.get('delivery_date', getattr(self.instance, 'delivery_date', None))
+        order_date = data.get('order_date', getattr(self.instance, 'order_date', None))
+        if delivery_date is not None and order_date is not None:
+            if delivery_date < order_date:
                 raise serializers.ValidationError("Delivery date must be after order date.")
         
         # Check for status transitions that might not be allowed
@@ -76,17 +119,77 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
             if self.instance.status == 'completed' and data['status'] != 'completed':
                 raise serializers.ValidationError("Cannot change status from completed to another status.")
 
+        # The response time of an acknowledged order is already in the vendor's digests
+        if self.instance and self.instance.acknowledgment_date and data.get('issue_date', self.instance.issue_date) != self.instance.issue_date:
+            raise serializers.ValidationError("Cannot change the issue date of an acknowledged purchase order.")
+
         return data
 
+    def update(self, instance, validated_data):
+        """
+        Apply the validated data and write only the fields it changed.
+        """
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save_changes()
+        return instance
+
+    def validate_po_number(self, value):
+        """
+        Check that the PO number is unique across all shards, archived orders included.
+        """
+        if self.instance and self.instance.po_number == value:
+            return value
+        if any(
+            model.objects.using(shard).filter(po_number=value).exists()
+            for shard in sharding.get_shards() for model in (PurchaseOrder, ArchivedPurchaseOrder)
+        ):
+            raise serializers.ValidationError("purchase order with this po number already exists.")
+        return value
+
     def validate_vendor(self, value):
         """
         Validate that the vendor ID exists.
         """
-        if not Vendor.objects.filter(id=value.id).exists():
+        if not Vendor.objects.using(value._state.db).filter(id=value.id).exists():
             raise serializers.ValidationError("Vendor with this ID does not exist.")
+        if self.instance and value._state.db != self.instance._state.db:
+            raise serializers.ValidationError("Purchase orders cannot be moved to a vendor on another shard.")
         return value
 
+class ArchivedPurchaseOrderSerializer(serializers.ModelSerializer):
+    """
+    Read-only representation of an archived purchase order, the fields of
+    `PurchaseOrderSerializer` plus `archived_at`.
+    """
+    class Meta:
+        model = ArchivedPurchaseOrder
+        fields = PurchaseOrderSerializer.Meta.fields + ['archived_at']
+        read_only_fields = fields
+
 class HistoricalPerformanceSerializer(serializers.ModelSerializer):
     class Meta:
         model = HistoricalPerformance
-        fields = '__all__'
\ No newline at end of file
+        exclude = ['response_time_digest']
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'kind', 'parameters', 'status', 'vendors_total', 'vendors_done',
+            'error', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = [
+            'status', 'vendors_total', 'vendors_done', 'error', 'created_at', 'started_at', 'finished_at'
+        ]
+        extra_kwargs = {'parameters': {'required': False}}
+
+    def validate(self, attrs):
+        """
+        Check the parameters of the report kind and fill in their defaults.
+        """
+        try:
+            attrs['parameters'] = reports.PARAMETER_PARSERS[attrs['kind']](attrs.get('parameters') or {})
+        except (AttributeError, ValueError) as error:
+            raise serializers.ValidationError({'parameters': str(error)})
+        return attrs
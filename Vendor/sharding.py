@@ -0,0 +1,208 @@
+"""
+Sharding of vendor data across several databases by vendor.
+
+`settings.VENDOR_SHARDS` lists the database aliases that hold the tables of
+this app. A vendor and everything that belongs to it (purchase orders,
+performance records, change log entries and webhook events) live on the
+same shard, so per-vendor writes and the metric signals only ever take that
+shard's write lock.
+
+New vendors are placed on the shard picked by a stable hash of their vendor
+code. Every shard hands out primary keys from its own range, starting at
+`shard index << SHARD_ID_BITS`, so the id of a vendor or purchase order is
+enough to find its shard without a lookup table.
+
+Queries that are not about one vendor fan out to every shard, one after the
+other, and the caller merges the results. Filters on one vendor or one
+primary key without `using()`, e.g. `filter(vendor=vendor)`, go to that
+shard by themselves. With a single shard (the default) all helpers return
+`default` and nothing is merged.
+"""
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, models
+
+APP_LABEL = 'Vendor'
+# Room for 2**40 rows of each table per shard
+SHARD_ID_BITS = 40
+
+
+def get_shards():
+    return list(getattr(settings, 'VENDOR_SHARDS', None) or ['default'])
+
+
+def is_sharded():
+    return len(get_shards()) > 1
+
+
+def shard_for_id(pk):
+    """
+    The shard holding the row with this primary key, for any model of the app.
+    Ids outside every shard's range map to the first shard, where they are not found.
+    """
+    shards = get_shards()
+    index = int(pk) >> SHARD_ID_BITS
+    return shards[index] if 0 <= index < len(shards) else shards[0]
+
+
+def shard_for_vendor(vendor_id):
+    return shard_for_id(vendor_id)
+
+
+def shard_for_vendor_code(vendor_code):
+    """
+    The shard a new vendor with this code is created on.
+    """
+    shards = get_shards()
+    return shards[zlib.crc32(vendor_code.encode()) % len(shards)]
+
+
+def group_by_shard(ids):
+    """
+    Split primary keys into {shard: [ids]}.
+    """
+    groups = {}
+    for pk in ids:
+        groups.setdefault(shard_for_id(pk), []).append(pk)
+    return groups
+
+
+def in_bulk(queryset, ids):
+    """
+    `QuerySet.in_bulk()` for ids that may live on different shards.
+    """
+    found = {}
+    for shard, shard_ids in group_by_shard(ids).items():
+        found.update(queryset.using(shard).in_bulk(shard_ids))
+    return found
+
+
+def shard_for_lookups(lookups):
+    """
+    The shard an exact `vendor` or primary key lookup points to, or None.
+    """
+    for name in ('vendor', 'vendor_id', 'pk', 'id'):
+        value = lookups.get(name)
+        if isinstance(value, models.Model):
+            return value._state.db or (shard_for_id(value.pk) if value.pk is not None else None)
+        if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+            return shard_for_id(value)
+    return None
+
+
+def merge_ordered(querysets):
+    """
+    Merge per-shard querysets that share one ordering into a single list.
+    A lone queryset is returned unchanged.
+    """
+    if len(querysets) == 1:
+        return querysets[0]
+    ordering = [*querysets[0].query.order_by, 'pk'] if querysets[0].query.order_by else ['pk']
+    rows = [obj for queryset in querysets for obj in queryset]
+    # Stable sorts from the last key to the first give the combined ordering
+    for field in reversed(ordering):
+        name = field.lstrip('-')
+        rows.sort(key=lambda obj: getattr(obj, name), reverse=field.startswith('-'))
+    return rows
+
+
+class ShardedQuerySet(models.QuerySet):
+
+    def for_lookups(self, lookups):
+        """
+        Without an explicit `using()`, this queryset on the shard `lookups`
+        point to, if they point to one.
+        """
+        shard = shard_for_lookups(lookups) if self._db is None else None
+        return self if shard is None else self.using(shard)
+
+    def filter(self, *args, **kwargs):
+        return super(ShardedQuerySet, self.for_lookups(kwargs)).filter(*args, **kwargs)
+
+    def get_or_create(self, defaults=None, **kwargs):
+        return super(ShardedQuerySet, self.for_lookups(kwargs)).get_or_create(defaults, **kwargs)
+
+    def update_or_create(self, defaults=None, create_defaults=None, **kwargs):
+        return super(ShardedQuerySet, self.for_lookups(kwargs)).update_or_create(defaults, create_defaults, **kwargs)
+
+    def create(self, **kwargs):
+        """
+        Without an explicit `using()`, let the router place the new row from
+        the instance (its vendor) instead of the default database.
+        """
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+class VendorShardRouter:
+    """
+    Routes this app's models to the shard of their vendor.
+    """
+
+    def shard_for_instance(self, instance):
+        if instance._state.db is not None:
+            return instance._state.db
+        if instance.pk is not None:
+            return shard_for_id(instance.pk)
+        if getattr(instance, 'vendor_code', None):
+            return shard_for_vendor_code(instance.vendor_code)
+        if getattr(instance, 'vendor_id', None) is not None:
+            return shard_for_vendor(instance.vendor_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        instance = hints.get('instance')
+        # Related managers pass the instance they belong to, e.g. the vendor of `vendor.purchase_orders`
+        if instance is not None and instance._meta.app_label == APP_LABEL:
+            shard = self.shard_for_instance(instance)
+            if shard is not None:
+                return shard
+        return get_shards()[0]
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if APP_LABEL in (obj1._meta.app_label, obj2._meta.app_label):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        shards = get_shards()
+        if app_label == APP_LABEL:
+            return db in shards
+        # Shards other than default only hold vendor data
+        if db in shards and db != 'default':
+            return False
+        return None
+
+
+def reserve_id_ranges(using='default', **kwargs):
+    """
+    `post_migrate` receiver that starts every table of the app on a shard at
+    that shard's id range. Runs again harmlessly on every migrate.
+    """
+    shards = get_shards()
+    if using not in shards or shards.index(using) == 0:
+        return
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        raise ImproperlyConfigured("Vendor shards other than the first must be SQLite databases.")
+    from django.apps import apps
+
+    start = shards.index(using) << SHARD_ID_BITS
+    with connection.cursor() as cursor:
+        for model in apps.get_app_config(APP_LABEL).get_models():
+            table = model._meta.db_table
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start])
+            elif row[0] < start:
+                cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s", [start, table])
@@ -0,0 +1,142 @@
+"""
+Compact, mergeable quantile sketches.
+
+`TDigest` is a merging t-digest: values are clustered into roughly
+`compression` weighted centroids, small near the tails and larger around
+the median, so extreme quantiles stay accurate. Digests serialise to plain
+dicts for JSON fields, and two digests merge into one that summarises both
+inputs, which lets per-day digests be combined for any date range.
+"""
+import bisect
+import math
+
+DEFAULT_COMPRESSION = 100
+PERCENTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99))
+
+
+class TDigest:
+
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.centroids = []
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._buffer = []
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuild a digest from `to_dict()` output. Empty or missing data gives an empty digest.
+        """
+        digest = cls(compression=(data or {}).get('compression', DEFAULT_COMPRESSION))
+        if data and data.get('centroids'):
+            digest.centroids = [[mean, count] for mean, count in data['centroids']]
+            digest.count = sum(count for _, count in digest.centroids)
+            digest.min = data['min']
+            digest.max = data['max']
+        return digest
+
+    def to_dict(self):
+        self._compress()
+        return {
+            'compression': self.compression,
+            'centroids': [[round(mean, 6), count] for mean, count in self.centroids],
+            'min': self.min,
+            'max': self.max,
+        }
+
+    def add(self, value, count=1):
+        self._buffer.append([value, count])
+        self.count += count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self._buffer) > self.compression * 5:
+            self._compress()
+
+    def merge(self, other):
+        """
+        Fold another digest into this one.
+        """
+        if not other.count:
+            return self
+        other._compress()
+        self._buffer.extend([mean, count] for mean, count in other.centroids)
+        self.count += other.count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        items = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = self.count
+        merged = [list(items[0])]
+        cumulative = 0
+        k_left = self._scale(0)
+        for mean, count in items[1:]:
+            current = merged[-1]
+            proposed = current[1] + count
+            # A centroid may span at most one unit of the k1 scale function
+            if self._scale((cumulative + proposed) / total) - k_left <= 1:
+                current[0] += (mean - current[0]) * count / proposed
+                current[1] = proposed
+            else:
+                cumulative += current[1]
+                k_left = self._scale(cumulative / total)
+                merged.append([mean, count])
+        self.centroids = merged
+
+    def _scale(self, q):
+        """
+        The k1 scale function, steep near 0 and 1 so tail centroids stay small.
+        """
+        return self.compression / (2 * math.pi) * math.asin(2 * min(q, 1.0) - 1)
+
+    def quantile(self, q):
+        """
+        Estimate the value at quantile `q` (0 to 1), or None for an empty digest.
+        """
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        target = q * self.count
+        # Each centroid's weight is centred on its mean
+        centres = []
+        cumulative = 0
+        for _, count in self.centroids:
+            centres.append(cumulative + count / 2)
+            cumulative += count
+        if target <= centres[0]:
+            return self._interpolate(target, 0, self.min, centres[0], self.centroids[0][0])
+        if target >= centres[-1]:
+            return self._interpolate(target, centres[-1], self.centroids[-1][0], self.count, self.max)
+        i = bisect.bisect_right(centres, target)
+        return self._interpolate(target, centres[i - 1], self.centroids[i - 1][0], centres[i], self.centroids[i][0])
+
+    @staticmethod
+    def _interpolate(x, x0, y0, x1, y1):
+        if x1 == x0:
+            return y0
+        return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+    def percentiles(self):
+        """
+        The p50, p90 and p99 estimates exposed by the API.
+        """
+        return {name: self.quantile(q) for name, q in PERCENTILES}
+
+
+def merge_digests(digests):
+    """
+    Merge serialised digests (e.g. one per day) into a single `TDigest`.
+    """
+    merged = TDigest()
+    for data in digests:
+        merged.merge(TDigest.from_dict(data))
+    return merged
@@ -1,13 +1,76 @@
 from django.urls import reverse
 from django.contrib.auth.models import User
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework.authtoken.models import Token
-from .models import Vendor, PurchaseOrder, HistoricalPerformance
+from .models import (
+    Vendor, PurchaseOrder, ArchivedPurchaseOrder, VendorArchiveTotals, HistoricalPerformance, ChangeLogEntry, WebhookEvent,
+    ReportJob,
+)
+from . import admin, analytics, capture, coalescing, importers, reports, search, sharding, views, webhooks
+from .serializers import VendorSerializer, PurchaseOrderSerializer
+from .sketches import TDigest, merge_digests
+from .throttling import TokenBucketThrottle
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import tempfile
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
 import datetime
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.conf import settings
+from django.test import LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, connections
 from django.utils import timezone
+from django.db.models import Max
+from django.http import HttpResponse
+
+
+def on_every_shard(queryset):
+    """
+    The rows of `queryset` from every vendor shard, merged in its ordering.
+    """
+    return list(sharding.merge_ordered([queryset.using(shard) for shard in sharding.get_shards()]))
+
+
+def count_on_every_shard(queryset):
+    return sum(queryset.using(shard).count() for shard in sharding.get_shards())
+
+
+class CaptureShardQueries:
+    """
+    `CaptureQueriesContext` over every vendor shard, `default` among them.
+    Its length is the number of queries run on all of them.
+    """
+
+    def __enter__(self):
+        self.contexts = [CaptureQueriesContext(connections[shard]) for shard in sharding.get_shards()]
+        for context in self.contexts:
+            context.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        for context in self.contexts:
+            context.__exit__(*exc_info)
+
+    def __len__(self):
+        return sum(len(context) for context in self.contexts)
+
 
 class AuthenticationTestCase(APITestCase):
+    databases = '__all__'
 
     def setUp(self):
         # Create a test user
@@ -60,6 +123,7 @@ class AuthenticationTestCase(APITestCase):
         
         
 class VendorListCreateAPITests(APITestCase):
+    databases = '__all__'
 
     def setUp(self):
         # Create a user and set up token authentication
@@ -94,8 +158,9 @@ class VendorListCreateAPITests(APITestCase):
         }
         response = self.client.post(self.url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(Vendor.objects.count(), 3)  # Including the initially created vendors
-        self.assertEqual(Vendor.objects.get(name='Vendor C').contact_details, '12345678901')
+        self.assertEqual(count_on_every_shard(Vendor.objects), 3)  # Including the initially created vendors
+        [vendor] = on_every_shard(Vendor.objects.filter(name='Vendor C'))
+        self.assertEqual(vendor.contact_details, '12345678901')
 
     def test_create_vendor_invalid_data(self):
         """
@@ -119,6 +184,8 @@ class VendorListCreateAPITests(APITestCase):
         
         
 class PurchaseOrderTests(APITestCase):
+    databases = '__all__'
+
     def setUp(self):
         # Create a user and token for authentication
         self.user = User.objects.create_user(username='testuser', password='testpass')
@@ -154,7 +221,7 @@ class PurchaseOrderTests(APITestCase):
         }
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(Vendor.objects.count(), 2)
+        self.assertEqual(count_on_every_shard(Vendor.objects), 2)
     def test_list_purchase_orders(self):
         url = reverse('purchase-orders-list-create')
         response = self.client.get(url)
@@ -173,7 +240,7 @@ class PurchaseOrderTests(APITestCase):
         }
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(PurchaseOrder.objects.count(), 2)
+        self.assertEqual(count_on_every_shard(PurchaseOrder.objects), 2)
 
     def test_retrieve_purchase_order(self):
         url = reverse('purchase-order-detail', kwargs={'po_id': self.purchase_order.id})
@@ -204,6 +271,8 @@ class PurchaseOrderTests(APITestCase):
 
 
 class VendorPurchaseOrderPerformanceTests(APITestCase):
+    databases = '__all__'
+
     def setUp(self):
         # User setup
         self.user = User.objects.create_user(username='testuser', password='testpass')
@@ -266,3 +335,2167 @@ class VendorPurchaseOrderPerformanceTests(APITestCase):
         # Check if fulfillment rate changes as expected based on completion status
         expected_fulfillment_rate = (1 / 1) * 100  # Assuming this PO is the only one considered
         self.assertEqual(self.historical_performance.fulfillment_rate, expected_fulfillment_rate)
+
+
+class SearchAPITests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+        self.acme = Vendor.objects.create(name="Acme Supplies", contact_details="Contact Acme", address="12 Harbour Road, Mumbai", vendor_code="ACM001")
+        self.globex = Vendor.objects.create(name="Globex Industrial", contact_details="Contact Globex", address="7 Acme Street, Pune", vendor_code="GLX002")
+        self.purchase_order = PurchaseOrder.objects.create(
+            vendor=self.acme,
+            po_number="PO-2024-0042",
+            order_date=timezone.now(),
+            delivery_date=timezone.now() + timezone.timedelta(days=5),
+            items='{"item": "widget"}',
+            quantity=5,
+        )
+
+    def test_vendor_search_ranks_name_matches_first(self):
+        response = self.client.get(reverse('vendor-search'), {'q': 'acme'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([vendor['id'] for vendor in response.data], [self.acme.id, self.globex.id])
+
+    def test_vendor_search_matches_prefixes(self):
+        response = self.client.get(reverse('vendor-search'), {'q': 'glo ind'})
+        self.assertEqual([vendor['id'] for vendor in response.data], [self.globex.id])
+
+    def test_vendor_search_follows_updates_and_deletes(self):
+        self.globex.name = "Initech"
+        self.globex.save()
+        response = self.client.get(reverse('vendor-search'), {'q': 'initech'})
+        self.assertEqual([vendor['id'] for vendor in response.data], [self.globex.id])
+
+        self.globex.delete()
+        response = self.client.get(reverse('vendor-search'), {'q': 'initech'})
+        self.assertEqual(response.data, [])
+
+    def test_search_requires_query(self):
+        response = self.client.get(reverse('vendor-search'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('vendor-search'), {'q': 'acme', 'limit': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_syntax_is_not_interpreted(self):
+        response = self.client.get(reverse('vendor-search'), {'q': 'acme" OR NEAR('})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_purchase_order_search(self):
+        url = reverse('purchase-order-search')
+        response = self.client.get(url, {'q': 'PO-2024-00'})
+        self.assertEqual([po['id'] for po in response.data], [self.purchase_order.id])
+
+        response = self.client.get(url, {'q': '0042', 'vendor_id': self.globex.id})
+        self.assertEqual(response.data, [])
+
+        self.purchase_order.delete()
+        response = self.client.get(url, {'q': '0042'})
+        self.assertEqual(response.data, [])
+
+
+class VendorMetricFilterTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.url = reverse('vendor-list-create')
+
+        self.fast = Vendor.objects.create(
+            name="Fast", contact_details="Contact Fast", address="Address Fast", vendor_code="FAST1",
+            on_time_delivery_rate=70.0, quality_rating_avg=4.5, average_response_time=2.0, fulfillment_rate=90.0
+        )
+        self.slow = Vendor.objects.create(
+            name="Slow", contact_details="Contact Slow", address="Address Slow", vendor_code="SLOW1",
+            on_time_delivery_rate=60.0, quality_rating_avg=4.0, average_response_time=9.0, fulfillment_rate=50.0
+        )
+        self.reliable = Vendor.objects.create(
+            name="Reliable", contact_details="Contact Reliable", address="Address Reliable", vendor_code="REL1",
+            on_time_delivery_rate=99.0, quality_rating_avg=4.8, average_response_time=1.0, fulfillment_rate=100.0
+        )
+
+    def test_filter_by_metric_ranges_and_order(self):
+        response = self.client.get(self.url, {
+            'on_time_delivery_rate__lt': 80,
+            'quality_rating_avg__gte': 4,
+            'ordering': '-average_response_time',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([vendor['id'] for vendor in response.data], [self.slow.id, self.fast.id])
+
+    def test_metric_fields_are_listed_read_only(self):
+        response = self.client.get(self.url, {'ordering': 'fulfillment_rate'})
+        self.assertEqual(response.data[0]['fulfillment_rate'], 50.0)
+
+        url = reverse('vendor-detail', kwargs={'vendor_id': self.fast.id})
+        data = {
+            'name': 'Fast', 'contact_details': 'Contact Fast', 'address': 'Address Fast',
+            'vendor_code': 'FAST1', 'on_time_delivery_rate': 100.0
+        }
+        response = self.client.put(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.fast.refresh_from_db()
+        self.assertEqual(self.fast.on_time_delivery_rate, 70.0)
+
+    def test_invalid_filters_are_rejected(self):
+        for params in ({'quality_rating_avg__in': '1,2'}, {'fulfillment_rate__gt': 'high'}, {'ordering': 'contact_details'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecomputeVendorMetricsCommandTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.vendor = Vendor.objects.create(name="Vendor1", contact_details="Details", address="Address", vendor_code="V100")
+        self.idle_vendor = Vendor.objects.create(name="Vendor2", contact_details="Details", address="Address", vendor_code="V200")
+        now = timezone.now()
+        for i, (order_status, rating) in enumerate([('completed', 4.0), ('completed', 5.0), ('pending', None), ('canceled', None)]):
+            PurchaseOrder.objects.create(
+                vendor=self.vendor,
+                po_number=f"PO{i}",
+                order_date=now,
+                delivery_date=now + timezone.timedelta(days=1),
+                issue_date=now - timezone.timedelta(hours=4),
+                acknowledgment_date=now - timezone.timedelta(hours=2 * i),
+                items='{"item": "widget"}',
+                quantity=1,
+                status=order_status,
+                quality_rating=rating,
+            )
+
+    def test_bulk_calculation_matches_signal_metrics(self):
+        self.vendor.refresh_from_db()
+        metrics = views.calculate_vendor_metrics_bulk()
+        self.assertNotIn(self.idle_vendor.id, metrics)
+        for field, value in metrics[self.vendor.id].items():
+            self.assertAlmostEqual(getattr(self.vendor, field), value)
+
+    def test_dry_run_reports_drift_without_writing(self):
+        self.vendor.purchase_orders.filter(status='canceled').delete()
+        out = StringIO()
+        call_command('recompute_vendor_metrics', '--dry-run', stdout=out)
+        self.assertIn('fulfillment_rate 50.0000 -> 66.6667 (+16.6667)', out.getvalue())
+        self.assertIn('1 of 2 vendors have drifted metrics.', out.getvalue())
+        self.vendor.refresh_from_db()
+        self.assertEqual(self.vendor.fulfillment_rate, 50.0)
+
+    def test_repairs_drifted_metrics(self):
+        self.vendor.purchase_orders.filter(status='canceled').delete()
+        Vendor.objects.filter(pk=self.idle_vendor.pk).update(quality_rating_avg=3.0)
+        call_command('recompute_vendor_metrics', '--batch-size', '1', stdout=StringIO())
+        self.vendor.refresh_from_db()
+        self.idle_vendor.refresh_from_db()
+        self.assertAlmostEqual(self.vendor.fulfillment_rate, 200 / 3)
+        self.assertEqual(self.idle_vendor.quality_rating_avg, 0.0)
+
+
+class DeferVendorMetricsTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.vendor = Vendor.objects.create(name="Vendor1", contact_details="Details", address="Address", vendor_code="V100")
+        # On the same shard, so orders can move between the two
+        self.other_vendor = Vendor.objects.using(self.vendor._state.db).create(
+            name="Vendor2", contact_details="Details", address="Address", vendor_code="V200"
+        )
+
+    def create_orders(self, vendor, count, prefix):
+        now = timezone.now()
+        return [
+            PurchaseOrder.objects.create(
+                vendor=vendor, po_number=f"{prefix}{i}", order_date=now, delivery_date=now + timezone.timedelta(days=1),
+                issue_date=now - timezone.timedelta(hours=i + 1), acknowledgment_date=now, items={"item": "widget"},
+                quantity=1, status='completed' if i % 2 else 'pending', quality_rating=4.0 if i % 2 else None,
+            )
+            for i in range(count)
+        ]
+
+    def test_metrics_are_recalculated_once_when_the_outermost_block_exits(self):
+        with mock.patch.object(views, 'refresh_vendor_metrics', wraps=views.refresh_vendor_metrics) as refresh:
+            with views.defer_vendor_metrics():
+                self.create_orders(self.vendor, 10, "A")
+                with views.defer_vendor_metrics():
+                    self.create_orders(self.other_vendor, 4, "B")
+                self.assertEqual(refresh.call_count, 0)
+                self.vendor.refresh_from_db()
+                self.assertEqual(self.vendor.fulfillment_rate, 0.0)
+            refresh.assert_called_once_with({self.vendor.id, self.other_vendor.id})
+
+        metrics = views.calculate_vendor_metrics_bulk()
+        for vendor in (self.vendor, self.other_vendor):
+            vendor.refresh_from_db()
+            for field, value in metrics[vendor.id].items():
+                self.assertAlmostEqual(getattr(vendor, field), value)
+        self.assertEqual(self.vendor.fulfillment_rate, 50.0)
+        performance = HistoricalPerformance.objects.get(vendor=self.vendor, date=timezone.localdate())
+        self.assertEqual(performance.completed_orders, 5)
+
+    def test_decorator_and_moved_orders(self):
+        purchase_orders = self.create_orders(self.vendor, 4, "A")
+
+        @views.defer_vendor_metrics
+        def move(orders):
+            for purchase_order in orders:
+                purchase_order.vendor = self.other_vendor
+                purchase_order.save()
+
+        with CaptureShardQueries() as deferred:
+            move(purchase_orders[:2])
+        self.vendor.refresh_from_db()
+        self.other_vendor.refresh_from_db()
+        self.assertEqual((self.vendor.fulfillment_rate, self.other_vendor.fulfillment_rate), (50.0, 50.0))
+
+        with CaptureShardQueries() as immediate:
+            for purchase_order in purchase_orders[2:]:
+                purchase_order.vendor = self.other_vendor
+                purchase_order.save()
+        self.assertLess(len(deferred), len(immediate))
+
+    def test_metrics_are_refreshed_after_an_error(self):
+        with self.assertRaises(ValueError):
+            with views.defer_vendor_metrics():
+                self.create_orders(self.vendor, 2, "A")
+                raise ValueError()
+        self.vendor.refresh_from_db()
+        self.assertEqual(self.vendor.fulfillment_rate, 50.0)
+        # Saves outside the block update metrics right away again
+        self.create_orders(self.other_vendor, 2, "B")
+        self.other_vendor.refresh_from_db()
+        self.assertEqual(self.other_vendor.fulfillment_rate, 50.0)
+
+
+class VendorOverviewAPITests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+        self.vendor = Vendor.objects.create(name="Vendor1", contact_details="Details", address="Address", vendor_code="V100")
+        self.other_vendor = Vendor.objects.create(name="Vendor2", contact_details="Details", address="Address", vendor_code="V200")
+        now = timezone.now()
+        statuses = ['completed', 'pending', 'canceled']
+        for i in range(12):
+            PurchaseOrder.objects.create(
+                vendor=self.vendor,
+                po_number=f"PO{i}",
+                order_date=now - timezone.timedelta(days=i),
+                delivery_date=now + timezone.timedelta(days=1),
+                items='{"item": "widget"}',
+                quantity=1,
+                status=statuses[i % 3],
+            )
+        for i in range(5):
+            HistoricalPerformance.objects.update_or_create(
+                vendor=self.vendor, date=timezone.localdate() - timezone.timedelta(days=i)
+            )
+        self.url = reverse('vendor-overview', kwargs={'vendor_id': self.vendor.id})
+
+    def test_overview_contents(self):
+        response = self.client.get(self.url, {'orders': 3, 'history': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['vendor']['vendor_code'], 'V100')
+        self.assertEqual([po['po_number'] for po in response.data['recent_purchase_orders']], ['PO0', 'PO1', 'PO2'])
+        self.assertEqual(response.data['purchase_order_counts'], {
+            'total': 12, 'pending': 4, 'completed': 4, 'canceled': 4, 'awaiting_acknowledgment': 4
+        })
+        self.assertEqual(
+            [row['date'] for row in response.data['performance_history']],
+            [str(timezone.localdate()), str(timezone.localdate() - timezone.timedelta(days=1))]
+        )
+
+    def test_query_count_does_not_depend_on_vendor_size(self):
+        # Token lookup, vendor, two prefetches and the status aggregate
+        with CaptureShardQueries() as queries:
+            self.client.get(self.url, {'orders': 100})
+        self.assertEqual(len(queries), 5)
+        with CaptureShardQueries() as queries:
+            self.client.get(reverse('vendor-overview', kwargs={'vendor_id': self.other_vendor.id}))
+        self.assertEqual(len(queries), 5)
+
+    def test_invalid_parameters_and_unknown_vendor(self):
+        response = self.client.get(self.url, {'orders': 1000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('vendor-overview', kwargs={'vendor_id': 9999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class DashboardSummaryAPITests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.url = reverse('dashboard-summary')
+
+        self.vendor = Vendor.objects.create(name="Vendor1", contact_details="Details", address="Address", vendor_code="V100")
+        now = timezone.now()
+        for i, order_status in enumerate(['pending', 'pending', 'completed']):
+            PurchaseOrder.objects.create(
+                vendor=self.vendor,
+                po_number=f"PO{i}",
+                order_date=now - timezone.timedelta(days=10),
+                delivery_date=now + timezone.timedelta(days=1 - 2 * i),
+                items='{"item": "widget"}',
+                quantity=1,
+                status=order_status,
+            )
+
+    def test_summary_figures(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['purchase_orders'], {'total': 3, 'pending': 2, 'completed': 1, 'canceled': 0})
+        self.assertEqual(response.data['pending_acknowledgements'], 2)
+        self.assertEqual(response.data['overdue_deliveries'], 1)
+        self.assertEqual(response.data['vendors']['total'], 1)
+        self.assertAlmostEqual(response.data['vendors']['fulfillment_rate_avg'], 100 / 3)
+
+    def test_summary_is_cached_until_purchase_orders_change(self):
+        self.client.get(self.url)
+        with CaptureShardQueries() as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(len(queries), 1)  # Token lookup only
+        self.assertEqual(response.data['purchase_orders']['total'], 3)
+
+        self.vendor.purchase_orders.get(po_number='PO0').delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['purchase_orders']['total'], 2)
+
+    def test_metric_only_vendor_saves_keep_the_summary(self):
+        self.client.get(self.url)
+        self.vendor.fulfillment_rate = 50.0
+        self.vendor.save(update_fields=['fulfillment_rate'])
+        with CaptureShardQueries() as queries:
+            self.client.get(self.url)
+        self.assertEqual(len(queries), 1)  # Token lookup only
+
+    def test_stale_summary_is_served_while_another_request_recalculates(self):
+        self.client.get(self.url)
+        self.vendor.purchase_orders.get(po_number='PO0').delete()
+        # Another request holds the recalculation lock
+        self.assertTrue(cache.add(views.DASHBOARD_SUMMARY_LOCK_KEY, True))
+        with CaptureShardQueries() as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.data['purchase_orders']['total'], 3)
+
+        cache.delete(views.DASHBOARD_SUMMARY_LOCK_KEY)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['purchase_orders']['total'], 2)
+        self.assertIsNone(cache.get(views.DASHBOARD_SUMMARY_LOCK_KEY))
+
+
+class TDigestTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        generator = random.Random(42)
+        self.values = [generator.expovariate(1 / 5) for _ in range(20000)]
+        self.sorted_values = sorted(self.values)
+
+    def exact(self, q):
+        return self.sorted_values[int(q * len(self.sorted_values))]
+
+    def test_quantile_estimates(self):
+        digest = TDigest()
+        for value in self.values:
+            digest.add(value)
+        for q in (0.5, 0.9, 0.99):
+            self.assertAlmostEqual(digest.quantile(q), self.exact(q), delta=self.exact(q) * 0.02)
+        self.assertLess(len(digest.to_dict()['centroids']), 200)
+
+    def test_merged_digests_match_single_digest(self):
+        parts = [TDigest() for _ in range(4)]
+        for i, value in enumerate(self.values):
+            parts[i % 4].add(value)
+        merged = merge_digests([part.to_dict() for part in parts])
+        self.assertEqual(merged.count, len(self.values))
+        self.assertEqual(merged.max, self.sorted_values[-1])
+        for q in (0.5, 0.9, 0.99):
+            self.assertAlmostEqual(merged.quantile(q), self.exact(q), delta=self.exact(q) * 0.02)
+
+    def test_empty_digest(self):
+        self.assertEqual(TDigest.from_dict({}).percentiles(), {'p50': None, 'p90': None, 'p99': None})
+
+
+class ResponseTimePercentileTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+        self.vendor = Vendor.objects.create(name="Vendor1", contact_details="Details", address="Address", vendor_code="V100")
+        now = timezone.now()
+        self.purchase_orders = [
+            PurchaseOrder.objects.create(
+                vendor=self.vendor,
+                po_number=f"PO{hours}",
+                order_date=now,
+                delivery_date=now + timezone.timedelta(days=1),
+                issue_date=now - timezone.timedelta(hours=hours),
+                items='{"item": "widget"}',
+                quantity=1,
+            )
+            for hours in (1, 2, 3, 200)
+        ]
+
+    def acknowledge_all(self):
+        for po in self.purchase_orders:
+            response = self.client.post(reverse('purchase-order-acknowledge', kwargs={'po_id': po.id}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_acknowledgments_update_vendor_percentiles(self):
+        self.acknowledge_all()
+        response = self.client.get(reverse('vendor-detail', kwargs={'vendor_id': self.vendor.id}))
+        percentiles = response.data['response_time_percentiles']
+        self.assertAlmostEqual(percentiles['p50'], 2.5, delta=0.1)
+        self.assertGreater(percentiles['p99'], 100)
+        # The mean is dominated by the single late acknowledgment
+        self.assertGreater(response.data['average_response_time'], 50)
+
+    def test_performance_percentiles_for_today_and_ranges(self):
+        self.acknowledge_all()
+        url = reverse('vendor-performance', kwargs={'vendor_id': self.vendor.id})
+        response = self.client.get(url)
+        self.assertAlmostEqual(response.data['response_time_percentiles']['p50'], 2.5, delta=0.1)
+
+        yesterday = timezone.localdate() - timezone.timedelta(days=1)
+        earlier = TDigest()
+        earlier.add(10.0)
+        HistoricalPerformance.objects.create(vendor=self.vendor, date=yesterday, response_time_digest=earlier.to_dict())
+        response = self.client.get(url, {'start': str(yesterday), 'end': str(timezone.localdate())})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['acknowledged_orders'], 5)
+        self.assertAlmostEqual(response.data['response_time_percentiles']['p50'], 3.0, delta=0.1)
+
+        response = self.client.get(url, {'start': str(yesterday), 'end': str(yesterday)})
+        self.assertEqual(response.data['acknowledged_orders'], 1)
+
+        response = self.client.get(url, {'start': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_acknowledgments_saved_elsewhere_reach_the_digests(self):
+        purchase_order = self.purchase_orders[0]
+        purchase_order.acknowledgment_date = timezone.now()
+        purchase_order.save()
+        # Later saves of the acknowledged order add nothing
+        purchase_order.quantity = 2
+        purchase_order.save()
+        PurchaseOrder.objects.create(
+            vendor=self.vendor, po_number="PO-acknowledged", order_date=timezone.now(),
+            delivery_date=timezone.now() + timezone.timedelta(days=1), issue_date=timezone.now() - timezone.timedelta(hours=5),
+            acknowledgment_date=timezone.now(), items={"item": "widget"}, quantity=1,
+        )
+        self.vendor.refresh_from_db()
+        self.assertEqual(TDigest.from_dict(self.vendor.response_time_digest).count, 2)
+        today = HistoricalPerformance.objects.get(vendor=self.vendor, date=timezone.localdate())
+        self.assertEqual(TDigest.from_dict(today.response_time_digest).count, 2)
+
+        # Its response time is recorded, so the issue date stays as it was
+        response = self.client.patch(
+            reverse('purchase-order-detail', kwargs={'po_id': purchase_order.id}),
+            {'issue_date': timezone.now() - timezone.timedelta(hours=9)}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ChangeFeedAPITests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.url = reverse('change-feed')
+        self.start = str(ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first() or 0)
+
+        self.vendor = Vendor.objects.create(name="Vendor1", contact_details="Details", address="Address", vendor_code="V100")
+        self.purchase_order = PurchaseOrder.objects.create(
+            vendor=self.vendor,
+            po_number="PO1",
+            order_date=timezone.now(),
+            delivery_date=timezone.now() + timezone.timedelta(days=1),
+            items='{"item": "widget"}',
+            quantity=1,
+        )
+
+    def test_changes_are_collapsed_per_object(self):
+        response = self.client.get(self.url, {'since': self.start})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        changes = {(change['model'], change['object_id']): change for change in response.data['results']}
+        self.assertEqual(changes[('vendor', self.vendor.id)]['action'], 'create')
+        self.assertEqual(changes[('vendor', self.vendor.id)]['data']['vendor_code'], 'V100')
+        self.assertEqual(changes[('purchase_order', self.purchase_order.id)]['data']['po_number'], 'PO1')
+        self.assertFalse(response.data['has_more'])
+
+    def test_delta_since_cursor(self):
+        cursor = self.client.get(self.url, {'since': self.start}).data['next_cursor']
+        response = self.client.get(self.url, {'since': cursor})
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['next_cursor'], cursor)
+
+        self.purchase_order.status = 'canceled'
+        self.purchase_order.save()
+        response = self.client.get(self.url, {'since': cursor, 'model': 'purchase_order'})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['action'], 'update')
+        self.assertEqual(response.data['results'][0]['data']['status'], 'canceled')
+
+        cursor = response.data['next_cursor']
+        self.purchase_order.delete()
+        response = self.client.get(self.url, {'since': cursor})
+        self.assertEqual(response.data['results'][0]['action'], 'delete')
+        self.assertIsNone(response.data['results'][0]['data'])
+
+    def test_paging(self):
+        response = self.client.get(self.url, {'since': self.start, 'limit': 1})
+        self.assertTrue(response.data['has_more'])
+        self.assertEqual(len(response.data['results']), 1)
+        response = self.client.get(self.url, {'since': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_change_log_failure_rolls_back_the_save(self):
+        with mock.patch.object(views.ChangeLogEntry.objects, 'using', side_effect=DatabaseError('log unavailable')):
+            with self.assertRaises(DatabaseError):
+                Vendor.objects.create(name="Vendor2", contact_details="Details", address="Address", vendor_code="V200")
+        self.assertFalse(Vendor.objects.filter(vendor_code="V200").exists())
+
+
+class StubWebhookReceiver:
+    """
+    Local HTTP server that records webhook deliveries and answers with the
+    queued status codes (200 once the queue is empty).
+    """
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                receiver.requests.append((dict(self.headers), body))
+                self.send_response(receiver.responses.pop(0) if receiver.responses else 200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/hooks"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class WebhookOutboxTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.receiver = StubWebhookReceiver()
+        self.addCleanup(self.receiver.close)
+        self.vendor = Vendor.objects.create(
+            name="Vendor1", contact_details="Details", address="Address", vendor_code="V100",
+            webhook_url=self.receiver.url, webhook_secret="s3cret"
+        )
+        self.silent_vendor = Vendor.objects.create(name="Vendor2", contact_details="Details", address="Address", vendor_code="V200")
+
+    def create_purchase_order(self, vendor, po_number):
+        return PurchaseOrder.objects.create(
+            vendor=vendor,
+            po_number=po_number,
+            order_date=timezone.now(),
+            delivery_date=timezone.now() + timezone.timedelta(days=1),
+            items='{"item": "widget"}',
+            quantity=1,
+        )
+
+    def test_events_are_queued_from_signals(self):
+        po = self.create_purchase_order(self.vendor, "PO1")
+        self.create_purchase_order(self.silent_vendor, "PO2")
+        po.items = '{"item": "gadget"}'
+        po.save()
+        po = PurchaseOrder.objects.get(pk=po.pk)
+        po.status = 'completed'
+        po.save()
+        events = on_every_shard(self.vendor.webhook_events.order_by('id'))
+        self.assertEqual([event.event_type for event in events], ['purchase_order.created', 'purchase_order.status_changed'])
+        self.assertEqual(events[1].payload['previous_status'], 'pending')
+        self.assertEqual(len(self.receiver.requests), 0)
+
+    def test_refreshed_orders_track_changes_from_the_reloaded_values(self):
+        po = self.create_purchase_order(self.vendor, "PO1")
+        po = PurchaseOrder.objects.get(pk=po.pk)
+        other = PurchaseOrder.objects.get(pk=po.pk)
+        other.acknowledgment_date = timezone.now()
+        other.status = 'completed'
+        other.save()
+        po.refresh_from_db()
+        self.assertEqual(po.changed_fields(), set())
+        po.items = '{"item": "gadget"}'
+        self.assertEqual(po.changed_fields(), {'items'})
+        po.save()
+        self.vendor.refresh_from_db()
+        self.assertEqual(TDigest.from_dict(self.vendor.response_time_digest).count, 1)
+        events = on_every_shard(self.vendor.webhook_events.filter(event_type='purchase_order.status_changed'))
+        self.assertEqual(len(events), 1)
+
+    def test_events_of_deleted_vendors_are_not_sent(self):
+        self.create_purchase_order(self.vendor, "PO1")
+        self.vendor.soft_delete()
+        self.assertEqual(webhooks.dispatch_due_events(), {'delivered': 0, 'failed': 0})
+        self.assertEqual(len(self.receiver.requests), 0)
+        events = on_every_shard(self.vendor.webhook_events.all())
+        self.assertEqual([event.status for event in events], ['pending'])
+
+    def test_batched_signed_delivery(self):
+        for i in range(3):
+            self.create_purchase_order(self.vendor, f"PO{i}")
+        result = webhooks.dispatch_due_events()
+        self.assertEqual(result, {'delivered': 3, 'failed': 0})
+        self.assertEqual(len(self.receiver.requests), 1)
+
+        headers, body = self.receiver.requests[0]
+        expected = hmac.new(b"s3cret", f"{headers['X-Webhook-Timestamp']}.".encode() + body, hashlib.sha256).hexdigest()
+        self.assertEqual(headers['X-Webhook-Signature'], f"sha256={expected}")
+        self.assertEqual([event['data']['purchase_order']['po_number'] for event in json.loads(body)['events']], ['PO0', 'PO1', 'PO2'])
+        self.assertFalse(self.vendor.webhook_events.exclude(status='delivered').exists())
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        self.receiver.responses = [500]
+        self.create_purchase_order(self.vendor, "PO1")
+        self.assertEqual(webhooks.dispatch_due_events(), {'delivered': 0, 'failed': 1})
+        event = self.vendor.webhook_events.get()
+        self.assertEqual((event.status, event.attempts, event.last_error), ('pending', 1, 'HTTP 500'))
+        self.assertGreater(event.next_attempt_at, timezone.now())
+
+        # Not due yet, then retried once the backoff has passed
+        self.assertEqual(webhooks.dispatch_due_events(), {'delivered': 0, 'failed': 0})
+        self.vendor.webhook_events.update(next_attempt_at=timezone.now())
+        self.assertEqual(webhooks.dispatch_due_events(), {'delivered': 1, 'failed': 0})
+        self.assertEqual(self.vendor.webhook_events.get().attempts, 2)
+
+    def test_gives_up_after_max_attempts(self):
+        self.receiver.responses = [503, 503]
+        self.create_purchase_order(self.vendor, "PO1")
+        with self.settings(WEBHOOKS={'MAX_ATTEMPTS': 2}):
+            webhooks.dispatch_due_events()
+            self.vendor.webhook_events.update(next_attempt_at=timezone.now())
+            webhooks.dispatch_due_events()
+        self.assertEqual(self.vendor.webhook_events.get().status, 'failed')
+
+    def test_vendor_events_stay_in_order_after_a_failure(self):
+        self.receiver.responses = [200, 500]
+        for i in range(5):
+            self.create_purchase_order(self.vendor, f"PO{i}")
+        with self.settings(WEBHOOKS={'BATCH_SIZE': 2}):
+            # The second batch fails, so the third is not sent
+            self.assertEqual(webhooks.dispatch_due_events(), {'delivered': 2, 'failed': 2})
+            self.assertEqual(len(self.receiver.requests), 2)
+            self.assertEqual(list(self.vendor.webhook_events.filter(attempts=0).values_list('status', flat=True)), ['pending'])
+
+            # Newer events wait behind the failed batch until its retry
+            self.create_purchase_order(self.vendor, "PO5")
+            self.assertEqual(webhooks.dispatch_due_events(), {'delivered': 0, 'failed': 0})
+            self.vendor.webhook_events.filter(status='pending').update(next_attempt_at=timezone.now())
+            self.assertEqual(webhooks.dispatch_due_events(), {'delivered': 4, 'failed': 0})
+        sent = [
+            [event['data']['purchase_order']['po_number'] for event in json.loads(body)['events']]
+            for headers, body in self.receiver.requests
+        ]
+        self.assertEqual(sent, [['PO0', 'PO1'], ['PO2', 'PO3'], ['PO2', 'PO3'], ['PO4', 'PO5']])
+
+    def test_claimed_events_are_not_sent_twice(self):
+        self.create_purchase_order(self.vendor, "PO1")
+        claimed = webhooks.claim_due_events(self.vendor._state.db, 1000)
+        self.assertEqual([event.status for event in claimed], ['sending'])
+        # A second dispatcher finds nothing to send
+        self.assertEqual(webhooks.claim_due_events(self.vendor._state.db, 1000), [])
+        self.assertEqual(webhooks.dispatch_due_events(), {'delivered': 0, 'failed': 0})
+        self.assertEqual(len(self.receiver.requests), 0)
+
+        # A claim left by a stopped dispatcher is released after the timeout
+        self.vendor.webhook_events.update(claimed_at=timezone.now() - timezone.timedelta(hours=1))
+        self.assertEqual(webhooks.dispatch_due_events(), {'delivered': 1, 'failed': 0})
+        self.assertEqual(self.vendor.webhook_events.get().claimed_by, '')
+
+    def test_slow_vendor_does_not_hold_up_others(self):
+        self.create_purchase_order(self.vendor, "PO1")
+        self.create_purchase_order(self.vendor, "PO2")
+        self.silent_vendor.webhook_url = self.receiver.url
+        self.silent_vendor.save()
+        self.create_purchase_order(self.silent_vendor, "PO3")
+        other_sent = threading.Event()
+        waits = []
+        post_batch = webhooks.post_batch
+
+        def post_slowly(url, secret, events):
+            if events[0].vendor_id == self.vendor.id:
+                # The slow vendor answers only once the other vendor was sent to
+                waits.append(other_sent.wait(5))
+            else:
+                other_sent.set()
+            return post_batch(url, secret, events)
+
+        with self.settings(WEBHOOKS={'BATCH_SIZE': 1, 'MAX_WORKERS': 2}), \
+                mock.patch.object(webhooks, 'post_batch', post_slowly):
+            self.assertEqual(webhooks.dispatch_due_events(), {'delivered': 3, 'failed': 0})
+        self.assertEqual(waits, [True, True])
+
+
+class VendorImportTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.url = reverse('vendor-import')
+        Vendor.objects.create(name="Existing", contact_details="Contact details", address="Existing address", vendor_code="OLD1")
+
+    def test_csv_import(self):
+        body = (
+            "name,contact_details,address,vendor_code\n"
+            "Vendor A,Contact details A,\"12 Harbour Road,\nMumbai\",NEW1\n"
+            "Vendor B,Contact details B,Address number B,OLD1\n"
+            "Vendor C,Contact details C,Address number C,NEW1\n"
+            "Vendor D,short,Address number D,NEW2\n"
+            "Vendor E,Contact details E,Address number E,NEW3\n"
+        )
+        response = self.client.generic('POST', self.url, body, content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 3))
+        self.assertEqual(
+            [(error['line'], list(error['errors'])) for error in response.data['errors']],
+            [(6, ['contact_details']), (4, ['vendor_code']), (5, ['vendor_code'])]
+        )
+        [new1] = on_every_shard(Vendor.objects.filter(vendor_code='NEW1'))
+        [new3] = on_every_shard(Vendor.objects.filter(vendor_code='NEW3'))
+        self.assertEqual(new1.address, "12 Harbour Road,\nMumbai")
+
+        # Imported vendors are searchable and in the change feed
+        self.assertEqual(search.search_vendor_ids('harbour'), [new1.id])
+        self.assertTrue(ChangeLogEntry.objects.using(new3._state.db).filter(model='vendor', object_id=new3.id).exists())
+
+    def test_ndjson_import_checks_codes_once_per_chunk(self):
+        rows = [
+            json.dumps({'name': f'Vendor {i}', 'contact_details': 'Contact details', 'address': 'Address details', 'vendor_code': f'NEW{i}'})
+            for i in range(10)
+        ]
+        body = '\n'.join(rows[:5] + ['not json'] + rows[5:]) + '\n'
+        records = importers.iter_records(body.splitlines(keepends=True), 'ndjson')
+        # Per chunk: one IN query per shard, then on each shard written to the insert,
+        # change log and search index writes inside a savepoint
+        chunks = [[f'NEW{i}' for i in range(5)], [f'NEW{i}' for i in range(5, 10)]]
+        expected = sum(
+            len(sharding.get_shards()) + (3 + 2) * len({sharding.shard_for_vendor_code(code) for code in chunk})
+            for chunk in chunks
+        )
+        with CaptureShardQueries() as queries:
+            summary = importers.import_vendors(records, batch_size=6)
+        self.assertEqual(len(queries), expected)
+        self.assertEqual((summary['created'], summary['failed']), (10, 1))
+        self.assertEqual(summary['errors'][0]['line'], 6)
+
+    def test_unsupported_content_type(self):
+        response = self.client.post(self.url, {'name': 'x'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_import_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'vendors.ndjson')
+        with open(path, 'w') as f:
+            f.write(json.dumps({'name': 'Vendor Z', 'contact_details': 'Contact details', 'address': 'Address details', 'vendor_code': 'ZED1'}) + '\n')
+        out = StringIO()
+        call_command('import_vendors', path, stdout=out)
+        self.assertIn('Imported 1 vendors, 0 rows failed.', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('import_vendors', path, '--batch-size', '0', stdout=out)
+
+
+class PurchaseOrderCompletionTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.vendor = Vendor.objects.create(name="Vendor1", contact_details="Details", address="Address", vendor_code="V100")
+
+    def create_purchase_order(self, po_number, delivery_in_days):
+        return PurchaseOrder.objects.create(
+            vendor=self.vendor,
+            po_number=po_number,
+            order_date=timezone.now() - timezone.timedelta(days=5),
+            delivery_date=timezone.now() + timezone.timedelta(days=delivery_in_days),
+            items='{"item": "widget"}',
+            quantity=1,
+        )
+
+    def test_completion_is_recorded_once(self):
+        po = self.create_purchase_order("PO1", 2)
+        self.assertIsNone(po.completed_at)
+        self.assertIsNone(po.was_on_time)
+
+        po.status = 'completed'
+        po.save(update_fields=['status'])
+        po.refresh_from_db()
+        completed_at = po.completed_at
+        self.assertIsNotNone(completed_at)
+        self.assertTrue(po.was_on_time)
+
+        po.quality_rating = 4.0
+        po.save()
+        po.refresh_from_db()
+        self.assertEqual(po.completed_at, completed_at)
+
+    def test_on_time_rate_uses_completion_flag(self):
+        for po_number, delivery_in_days in (("PO1", 2), ("PO2", -1), ("PO3", 3), ("PO4", -2)):
+            po = self.create_purchase_order(po_number, delivery_in_days)
+            po.status = 'completed'
+            po.save()
+        self.assertEqual(
+            list(self.vendor.purchase_orders.order_by('po_number').values_list('was_on_time', flat=True)),
+            [True, False, True, False]
+        )
+        self.vendor.refresh_from_db()
+        self.assertEqual(self.vendor.on_time_delivery_rate, 50.0)
+        self.assertEqual(views.calculate_vendor_metrics_bulk()[self.vendor.id]['on_time_delivery_rate'], 50.0)
+
+
+class AdminChangelistTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='adminpassword')
+        self.client.force_login(self.user)
+        # On the shard the admin shows unless another one is picked
+        self.vendors = [
+            Vendor.objects.using(sharding.get_shards()[0]).create(
+                name=f"Vendor{i}", contact_details="Contact details", address="Some address", vendor_code=f"V{i}"
+            )
+            for i in range(3)
+        ]
+
+    def create_purchase_orders(self, count, delivery_in_days=2):
+        now = timezone.now()
+        for _ in range(count):
+            n = PurchaseOrder.objects.count()
+            PurchaseOrder.objects.create(
+                vendor=self.vendors[n % len(self.vendors)],
+                po_number=f"PO{n}",
+                order_date=now - timezone.timedelta(days=n),
+                delivery_date=now + timezone.timedelta(days=delivery_in_days),
+                items='{"item": "widget"}',
+                quantity=1,
+            )
+
+    def count_queries(self, url):
+        with CaptureShardQueries() as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        urls = [
+            reverse('admin:Vendor_purchaseorder_changelist'),
+            reverse('admin:Vendor_purchaseorder_changelist') + '?status__exact=pending',
+            reverse('admin:Vendor_purchaseorder_changelist') + f'?order_date__year={timezone.now().year}',
+            reverse('admin:Vendor_historicalperformance_changelist'),
+        ]
+        self.create_purchase_orders(3)
+        before = [self.count_queries(url) for url in urls]
+        self.create_purchase_orders(9)
+        for vendor in self.vendors:
+            HistoricalPerformance.objects.create(vendor=vendor, date=timezone.localdate() - timezone.timedelta(days=1))
+        self.assertEqual([self.count_queries(url) for url in urls], before)
+
+    def test_paginator_estimates_large_tables(self):
+        self.create_purchase_orders(5)
+        with mock.patch.object(admin.EstimatedCountPaginator, 'COUNT_LIMIT', 3):
+            # Unfiltered: the estimate from the largest id
+            paginator = admin.EstimatedCountPaginator(PurchaseOrder.objects.order_by('-pk'), 2)
+            self.assertEqual(paginator.count, PurchaseOrder.objects.aggregate(m=Max('pk'))['m'])
+            # Filtered: counted up to the limit
+            paginator = admin.EstimatedCountPaginator(PurchaseOrder.objects.filter(status='pending').order_by('pk'), 2)
+            self.assertEqual(paginator.count, 3)
+        paginator = admin.EstimatedCountPaginator(PurchaseOrder.objects.filter(status='pending').order_by('pk'), 2)
+        self.assertEqual(paginator.count, 5)
+
+    def test_vendor_autocomplete_uses_search_index(self):
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'vendor1', 'app_label': 'Vendor', 'model_name': 'purchaseorder', 'field_name': 'vendor',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['results']], [str(self.vendors[1].pk)])
+
+    def test_bulk_status_actions_are_set_wise(self):
+        self.create_purchase_orders(6)
+        late = PurchaseOrder.objects.get(po_number="PO5")
+        PurchaseOrder.objects.filter(pk=late.pk).update(delivery_date=timezone.now() - timezone.timedelta(days=1))
+        PurchaseOrder.objects.filter(po_number="PO0").update(status='canceled')
+        self.vendors[0].webhook_url = 'http://example.com/hook'
+        self.vendors[0].save()
+        last_change = ChangeLogEntry.objects.order_by('-id').first().id
+
+        ids = list(PurchaseOrder.objects.values_list('pk', flat=True))
+        with CaptureShardQueries() as small:
+            self.client.post(reverse('admin:Vendor_purchaseorder_changelist'), {
+                'action': 'mark_completed', '_selected_action': ids[:2],
+            })
+        with CaptureShardQueries() as large:
+            response = self.client.post(reverse('admin:Vendor_purchaseorder_changelist'), {
+                'action': 'mark_completed', '_selected_action': ids,
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertLessEqual(len(large), len(small) + 2 * len(self.vendors))
+
+        statuses = dict(PurchaseOrder.objects.values_list('po_number', 'status'))
+        self.assertEqual(statuses.pop("PO0"), 'canceled')
+        self.assertEqual(set(statuses.values()), {'completed'})
+        self.assertEqual(
+            dict(PurchaseOrder.objects.filter(status='completed').values_list('po_number', 'was_on_time')),
+            {"PO1": True, "PO2": True, "PO3": True, "PO4": True, "PO5": False}
+        )
+        self.assertFalse(PurchaseOrder.objects.filter(status='completed', completed_at__isnull=True).exists())
+
+        # PO2 and PO5 belong to the third vendor; PO5 was late
+        vendor = Vendor.objects.get(pk=self.vendors[2].pk)
+        self.assertEqual(vendor.on_time_delivery_rate, 50.0)
+        self.assertEqual(vendor.fulfillment_rate, 100.0)
+        # PO3 belongs to the first vendor, which has a webhook
+        self.assertEqual(
+            list(WebhookEvent.objects.values_list('payload__purchase_order__po_number', flat=True)), ["PO3"]
+        )
+        logged = ChangeLogEntry.objects.filter(id__gt=last_change, model='purchase_order')
+        self.assertEqual(logged.count(), 5)
+
+
+class PartialUpdateTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.vendor = Vendor.objects.create(
+            name="Vendor1", contact_details="Contact details", address="Some address", vendor_code="V100"
+        )
+        self.purchase_order = PurchaseOrder.objects.create(
+            vendor=self.vendor,
+            po_number="PO1",
+            order_date=timezone.now(),
+            delivery_date=timezone.now() + timezone.timedelta(days=2),
+            items={"item": "widget"},
+            quantity=1,
+        )
+        self.url = reverse('purchase-order-detail', args=[self.purchase_order.id])
+
+    def test_changed_fields_since_load(self):
+        purchase_order = PurchaseOrder.objects.get(pk=self.purchase_order.pk)
+        self.assertEqual(purchase_order.changed_fields(), set())
+        purchase_order.items = {"item": "gadget"}
+        purchase_order.quantity = 1
+        self.assertEqual(purchase_order.changed_fields(), {'items'})
+        self.assertEqual(purchase_order.save_changes(), {'items'})
+        self.assertEqual(purchase_order.saved_changes, {'items'})
+        self.assertEqual(purchase_order.changed_fields(), set())
+        self.assertEqual(purchase_order.loaded_value('items'), {"item": "gadget"})
+        # Nothing changed: no write and no signals
+        with CaptureShardQueries() as queries:
+            self.assertEqual(purchase_order.save_changes(), set())
+        self.assertEqual(len(queries), 0)
+
+    def test_patch_vendor(self):
+        response = self.client.patch(reverse('vendor-detail', args=[self.vendor.id]), {'name': "Acme"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.vendor.refresh_from_db()
+        self.assertEqual((self.vendor.name, self.vendor.address), ("Acme", "Some address"))
+        self.assertEqual(search.search_vendor_ids("acme"), [self.vendor.id])
+        response = self.client.patch(reverse('vendor-detail', args=[self.vendor.id]), {'vendor_code': "V-1"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unrelated_edits_skip_metric_recomputation(self):
+        calculations = {metric: mock.Mock() for metric in views.METRIC_CALCULATIONS}
+        with mock.patch.dict(views.METRIC_CALCULATIONS, calculations), \
+                mock.patch.object(views, 'update_or_create_daily_performance') as daily:
+            response = self.client.patch(self.url, {'items': {"item": "gadget"}, 'quantity': 3}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['quantity'], 3)
+            self.assertFalse(any(calculation.called for calculation in calculations.values()))
+            self.assertFalse(daily.called)
+
+            response = self.client.patch(self.url, {'status': 'completed'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                {metric for metric, calculation in calculations.items() if calculation.called},
+                {'on_time_delivery_rate', 'quality_rating_avg', 'fulfillment_rate'}
+            )
+            self.assertTrue(daily.called)
+
+    def test_saves_recompute_only_dependent_metrics(self):
+        purchase_order = PurchaseOrder.objects.get(pk=self.purchase_order.pk)
+        purchase_order.status = 'completed'
+        purchase_order.quality_rating = 4.0
+        purchase_order.save_changes()
+        self.vendor.refresh_from_db()
+        self.assertEqual((self.vendor.quality_rating_avg, self.vendor.fulfillment_rate), (4.0, 100.0))
+
+        calculations = {metric: mock.Mock() for metric in views.METRIC_CALCULATIONS}
+        with mock.patch.dict(views.METRIC_CALCULATIONS, calculations):
+            purchase_order.quality_rating = 2.0
+            purchase_order.save()
+        self.assertEqual([metric for metric, calculation in calculations.items() if calculation.called], ['quality_rating_avg'])
+        purchase_order.quality_rating = 3.0
+        purchase_order.save_changes()
+        self.vendor.refresh_from_db()
+        self.assertEqual(self.vendor.quality_rating_avg, 3.0)
+
+    def test_partial_dates_are_validated_against_the_instance(self):
+        response = self.client.patch(self.url, {'delivery_date': timezone.now() - timezone.timedelta(days=1)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class BatchLookupTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.vendors = [
+            Vendor.objects.create(name=f"Vendor{i}", contact_details="Details", address="Address", vendor_code=f"V{i}")
+            for i in range(3)
+        ]
+        today = timezone.localdate()
+        for vendor in self.vendors[:2]:
+            for i in range(1, 4):
+                HistoricalPerformance.objects.create(vendor=vendor, date=today - timezone.timedelta(days=i))
+        self.purchase_order = PurchaseOrder.objects.create(
+            vendor=self.vendors[0], po_number="PO1", order_date=timezone.now(),
+            delivery_date=timezone.now() + timezone.timedelta(days=1), items={"item": "widget"}, quantity=1,
+        )
+        self.url = reverse('vendor-performance-batch')
+
+    def test_performance_of_many_vendors(self):
+        first, second, third = (vendor.id for vendor in self.vendors)
+        response = self.client.get(self.url, {'ids': f"{second},9999,{first},{third},{second}", 'history': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([entry['id'] for entry in results], [second, 9999, first, third])
+        self.assertEqual(results[1], {'id': 9999, 'error': 'Vendor not found'})
+        # The first vendor has today's record from its purchase order
+        self.assertEqual(results[2]['performance']['fulfillment_rate'], 0.0)
+        self.assertEqual(len(results[2]['history']), 2)
+        self.assertEqual(results[2]['history'][0]['date'], str(timezone.localdate()))
+        self.assertIsNone(results[0]['performance'])
+        self.assertEqual(
+            [row['date'] for row in results[0]['history']],
+            [str(timezone.localdate() - timezone.timedelta(days=i)) for i in (1, 2)]
+        )
+        self.assertEqual(results[3], {'id': third, 'performance': None, 'history': []})
+
+    def test_query_count_does_not_depend_on_vendor_count(self):
+        # Token lookup, then vendors and performance history on each shard holding some of them
+        for vendors in (self.vendors[:1], self.vendors):
+            with CaptureShardQueries() as queries:
+                self.client.get(self.url, {'ids': ",".join(str(vendor.id) for vendor in vendors)})
+            self.assertEqual(len(queries), 1 + 2 * len(sharding.group_by_shard(vendor.id for vendor in vendors)))
+
+    def test_invalid_ids(self):
+        for ids in ('', 'a,b', '1,-2'):
+            response = self.client.get(self.url, {'ids': ids})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'ids': ",".join(str(i) for i in range(1, views.MAX_BATCH_IDS + 2))})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_details(self):
+        vendor = self.vendors[1]
+        response = self.client.get(reverse('vendor-list-create'), {'ids': f"{vendor.id},9999"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'id': vendor.id, 'data': VendorSerializer(vendor).data},
+            {'id': 9999, 'error': 'Vendor not found'},
+        ])
+        with CaptureShardQueries() as queries:
+            response = self.client.get(reverse('purchase-orders-list-create'), {'ids': f"9999,{self.purchase_order.id}"})
+        # Token lookup and one query per shard
+        self.assertEqual(len(queries), 1 + len(sharding.group_by_shard([9999, self.purchase_order.id])))
+        self.assertEqual(response.data['results'], [
+            {'id': 9999, 'error': 'Purchase order not found'},
+            {'id': self.purchase_order.id, 'data': PurchaseOrderSerializer(self.purchase_order).data},
+        ])
+
+
+class AnalyticsSnapshotTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        rng = random.Random(7)
+        now = timezone.now()
+        self.vendors = [
+            Vendor.objects.create(name=f"Vendor{i}", contact_details="Details", address="Address", vendor_code=f"V{i}")
+            for i in range(4)
+        ]
+        self.purchase_orders = []
+        for i in range(40):
+            purchase_order = PurchaseOrder.objects.create(
+                vendor=rng.choice(self.vendors[:3]),
+                po_number=f"PO{i}",
+                order_date=now - timezone.timedelta(days=3),
+                issue_date=now - timezone.timedelta(hours=rng.randint(1, 72), seconds=rng.random()),
+                delivery_date=now + timezone.timedelta(hours=rng.choice([-2, 5])),
+                items={"item": "widget"},
+                quantity=1,
+            )
+            if rng.random() < 0.6:
+                purchase_order.acknowledgment_date = now
+            purchase_order.status = rng.choice(['pending', 'completed', 'completed', 'canceled'])
+            if rng.random() < 0.7:
+                purchase_order.quality_rating = rng.choice([1.0, 2.5, 4.0, 5.0])
+            purchase_order.save()
+            self.purchase_orders.append(purchase_order)
+
+    def assertMatchesSql(self, snapshot):
+        scores = analytics.score_vendors(snapshot)
+        expected = views.calculate_vendor_metrics_bulk()
+        self.assertEqual(scores.keys(), expected.keys())
+        for vendor_id, metrics in expected.items():
+            for metric, value in metrics.items():
+                self.assertAlmostEqual(scores[vendor_id][metric], value, places=6)
+
+    def test_scores_match_sql(self):
+        snapshot = analytics.PurchaseOrderSnapshot()
+        self.assertEqual(snapshot.refresh(), 40)
+        self.assertMatchesSql(snapshot)
+
+    def test_incremental_refresh(self):
+        snapshot = analytics.PurchaseOrderSnapshot()
+        snapshot.refresh()
+        self.assertEqual(snapshot.refresh(), 0)
+
+        changed = self.purchase_orders[0]
+        changed.quality_rating = 0.5
+        changed.status = 'completed'
+        changed.save()
+        self.purchase_orders[1].delete()
+        PurchaseOrder.objects.create(
+            vendor=self.vendors[3], po_number="PO-new", order_date=timezone.now(),
+            delivery_date=timezone.now() + timezone.timedelta(days=1), items={"item": "widget"}, quantity=1,
+        )
+        # Only the changed and new orders are read again
+        self.assertEqual(snapshot.refresh(), 2)
+        self.assertEqual(len(snapshot), 40)
+        self.assertMatchesSql(snapshot)
+
+    def test_on_time_tolerance_and_composites(self):
+        vendor = self.vendors[3]
+        purchase_order = PurchaseOrder.objects.create(
+            vendor=vendor, po_number="PO-late", order_date=timezone.now(),
+            delivery_date=timezone.now() - timezone.timedelta(hours=3), items={"item": "widget"}, quantity=1,
+        )
+        purchase_order.status = 'completed'
+        purchase_order.quality_rating = 4.0
+        purchase_order.save()
+        snapshot = analytics.PurchaseOrderSnapshot()
+        snapshot.refresh()
+        composites = {'score': {'on_time_delivery_rate': 0.5, 'quality_rating_avg': 10}}
+        self.assertEqual(analytics.score_vendors(snapshot, composites=composites)[vendor.id]['score'], 40.0)
+        lenient = analytics.score_vendors(snapshot, on_time_tolerance=timezone.timedelta(hours=4), composites=composites)
+        self.assertEqual(lenient[vendor.id]['on_time_delivery_rate'], 100.0)
+        self.assertEqual(lenient[vendor.id]['score'], 90.0)
+        with self.assertRaises(ValueError):
+            analytics.score_vendors(snapshot, composites={'score': {'name': 1}})
+
+    def test_scores_endpoint(self):
+        analytics.reset_snapshot()
+        url = reverse('vendor-scores')
+        response = self.client.get(url, {'weights': 'fulfillment_rate:1', 'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['purchase_orders'], 40)
+        expected = views.calculate_vendor_metrics_bulk()
+        ranked = sorted(expected, key=lambda vendor_id: (-expected[vendor_id]['fulfillment_rate'], vendor_id))
+        self.assertEqual([row['vendor_id'] for row in response.data['results']], ranked[:2])
+        for params in ({'weights': 'name:1'}, {'weights': 'fulfillment_rate'}, {'on_time_tolerance': 'soon'}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class VendorSoftDeleteTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.vendor = Vendor.objects.create(
+            name="Acme", contact_details="Contact details", address="Some address", vendor_code="V100"
+        )
+        self.other_vendor = Vendor.objects.create(
+            name="Globex", contact_details="Contact details", address="Some address", vendor_code="V200"
+        )
+        now = timezone.now()
+        for vendor, count in ((self.vendor, 25), (self.other_vendor, 2)):
+            for i in range(count):
+                PurchaseOrder.objects.create(
+                    vendor=vendor, po_number=f"{vendor.vendor_code}-{i}", order_date=now,
+                    delivery_date=now + timezone.timedelta(days=1), items={"item": "widget"}, quantity=1,
+                )
+        HistoricalPerformance.objects.create(vendor=self.vendor, date=timezone.localdate() - timezone.timedelta(days=1))
+        self.purchase_order = self.vendor.purchase_orders.first()
+
+    def test_deleted_vendor_is_hidden_right_away(self):
+        response = self.client.delete(reverse('vendor-detail', args=[self.vendor.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(Vendor.all_objects.filter(pk=self.vendor.pk).exists())
+        self.assertEqual(PurchaseOrder.objects.filter(vendor=self.vendor).count(), 25)
+
+        response = self.client.get(reverse('vendor-detail', args=[self.vendor.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('vendor-list-create'))
+        self.assertEqual([vendor['id'] for vendor in response.data], [self.other_vendor.id])
+        self.assertEqual(search.search_vendor_ids("acme"), [])
+        response = self.client.get(reverse('purchase-order-detail', args=[self.purchase_order.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('purchase-orders-list-create'))
+        self.assertEqual(len(response.data), 2)
+        response = self.client.get(reverse('dashboard-summary'))
+        self.assertEqual((response.data['vendors']['total'], response.data['purchase_orders']['total']), (1, 2))
+
+        entry = ChangeLogEntry.objects.using(self.vendor._state.db).filter(model='vendor', object_id=self.vendor.id).latest('id')
+        self.assertEqual(entry.action, 'delete')
+        # The code stays taken until the vendor is purged
+        response = self.client.post(reverse('vendor-list-create'), {
+            'name': "Acme", 'contact_details': "Contact details", 'address': "Some address", 'vendor_code': "V100"
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deleted_vendor_is_not_scored(self):
+        self.purchase_order.status = 'completed'
+        self.purchase_order.save()
+        analytics.reset_snapshot()
+        url = reverse('vendor-scores')
+        response = self.client.get(url)
+        self.assertEqual(response.data['purchase_orders'], 27)
+        self.assertEqual([row['vendor_id'] for row in response.data['results']], [self.vendor.id, self.other_vendor.id])
+
+        # Archive totals of the deleted vendor are left out as well
+        VendorArchiveTotals.objects.create(vendor=self.vendor, orders=3, completed_orders=3)
+        self.vendor.soft_delete()
+        response = self.client.get(url)
+        self.assertEqual(response.data['purchase_orders'], 2)
+        self.assertEqual([row['vendor_id'] for row in response.data['results']], [self.other_vendor.id])
+
+    def test_purge_deletes_in_chunks(self):
+        self.vendor.soft_delete()
+        out = StringIO()
+        call_command('purge_deleted_vendors', '--once', '--batch-size', '10', '--pause', '0', stdout=out)
+        output = out.getvalue()
+        for line in ("10/25 purchase orders removed", "25/25 purchase orders removed", "Purged 1 deleted vendors."):
+            self.assertIn(line, output)
+        self.assertFalse(Vendor.all_objects.filter(pk=self.vendor.pk).exists())
+        self.assertFalse(PurchaseOrder.objects.filter(vendor_id=self.vendor.pk).exists())
+        self.assertFalse(HistoricalPerformance.objects.filter(vendor_id=self.vendor.pk).exists())
+        changes = ChangeLogEntry.objects.using(self.vendor._state.db)
+        self.assertEqual(changes.filter(model='purchase_order', action='delete').count(), 25)
+        self.assertEqual(search.search_purchase_order_ids("V100"), [])
+        self.assertEqual(self.other_vendor.purchase_orders.count(), 2)
+
+        out = StringIO()
+        call_command('purge_deleted_vendors', '--once', stdout=out)
+        self.assertEqual(out.getvalue(), "")
+
+@override_settings(VENDOR_SHARDS=['default', 'shard1', 'shard2'])
+class ShardRouterTests(TestCase):
+    databases = '__all__'
+
+    def test_ids_encode_their_shard(self):
+        self.assertEqual(sharding.shard_for_id(5), 'default')
+        self.assertEqual(sharding.shard_for_id((1 << sharding.SHARD_ID_BITS) + 5), 'shard1')
+        self.assertEqual(sharding.shard_for_id((2 << sharding.SHARD_ID_BITS) + 5), 'shard2')
+        # Out of range ids are looked up, and not found, on the first shard
+        self.assertEqual(sharding.shard_for_id(3 << sharding.SHARD_ID_BITS), 'default')
+        self.assertEqual(
+            sharding.group_by_shard([1, (2 << sharding.SHARD_ID_BITS) + 1, 2]),
+            {'default': [1, 2], 'shard2': [(2 << sharding.SHARD_ID_BITS) + 1]}
+        )
+
+    def test_new_rows_follow_their_vendor(self):
+        router = sharding.VendorShardRouter()
+        codes = [f"V{i}" for i in range(30)]
+        placements = {code: sharding.shard_for_vendor_code(code) for code in codes}
+        self.assertEqual(set(placements.values()), {'default', 'shard1', 'shard2'})
+        self.assertEqual(router.db_for_write(Vendor, instance=Vendor(vendor_code="V7")), placements["V7"])
+        vendor_id = (1 << sharding.SHARD_ID_BITS) + 9
+        self.assertEqual(router.db_for_write(PurchaseOrder, instance=PurchaseOrder(vendor_id=vendor_id)), 'shard1')
+
+    def test_lookups_of_one_vendor_or_id_go_to_its_shard(self):
+        vendor_id = (2 << sharding.SHARD_ID_BITS) + 3
+        self.assertEqual(PurchaseOrder.objects.filter(vendor_id=vendor_id).db, 'shard2')
+        self.assertEqual(Vendor.objects.filter(pk=str(vendor_id)).db, 'shard2')
+        self.assertEqual(HistoricalPerformance.objects.filter(vendor=Vendor(pk=vendor_id)).db, 'shard2')
+        # An explicit database wins, and lookups of several vendors stay on the first shard
+        self.assertEqual(PurchaseOrder.objects.using('default').filter(vendor_id=vendor_id).db, 'default')
+        self.assertEqual(PurchaseOrder.objects.filter(vendor_id__in=[vendor_id]).db, 'default')
+
+    def test_only_vendor_data_is_migrated_to_shards(self):
+        router = sharding.VendorShardRouter()
+        self.assertTrue(router.allow_migrate('shard1', 'Vendor'))
+        self.assertTrue(router.allow_migrate('default', 'Vendor'))
+        self.assertFalse(router.allow_migrate('shard1', 'auth'))
+        self.assertIsNone(router.allow_migrate('default', 'auth'))
+        self.assertFalse(router.allow_migrate('other', 'Vendor'))
+
+
+
+class TemporaryShardMixin:
+    """
+    Puts the vendor data in a migrated temporary SQLite file, the only shard
+    while the test runs, for tests whose threads or processes cannot see
+    the in-memory test database. The file is in `self.directory`.
+    """
+    alias = 'temporary'
+    database_options = {}
+    # Further settings overridden during the test
+    overrides = {}
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        connections.settings[self.alias] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(self.directory.name, f"{self.alias}.sqlite3"),
+            'OPTIONS': self.database_options,
+        }
+        connections.configure_settings(connections.settings)
+        self.addCleanup(self.remove_database)
+        overrides = override_settings(VENDOR_SHARDS=[self.alias], **self.overrides)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        call_command('migrate', 'Vendor', database=self.alias, verbosity=0)
+
+    def remove_database(self):
+        connections[self.alias].close()
+        del connections[self.alias]
+        del connections.settings[self.alias]
+
+
+class DailyPerformanceConcurrencyTests(TemporaryShardMixin, TransactionTestCase):
+    """
+    Saves purchase orders of one vendor from many threads at once, which
+    cannot share the in-memory test database.
+    """
+    alias = 'concurrency'
+    database_options = {'timeout': 60}
+    WRITERS = 8
+    ORDERS = 10
+
+    def write_orders(self, writer, vendor_id, errors):
+        rng = random.Random(writer)
+        try:
+            for i in range(self.ORDERS):
+                now = timezone.now()
+                purchase_order = PurchaseOrder.objects.create(
+                    vendor_id=vendor_id, po_number=f"W{writer}-{i}", order_date=now,
+                    delivery_date=now + timezone.timedelta(hours=rng.choice([-1, 1])),
+                    issue_date=now - timezone.timedelta(hours=rng.randint(1, 5)),
+                    items={"item": "widget"}, quantity=1,
+                )
+                # As the acknowledge endpoint does
+                purchase_order.acknowledgment_date = now
+                purchase_order.save()
+                if rng.random() < 0.7:
+                    purchase_order.status = 'completed'
+                    purchase_order.quality_rating = rng.choice([2.0, 3.5, 5.0])
+                    purchase_order.save()
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connections.close_all()
+
+    def test_concurrent_saves_keep_the_daily_row_correct(self):
+        vendor = Vendor.objects.create(
+            name="Vendor1", contact_details="Contact details", address="Some address", vendor_code="V100"
+        )
+        errors = []
+        threads = [
+            threading.Thread(target=self.write_orders, args=(writer, vendor.id, errors)) for writer in range(self.WRITERS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        orders = list(PurchaseOrder.objects.filter(vendor=vendor))
+        self.assertEqual(len(orders), self.WRITERS * self.ORDERS)
+        completed = [order for order in orders if order.status == 'completed']
+        rows = list(HistoricalPerformance.objects.filter(vendor=vendor))
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual(row.date, timezone.localdate())
+        self.assertAlmostEqual(
+            row.on_time_delivery_rate, 100 * sum(order.was_on_time for order in completed) / len(completed)
+        )
+        ratings = [order.quality_rating for order in orders if order.quality_rating is not None]
+        self.assertAlmostEqual(row.quality_rating_avg, sum(ratings) / len(ratings))
+        latencies = [(order.acknowledgment_date - order.issue_date).total_seconds() / 3600 for order in orders]
+        self.assertAlmostEqual(row.average_response_time, sum(latencies) / len(latencies), places=5)
+        self.assertEqual(row.fulfillment_rate, 100.0)
+        # Every acknowledgment reached the row's digest
+        self.assertEqual(TDigest.from_dict(row.response_time_digest).count, len(orders))
+
+
+class RequestCaptureTests(LiveServerTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'requests.ndjson')
+        self.capture = override_settings(REQUEST_CAPTURE={
+            'ENABLED': True, 'SAMPLE_RATE': 1.0, 'PATH': self.path, 'MAX_BODY_BYTES': 1024,
+        })
+        self.capture.enable()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        # Middleware is loaded by the first request of a client
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def tearDown(self):
+        capture.CaptureWriter.close_all()
+        self.capture.disable()
+        self.directory.cleanup()
+
+    def read_capture(self):
+        with open(self.path) as capture_file:
+            return [json.loads(line) for line in capture_file]
+
+    def test_sampled_requests_are_recorded_without_secrets(self):
+        self.client.post(reverse('api_login'), {'username': 'testuser', 'password': 'testpass'}, format='json')
+        response = self.client.post(reverse('vendor-list-create'), {
+            'name': "Acme", 'contact_details': "Contact details", 'address': "Some address",
+            'vendor_code': "V100", 'webhook_secret': "s3cret",
+        }, format='json')
+        self.client.get(reverse('vendor-detail', args=[response.data['id']]), {'token': 'abc', 'fields': 'name'})
+        self.client.post(reverse('vendor-import'), "name\n" + "x" * 2000, content_type='text/csv')
+
+        records = self.read_capture()
+        self.assertEqual([record['method'] for record in records], ['POST', 'GET', 'POST'])
+        created, detail, imported = records
+        self.assertEqual((created['route'], created['status'], created['authenticated']), ('api/vendors/', 201, True))
+        self.assertEqual(json.loads(created['body'])['webhook_secret'], capture.REDACTED)
+        self.assertEqual(detail['route'], 'api/vendors/<int:vendor_id>/')
+        self.assertEqual(detail['path'], f"/api/vendors/{response.data['id']}/?token=REDACTED&fields=name")
+        self.assertGreater(detail['duration_ms'], 0)
+        self.assertTrue(imported['body_omitted'])
+        with open(self.path) as capture_file:
+            text = capture_file.read()
+        for secret in (self.token.key, 's3cret', 'testpass'):
+            self.assertNotIn(secret, text)
+
+    def test_capture_is_opt_in(self):
+        with override_settings(REQUEST_CAPTURE={'ENABLED': False}):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+            client.get(reverse('vendor-list-create'))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_replay_against_a_server(self):
+        for i in range(3):
+            self.client.post(reverse('vendor-list-create'), {
+                'name': f"Vendor{i}", 'contact_details': "Contact details", 'address': "Some address",
+                'vendor_code': f"V{i}",
+            }, format='json')
+            self.client.get(reverse('vendor-list-create'))
+        capture.CaptureWriter.close_all()
+
+        out = StringIO()
+        call_command(
+            'replay', self.path, '--base-url', self.live_server_url, '--speed', '0', '--concurrency', '2',
+            '--token', self.token.key, stdout=out
+        )
+        output = out.getvalue()
+        self.assertIn("Replayed 6 requests", output)
+        self.assertIn("GET api/vendors/", output)
+        self.assertIn("max delay behind schedule", output)
+        self.assertIn("p95 wait", output)
+        # The vendor codes are taken now, so the replayed creates fail validation
+        self.assertIn("3 requests got a different status than when recorded.", output)
+        self.assertEqual(count_on_every_shard(Vendor.objects), 3)
+
+
+@override_settings(REQUEST_COALESCING={'VIEWS': ['vendor-list-create'], 'TIMEOUT': 5})
+class RequestCoalescingTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.calls = []
+
+    def get_response(self, request):
+        self.calls.append(request.get_full_path())
+        call = len(self.calls)
+        time.sleep(0.2)
+        response = HttpResponse(json.dumps({'call': call}), content_type='application/json')
+        response['X-Call'] = str(call)
+        return response
+
+    def run_concurrently(self, middleware, requests):
+        responses = [None] * len(requests)
+
+        def run(index):
+            responses[index] = middleware(requests[index])
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(len(requests))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_identical_requests_share_one_response(self):
+        middleware = coalescing.RequestCoalescingMiddleware(self.get_response)
+        requests = [
+            self.factory.get('/api/vendors/', {'name': 'Acme', 'page': '1'}, HTTP_AUTHORIZATION='Token a')
+            for _ in range(8)
+        ]
+        # Parameter order does not matter
+        requests.append(self.factory.get('/api/vendors/?page=1&name=Acme', HTTP_AUTHORIZATION='Token a'))
+        responses = self.run_concurrently(middleware, requests)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual({response.content for response in responses}, {b'{"call": 1}'})
+        self.assertTrue(all(response['Content-Type'] == 'application/json' for response in responses))
+        self.assertEqual(middleware.flights, {})
+
+    def test_credentials_and_methods_are_not_shared(self):
+        middleware = coalescing.RequestCoalescingMiddleware(self.get_response)
+        responses = self.run_concurrently(middleware, [
+            self.factory.get('/api/vendors/', HTTP_AUTHORIZATION='Token a'),
+            self.factory.get('/api/vendors/', HTTP_AUTHORIZATION='Token b'),
+            self.factory.get('/api/vendors/'),
+            self.factory.post('/api/vendors/', HTTP_AUTHORIZATION='Token a'),
+            self.factory.post('/api/vendors/', HTTP_AUTHORIZATION='Token a'),
+            # Not a coalesced view
+            self.factory.get('/api/purchase_orders/', HTTP_AUTHORIZATION='Token a'),
+            self.factory.get('/api/purchase_orders/', HTTP_AUTHORIZATION='Token a'),
+        ])
+        self.assertEqual(len(self.calls), 7)
+        self.assertEqual(len({response['X-Call'] for response in responses}), 7)
+
+    def test_responses_setting_cookies_are_not_shared(self):
+        def get_response(request):
+            response = self.get_response(request)
+            response.set_cookie('sessionid', 'abc')
+            return response
+
+        middleware = coalescing.RequestCoalescingMiddleware(get_response)
+        self.run_concurrently(middleware, [self.factory.get('/api/vendors/') for _ in range(3)])
+        self.assertEqual(len(self.calls), 3)
+
+    def test_failed_responses_are_not_shared(self):
+        def get_response(request):
+            response = self.get_response(request)
+            # The first request fails, as a view exception does once Django has handled it
+            if response['X-Call'] == '1':
+                response.status_code = 500
+            return response
+
+        middleware = coalescing.RequestCoalescingMiddleware(get_response)
+        responses = self.run_concurrently(middleware, [self.factory.get('/api/vendors/') for _ in range(4)])
+        self.assertEqual(sorted(response.status_code for response in responses), [200, 200, 200, 500])
+        # The waiters ran the view themselves instead of copying the error
+        self.assertEqual(len(self.calls), 4)
+
+    def test_shared_responses_are_throttled(self):
+        def get_response(request):
+            # What DRF does with the request before the view runs
+            drf_request = mock.Mock(method='GET', auth=mock.Mock(key='a'), _request=request)
+            self.assertTrue(TokenBucketThrottle().allow_request(drf_request, views.VendorListCreateAPIView()))
+            return self.get_response(request)
+
+        TokenBucketThrottle.reset()
+        self.addCleanup(TokenBucketThrottle.reset)
+        middleware = coalescing.RequestCoalescingMiddleware(get_response)
+        with override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'read': '3/min'}}):
+            responses = self.run_concurrently(middleware, [
+                self.factory.get('/api/vendors/', HTTP_AUTHORIZATION='Token a') for _ in range(5)
+            ])
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(sorted(response.status_code for response in responses), [200, 200, 200, 429, 429])
+        throttled = [response for response in responses if response.status_code == 429]
+        self.assertEqual({response['Retry-After'] for response in throttled}, {'20'})
+
+    def test_async_requests_await_one_response(self):
+        async def get_response(request):
+            self.calls.append(request.get_full_path())
+            call = len(self.calls)
+            await asyncio.sleep(0.2)
+            return HttpResponse(json.dumps({'call': call}), content_type='application/json')
+
+        middleware = coalescing.RequestCoalescingMiddleware(get_response)
+
+        async def run():
+            return await asyncio.gather(
+                *[middleware(self.factory.get('/api/vendors/', HTTP_AUTHORIZATION='Token a')) for _ in range(5)],
+                middleware(self.factory.get('/api/vendors/', HTTP_AUTHORIZATION='Token b')),
+            )
+
+        responses = asyncio.run(run())
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual({response.content for response in responses[:5]}, {b'{"call": 1}'})
+        self.assertEqual(responses[5].content, b'{"call": 2}')
+
+    def test_disabled_without_views(self):
+        with override_settings(REQUEST_COALESCING={'VIEWS': []}):
+            with self.assertRaises(MiddlewareNotUsed):
+                coalescing.RequestCoalescingMiddleware(self.get_response)
+
+
+class CompactPerformanceHistoryTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.vendor = Vendor.objects.create(name="Vendor1", contact_details="Details", address="Address", vendor_code="V100")
+        today = timezone.localdate()
+        # A Monday about 100 days back
+        self.monday = today - timezone.timedelta(days=100 + (today - timezone.timedelta(days=100)).weekday())
+        self.recent = today - timezone.timedelta(days=1)
+        for date, on_time, quality, hours, completed, rated in (
+            (self.monday, 100.0, 4.0, [1.0, 2.0, 3.0], 3, 3),
+            (self.monday + timezone.timedelta(days=2), 50.0, 2.0, [10.0], 1, 1),
+            (self.monday + timezone.timedelta(days=7), 0.0, 0.0, [], 2, 0),
+            (self.recent, 100.0, 5.0, [1.0], 1, 1),
+        ):
+            digest = TDigest()
+            for value in hours:
+                digest.add(value)
+            HistoricalPerformance.objects.create(
+                vendor=self.vendor, date=date, on_time_delivery_rate=on_time, quality_rating_avg=quality,
+                average_response_time=sum(hours) / len(hours) if hours else 0.0, fulfillment_rate=100.0,
+                response_time_digest=digest.to_dict(), completed_orders=completed, rated_orders=rated,
+                acknowledged_orders=len(hours),
+            )
+
+    def compact(self, keep_daily, keep_weekly):
+        out = StringIO()
+        call_command(
+            'compact_performance_history', '--keep-daily', str(keep_daily), '--keep-weekly', str(keep_weekly),
+            '--batch-size', '1', stdout=out
+        )
+        return out.getvalue()
+
+    def test_daily_records_roll_up_weighted_by_order_counts(self):
+        self.compact(30, 400)
+        records = list(self.vendor.historical_performances.order_by('date'))
+        self.assertEqual([(record.date, record.period) for record in records], [
+            (self.monday, 'week'), (self.monday + timezone.timedelta(days=7), 'week'), (self.recent, 'day'),
+        ])
+        week = records[0]
+        self.assertEqual((week.completed_orders, week.rated_orders, week.acknowledged_orders), (4, 4, 4))
+        self.assertAlmostEqual(week.on_time_delivery_rate, 87.5)
+        self.assertAlmostEqual(week.quality_rating_avg, 3.5)
+        self.assertAlmostEqual(week.average_response_time, 4.0)
+        self.assertEqual(merge_digests([week.response_time_digest]).count, 4)
+        # Nothing rated or acknowledged that week
+        self.assertEqual((records[1].quality_rating_avg, records[1].average_response_time), (0.0, 0.0))
+
+        # Running again changes nothing
+        self.compact(30, 400)
+        self.assertEqual(self.vendor.historical_performances.count(), 3)
+        self.assertAlmostEqual(self.vendor.historical_performances.get(date=self.monday).on_time_delivery_rate, 87.5)
+
+    def test_weekly_records_roll_up_into_months(self):
+        self.compact(30, 400)
+        self.compact(30, 30)
+        months = self.vendor.historical_performances.filter(period='month')
+        self.assertEqual(sum(month.completed_orders for month in months), 6)
+        self.assertEqual(sum(merge_digests([month.response_time_digest]).count for month in months), 4)
+        self.assertTrue(all(month.date.day == 1 for month in months))
+        self.assertFalse(self.vendor.historical_performances.filter(period='week').exists())
+        self.assertEqual(self.vendor.historical_performances.filter(period='day').count(), 1)
+
+    def test_ranges_read_across_rollups(self):
+        url = reverse('vendor-performance', kwargs={'vendor_id': self.vendor.id})
+        # A range inside the first week, ending at the most recent daily record
+        params = {'start': str(self.monday + timezone.timedelta(days=1)), 'end': str(self.recent)}
+        before = self.client.get(url, params).data['acknowledged_orders']
+        self.assertEqual(before, 2)
+        self.compact(30, 400)
+        # The rolled up week counts in full
+        self.assertEqual(self.client.get(url, params).data['acknowledged_orders'], 5)
+        params = {'start': str(self.monday + timezone.timedelta(days=8)), 'end': str(self.monday + timezone.timedelta(days=8))}
+        self.assertEqual(self.client.get(url, params).data['acknowledged_orders'], 0)
+
+    def test_monthly_rollups_overlap_the_days_of_their_last_week(self):
+        # The week of Monday 2024-07-29 runs to 2024-08-04 and is rolled into July
+        HistoricalPerformance.objects.create(vendor=self.vendor, date=datetime.date(2024, 7, 1), period='month')
+        records = HistoricalPerformance.objects.filter(vendor=self.vendor)
+        self.assertTrue(records.overlapping(datetime.date(2024, 8, 2), datetime.date(2024, 8, 20)).filter(period='month').exists())
+        self.assertFalse(records.overlapping(datetime.date(2024, 8, 10), datetime.date(2024, 8, 20)).filter(period='month').exists())
+
+    def test_keep_daily_must_not_exceed_keep_weekly(self):
+        with self.assertRaises(CommandError):
+            self.compact(400, 30)
+
+
+class ArchivePurchaseOrdersTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        rng = random.Random(11)
+        now = timezone.now()
+        self.vendors = [
+            Vendor.objects.create(name=f"Vendor{i}", contact_details="Details", address="Address", vendor_code=f"V{i}")
+            for i in range(3)
+        ]
+        for i in range(30):
+            purchase_order = PurchaseOrder.objects.create(
+                # Vendor2 only has old orders
+                vendor=self.vendors[2] if i < 4 else rng.choice(self.vendors[:2]),
+                po_number=f"PO{i}",
+                order_date=now - timezone.timedelta(days=400 if i < 20 else 3),
+                issue_date=now - timezone.timedelta(hours=rng.randint(1, 72)),
+                delivery_date=now + timezone.timedelta(hours=rng.choice([-2, 5])),
+                items={"item": "widget"},
+                quantity=1,
+            )
+            if rng.random() < 0.6:
+                purchase_order.acknowledgment_date = now
+            purchase_order.status = rng.choice(['pending', 'completed', 'completed', 'canceled'])
+            if rng.random() < 0.7:
+                purchase_order.quality_rating = rng.choice([1.0, 2.5, 4.0, 5.0])
+            purchase_order.save()
+        self.old_closed = PurchaseOrder.objects.filter(order_date__lt=now - timezone.timedelta(days=365)).exclude(status='pending')
+
+    def archive(self):
+        out = StringIO()
+        call_command('archive_purchase_orders', '--older-than', '365', '--batch-size', '3', '--pause', '0', stdout=out)
+        return out.getvalue()
+
+    def vendor_metrics(self):
+        return {
+            vendor.id: {metric: getattr(vendor, metric) for metric in Vendor.METRIC_FIELDS}
+            for vendor in on_every_shard(Vendor.objects.order_by('id'))
+        }
+
+    def assertMetricsEqual(self, actual, expected):
+        self.assertEqual(actual.keys(), expected.keys())
+        for vendor_id, metrics in expected.items():
+            for metric, value in metrics.items():
+                self.assertAlmostEqual(actual[vendor_id][metric], value, places=6)
+
+    def test_archiving_keeps_vendor_metrics(self):
+        archived_ids = {purchase_order.id for purchase_order in on_every_shard(self.old_closed)}
+        metrics = self.vendor_metrics()
+        summary = self.client.get(reverse('dashboard-summary')).data['purchase_orders']
+        overview_url = reverse('vendor-overview', kwargs={'vendor_id': self.vendors[2].id})
+        counts = self.client.get(overview_url).data['purchase_order_counts']
+
+        self.archive()
+        self.assertEqual({archived.id for archived in on_every_shard(ArchivedPurchaseOrder.objects.all())}, archived_ids)
+        self.assertEqual(count_on_every_shard(PurchaseOrder.objects.filter(id__in=archived_ids)), 0)
+        self.assertEqual(sum(totals.orders for totals in on_every_shard(VendorArchiveTotals.objects.all())), len(archived_ids))
+        self.assertEqual(count_on_every_shard(ChangeLogEntry.objects.filter(action='archive')), len(archived_ids))
+        # Running again moves nothing
+        self.assertIn("Archived 0 purchase orders", self.archive())
+
+        self.assertMetricsEqual(views.calculate_vendor_metrics_bulk(), metrics)
+        for vendor in self.vendors:
+            views.refresh_vendor_metrics([vendor.id])
+        self.assertMetricsEqual(self.vendor_metrics(), metrics)
+        snapshot = analytics.PurchaseOrderSnapshot()
+        snapshot.refresh()
+        self.assertMetricsEqual(analytics.score_vendors(snapshot), metrics)
+        self.assertEqual(self.client.get(reverse('dashboard-summary')).data['purchase_orders'], summary)
+        self.assertEqual(self.client.get(overview_url).data['purchase_order_counts'], counts)
+
+    def test_saving_a_live_order_counts_archived_orders(self):
+        self.archive()
+        purchase_order = PurchaseOrder.objects.using(self.vendors[0]._state.db).filter(vendor=self.vendors[0]).first()
+        purchase_order.status = 'completed'
+        purchase_order.quality_rating = 3.0
+        purchase_order.save()
+        self.assertMetricsEqual(
+            {self.vendors[0].id: self.vendor_metrics()[self.vendors[0].id]},
+            {self.vendors[0].id: views.calculate_vendor_metrics_bulk()[self.vendors[0].id]},
+        )
+
+    def test_include_archived(self):
+        self.archive()
+        archived = on_every_shard(ArchivedPurchaseOrder.objects.order_by('id'))[0]
+        url = reverse('purchase-orders-list-create')
+        live = self.client.get(url).data
+        self.assertEqual(len(live), count_on_every_shard(PurchaseOrder.objects))
+        response = self.client.get(url, {'include_archived': 'true'})
+        self.assertEqual(len(response.data), 30)
+        self.assertEqual([row['id'] for row in response.data], sorted(row['id'] for row in response.data))
+        self.assertEqual(
+            len(self.client.get(url, {'include_archived': '1', 'vendor_id': self.vendors[2].id}).data), 4
+        )
+
+        detail_url = reverse('purchase-order-detail', kwargs={'po_id': archived.id})
+        self.assertEqual(self.client.get(detail_url).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(detail_url, {'include_archived': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['po_number'], archived.po_number)
+        self.assertIn('archived_at', response.data)
+        self.assertEqual(self.client.get(url, {'include_archived': 'maybe'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        # An archived order's number stays taken
+        response = self.client.post(url, {
+            'vendor': self.vendors[0].id, 'po_number': archived.po_number, 'order_date': timezone.now(),
+            'delivery_date': timezone.now(), 'items': {"item": "widget"}, 'quantity': 1,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_purge_removes_archived_orders(self):
+        self.archive()
+        self.client.delete(reverse('vendor-detail', kwargs={'vendor_id': self.vendors[2].id}))
+        call_command('purge_deleted_vendors', '--once', '--pause', '0', stdout=StringIO())
+        shard = self.vendors[2]._state.db
+        self.assertFalse(ArchivedPurchaseOrder.objects.using(shard).filter(vendor_id=self.vendors[2].id).exists())
+        self.assertFalse(VendorArchiveTotals.objects.using(shard).filter(vendor_id=self.vendors[2].id).exists())
+        self.assertFalse(Vendor.all_objects.using(shard).filter(pk=self.vendors[2].id).exists())
+
+
+class ReportJobTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.directory = tempfile.TemporaryDirectory()
+        self.reports = override_settings(REPORTS={'PATH': self.directory.name, 'VENDORS_PER_TASK': 2})
+        self.reports.enable()
+        now = timezone.now()
+        self.vendors = [
+            Vendor.objects.create(name=f"Vendor{i}", contact_details="Details", address="Address", vendor_code=f"V{i}")
+            for i in range(5)
+        ]
+        for i, late in enumerate((True, False, True)):
+            PurchaseOrder.objects.create(
+                vendor=self.vendors[1], po_number=f"PO{i}", order_date=now - timezone.timedelta(days=2),
+                delivery_date=now - timezone.timedelta(days=2 if late else -1), items={"item": "widget"}, quantity=1,
+                status='completed', quality_rating=4.0,
+            )
+        self.parameters = {'start': str(timezone.localdate() - timezone.timedelta(days=7)), 'end': str(timezone.localdate())}
+
+    def tearDown(self):
+        self.reports.disable()
+        self.directory.cleanup()
+
+    def test_submit_poll_and_download(self):
+        response = self.client.post(reverse('report-job-list-create'), {'kind': 'scorecard', 'parameters': self.parameters}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'pending')
+        job_id = response.data['id']
+        detail_url = reverse('report-job-detail', args=[job_id])
+        download_url = reverse('report-job-download', args=[job_id])
+        self.assertEqual(self.client.get(download_url).status_code, status.HTTP_409_CONFLICT)
+
+        call_command('run_report_jobs', '--once', '--workers', '0', stdout=StringIO())
+        response = self.client.get(detail_url)
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual((response.data['vendors_total'], response.data['vendors_done']), (5, 5))
+
+        response = self.client.get(download_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([line['vendor']['id'] for line in lines], sorted(vendor.id for vendor in self.vendors))
+        scorecard = next(line for line in lines if line['vendor']['id'] == self.vendors[1].id)
+        self.assertEqual((scorecard['total_orders'], scorecard['completed_orders']), (3, 3))
+        self.assertAlmostEqual(scorecard['on_time_delivery_rate'], 100 / 3)
+        self.assertEqual([order['po_number'] for order in scorecard['late_orders']], ["PO0", "PO2"])
+        self.assertEqual(len(scorecard['trend']), 1)
+        self.assertEqual(lines[0]['late_orders'], [])
+        # Only the joined file is left
+        self.assertEqual(os.listdir(self.directory.name), [f"scorecard-{job_id}.ndjson"])
+
+    def test_stale_running_jobs_are_failed(self):
+        started = timezone.now() - timezone.timedelta(hours=3)
+        stale = ReportJob.objects.create(requested_by=self.user, kind='scorecard', parameters=self.parameters,
+                                         status='running', started_at=started)
+        recent = ReportJob.objects.create(requested_by=self.user, kind='scorecard', parameters=self.parameters,
+                                          status='running', started_at=timezone.now())
+        self.assertIsNone(reports.claim_next_job())
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
+        self.assertIsNotNone(stale.finished_at)
+        self.assertEqual(recent.status, 'running')
+
+    def test_jobs_are_private_and_validated(self):
+        response = self.client.post(reverse('report-job-list-create'), {'kind': 'scorecard'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        # Defaults to the last full quarter
+        start = datetime.date.fromisoformat(response.data['parameters']['start'])
+        self.assertEqual((start.day, (start.month - 1) % 3), (1, 0))
+        job_id = response.data['id']
+
+        other = User.objects.create_user(username='other', password='testpass')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=other).key)
+        self.assertEqual(self.client.get(reverse('report-job-detail', args=[job_id])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('report-job-list-create')).data, [])
+
+        for data in ({'kind': 'unknown'}, {'kind': 'scorecard', 'parameters': {'start': '2024-02-01', 'end': '2024-01-01'}}):
+            response = self.client.post(reverse('report-job-list-create'), data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ReportProcessPoolTests(TemporaryShardMixin, TransactionTestCase):
+    """
+    Builds a report in a pool of processes, which cannot see the in-memory
+    test database.
+    """
+    alias = 'reports'
+    overrides = {'REPORTS': {'VENDORS_PER_TASK': 3}}
+
+    def test_pool_writes_the_same_report_as_one_process(self):
+        now = timezone.now()
+        for i in range(10):
+            vendor = Vendor.objects.create(name=f"Vendor{i}", contact_details="Details", address="Address", vendor_code=f"V{i}")
+            for j in range(i):
+                PurchaseOrder.objects.create(
+                    vendor=vendor, po_number=f"PO{i}-{j}", order_date=now, delivery_date=now - timezone.timedelta(hours=j % 2),
+                    items={"item": "widget"}, quantity=1, status='completed',
+                )
+        parameters = reports.parse_scorecard_parameters({'start': str(timezone.localdate()), 'end': str(timezone.localdate())})
+        done = []
+        pooled = os.path.join(self.directory.name, 'pooled.ndjson')
+        self.assertEqual(reports.write_report('scorecard', parameters, pooled, workers=2, progress=done.append), 10)
+        self.assertEqual(sorted(done), [1, 3, 3, 3])
+        single = os.path.join(self.directory.name, 'single.ndjson')
+        reports.write_report('scorecard', parameters, single, workers=0)
+        with open(pooled) as first, open(single) as second:
+            self.assertEqual(first.read(), second.read())
+        with open(pooled) as report:
+            lines = [json.loads(line) for line in report]
+        self.assertEqual([line['total_orders'] for line in lines], list(range(10)))
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['pooled.ndjson', 'reports.sqlite3', 'single.ndjson'])
+
+
+@skipUnless(len(settings.VENDOR_SHARDS) > 1, "Set VENDOR_SHARD_COUNT to 2 or more to test sharded databases.")
+class ShardedAPITests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        # One vendor per shard, created through the API
+        self.vendors = {}
+        for i in range(100):
+            code = f"V{i}"
+            shard = sharding.shard_for_vendor_code(code)
+            if shard in self.vendors:
+                continue
+            response = self.client.post(reverse('vendor-list-create'), {
+                'name': f"Vendor {code}", 'contact_details': "Contact details", 'address': "Some address",
+                'vendor_code': code,
+            })
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.vendors[shard] = response.data['id']
+        self.assertEqual(set(self.vendors), set(settings.VENDOR_SHARDS))
+
+    def create_purchase_order(self, vendor_id, po_number):
+        response = self.client.post(reverse('purchase-orders-list-create'), {
+            'po_number': po_number,
+            'vendor': vendor_id,
+            'order_date': timezone.now(),
+            'delivery_date': timezone.now() + timezone.timedelta(days=1),
+            'items': '{"item": "widget"}',
+            'quantity': 1,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def test_vendor_rows_stay_on_their_shard(self):
+        for shard, vendor_id in self.vendors.items():
+            self.assertEqual(sharding.shard_for_vendor(vendor_id), shard)
+            self.assertTrue(Vendor.objects.using(shard).filter(pk=vendor_id).exists())
+            po_id = self.create_purchase_order(vendor_id, f"PO-{shard}")
+            self.assertEqual(sharding.shard_for_id(po_id), shard)
+
+            response = self.client.put(reverse('purchase-order-detail', args=[po_id]), {
+                'po_number': f"PO-{shard}", 'vendor': vendor_id, 'order_date': timezone.now(),
+                'delivery_date': timezone.now() + timezone.timedelta(days=1),
+                'items': '{"item": "widget"}', 'quantity': 1, 'status': 'completed',
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            # The metric signals wrote to the vendor's shard
+            vendor = self.client.get(reverse('vendor-detail', args=[vendor_id])).data
+            self.assertEqual(vendor['fulfillment_rate'], 100.0)
+            self.assertTrue(HistoricalPerformance.objects.using(shard).filter(vendor_id=vendor_id).exists())
+            self.assertEqual(
+                self.client.get(reverse('vendor-performance', args=[vendor_id])).status_code, status.HTTP_200_OK
+            )
+
+    def test_lists_merge_all_shards(self):
+        response = self.client.get(reverse('vendor-list-create'), {'ordering': '-name'})
+        self.assertEqual([vendor['id'] for vendor in response.data], [
+            vendor_id for _, vendor_id in sorted(
+                ((Vendor.objects.using(shard).get(pk=vendor_id).name, vendor_id) for shard, vendor_id in self.vendors.items()),
+                reverse=True
+            )
+        ])
+        po_ids = [self.create_purchase_order(vendor_id, f"PO-{shard}") for shard, vendor_id in self.vendors.items()]
+        response = self.client.get(reverse('purchase-orders-list-create'))
+        self.assertEqual([po['id'] for po in response.data], sorted(po_ids))
+        response = self.client.get(reverse('vendor-search'), {'q': 'vendor'})
+        self.assertEqual(sorted(vendor['id'] for vendor in response.data), sorted(self.vendors.values()))
+        summary = self.client.get(reverse('dashboard-summary')).data
+        self.assertEqual(summary['vendors']['total'], len(self.vendors))
+        self.assertEqual(summary['purchase_orders']['total'], len(po_ids))
+
+    def test_codes_are_unique_across_shards(self):
+        shard, vendor_id = next((shard, vendor_id) for shard, vendor_id in self.vendors.items() if shard != 'default')
+        code = Vendor.objects.using(shard).get(pk=vendor_id).vendor_code
+        response = self.client.put(reverse('vendor-detail', args=[self.vendors['default']]), {
+            'name': "Renamed", 'contact_details': "Contact details", 'address': "Some address", 'vendor_code': code,
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.create_purchase_order(vendor_id, "PO-1")
+        response = self.client.post(reverse('purchase-orders-list-create'), {
+            'po_number': "PO-1", 'vendor': self.vendors['default'], 'order_date': timezone.now(),
+            'delivery_date': timezone.now() + timezone.timedelta(days=1), 'items': '{}', 'quantity': 1,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_change_feed_pages_through_every_shard(self):
+        for shard, vendor_id in self.vendors.items():
+            self.create_purchase_order(vendor_id, f"PO-{shard}")
+        seen = set()
+        cursor = '0'
+        while True:
+            response = self.client.get(reverse('change-feed'), {'since': cursor, 'limit': 2})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.update((change['model'], change['object_id']) for change in response.data['results'])
+            cursor = response.data['next_cursor']
+            self.assertEqual(len(cursor.split('.')), len(settings.VENDOR_SHARDS))
+            if not response.data['has_more']:
+                break
+        self.assertEqual({object_id for model, object_id in seen if model == 'vendor'}, set(self.vendors.values()))
+        self.assertEqual(len([model for model, _ in seen if model == 'purchase_order']), len(self.vendors))
+
+    def test_admin_estimates_count_from_the_shard_id_range(self):
+        self.client.force_login(User.objects.create_superuser(username='admin', password='adminpassword'))
+        shard = sharding.get_shards()[-1]
+        for i in range(4):
+            self.create_purchase_order(self.vendors[shard], f"PO-{i}")
+        with mock.patch.object(admin.EstimatedCountPaginator, 'COUNT_LIMIT', 2):
+            for model_name, model in (('purchaseorder', PurchaseOrder), ('historicalperformance', HistoricalPerformance)):
+                response = self.client.get(reverse(f'admin:Vendor_{model_name}_changelist'), {'shard': shard})
+                self.assertEqual(response.context['cl'].result_count, model.objects.using(shard).count())
+        self.assertEqual(PurchaseOrder.objects.using(shard).count(), 4)
+
+    def test_admin_works_on_the_picked_shard(self):
+        self.client.force_login(User.objects.create_superuser(username='admin', password='adminpassword'))
+        po_ids = {shard: self.create_purchase_order(vendor_id, f"PO-{shard}") for shard, vendor_id in self.vendors.items()}
+        changelist = reverse('admin:Vendor_purchaseorder_changelist')
+        for shard, vendor_id in self.vendors.items():
+            response = self.client.get(reverse('admin:Vendor_vendor_changelist'), {'shard': shard})
+            self.assertEqual([vendor.pk for vendor in response.context['cl'].result_list], [vendor_id])
+            response = self.client.get(changelist, {'shard': shard, 'q': f"PO-{shard}"})
+            self.assertEqual([purchase_order.pk for purchase_order in response.context['cl'].result_list], [po_ids[shard]])
+
+            # Change pages find the shard from the id; the vendor choices come from it
+            response = self.client.get(reverse('admin:Vendor_purchaseorder_change', args=[po_ids[shard]]))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.context['adminform'].form.fields['vendor'].queryset.db, shard)
+            self.assertContains(response, f"{reverse('admin:autocomplete')}?shard={shard}")
+            response = self.client.get(reverse('admin:autocomplete'), {
+                'term': 'vendor', 'app_label': 'Vendor', 'model_name': 'purchaseorder', 'field_name': 'vendor', 'shard': shard,
+            })
+            self.assertEqual([row['id'] for row in response.json()['results']], [str(vendor_id)])
+
+            response = self.client.post(f"{changelist}?shard={shard}", {
+                'action': 'mark_completed', '_selected_action': [po_ids[shard]],
+            })
+            self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+            self.assertEqual(PurchaseOrder.objects.using(shard).get(pk=po_ids[shard]).status, 'completed')
+
+
+class TokenBucketThrottleTests(APITestCase):
+    databases = '__all__'
+
+    RATES = {
+        'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework.authentication.TokenAuthentication',),
+        'DEFAULT_THROTTLE_RATES': {'read': '2/min', 'write': '1/min', 'VendorPerformanceAPIView.read': '3/min'},
+    }
+
+    def setUp(self):
+        TokenBucketThrottle.reset()
+        self.addCleanup(TokenBucketThrottle.reset)
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.url = reverse('vendor-list-create')
+
+    def test_requests_over_the_rate_get_429_with_retry_after(self):
+        with self.settings(REST_FRAMEWORK=self.RATES):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+
+    def test_buckets_are_per_token_view_and_method(self):
+        other_token = Token.objects.create(user=User.objects.create_user(username='other', password='testpass'))
+        with self.settings(REST_FRAMEWORK=self.RATES):
+            self.client.get(self.url)
+            self.client.get(self.url)
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            # Writes, other views and other tokens have their own buckets
+            self.assertEqual(self.client.post(self.url, {}).status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(self.client.post(self.url, {}).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(self.client.get(reverse('dashboard-summary')).status_code, status.HTTP_200_OK)
+            self.client.credentials(HTTP_AUTHORIZATION='Token ' + other_token.key)
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+    def test_bucket_refills_over_time(self):
+        throttle = TokenBucketThrottle()
+        request = mock.Mock(method='GET', auth=self.token)
+        view = views.VendorListCreateAPIView()
+        with self.settings(REST_FRAMEWORK=self.RATES), mock.patch('Vendor.throttling.time.monotonic') as clock:
+            clock.return_value = 1000.0
+            self.assertTrue(throttle.allow_request(request, view))
+            self.assertTrue(throttle.allow_request(request, view))
+            self.assertFalse(throttle.allow_request(request, view))
+            clock.return_value = 1015.0
+            self.assertFalse(throttle.allow_request(request, view))
+            clock.return_value = 1030.0
+            self.assertTrue(throttle.allow_request(request, view))
+
+    def test_benchmark_command_reports_overhead(self):
+        # Timings are reported by the benchmark_throttle command, not asserted
+        out = StringIO()
+        call_command('benchmark_throttle', '--clients', '10', '--checks', '100', '--requests', '20', stdout=out)
+        output = out.getvalue()
+        self.assertIn("us per check", output)
+        self.assertIn("Limiter overhead:", output)
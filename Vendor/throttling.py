@@ -0,0 +1,92 @@
+"""
+In-memory token bucket rate limiting for the API.
+
+Every (client, view, read/write) triple gets its own bucket, where the
+client is the auth token or, for anonymous requests, the client address.
+Rates come from `REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']`:
+
+    'read': '600/min'                              # GET, HEAD, OPTIONS
+    'write': '120/min'                             # everything else
+    'PurchaseOrderAcknowledgeAPIView.write': ...   # optional per-view override
+
+A bucket holds up to the number of requests in the rate and refills
+continuously, so short bursts are allowed. Buckets live in process memory,
+so with several worker processes each one enforces the limit separately.
+Requests answered by `RequestCoalescingMiddleware` with a copy of another
+request's response take a token from that request's bucket.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+class TokenBucketThrottle(BaseThrottle):
+    # Least recently used buckets are dropped beyond this many
+    MAX_BUCKETS = 100000
+
+    buckets = OrderedDict()
+    lock = threading.Lock()
+    parsed_rates = {}
+
+    def __init__(self):
+        self.retry_after = None
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.buckets.clear()
+
+    def get_rate(self, view_name, scope):
+        """
+        Return (capacity, tokens per second) for the scope, or None when unlimited.
+        """
+        rates = api_settings.DEFAULT_THROTTLE_RATES or {}
+        rate = rates.get(f"{view_name}.{scope}", rates.get(scope))
+        if rate is None:
+            return None
+        if rate not in self.parsed_rates:
+            # Same format as DRF's rate throttles, e.g. '100/min' or '5/second'
+            num, period = rate.split('/')
+            duration = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+            self.parsed_rates[rate] = (int(num), int(num) / duration)
+        return self.parsed_rates[rate]
+
+    def allow_request(self, request, view):
+        view_name = type(view).__name__
+        scope = 'read' if request.method in SAFE_METHODS else 'write'
+        rate = self.get_rate(view_name, scope)
+        if rate is None:
+            return True
+        client = f"token:{request.auth.key}" if hasattr(request.auth, 'key') else f"addr:{self.get_ident(request)}"
+        key = (client, view_name, scope)
+        # Requests that request coalescing answers with a copy of this response are charged here too
+        request._request.throttle_bucket = (key, rate)
+        return self.take(key, rate)
+
+    def take(self, key, rate):
+        """
+        Take a token from bucket `key`, whose rate is (capacity, tokens per
+        second). Returns False, and sets `retry_after`, when it is empty.
+        """
+        capacity, refill_rate = rate
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                self.retry_after = (1 - tokens) / refill_rate
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            if len(self.buckets) > self.MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
@@ -5,17 +5,37 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from rest_framework.permissions import AllowAny
-from .serializers import VendorSerializer, PurchaseOrderSerializer
+from .serializers import (
+    VendorSerializer, PurchaseOrderSerializer, ArchivedPurchaseOrderSerializer, HistoricalPerformanceSerializer,
+    ReportJobSerializer,
+)
 from rest_framework.permissions import IsAuthenticated
 
 #### Calculation Imports
+import datetime
+import heapq
+import threading
+import time
+from collections import Counter
+from contextlib import ContextDecorator
+from itertools import islice
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse
 from django.utils import timezone
-from django.db.models import Avg, F, ExpressionWrapper, DurationField
-from django.db.models.signals import post_save
+from django.db.models import Count, Sum, F, Q, Case, When, Value, Window, ExpressionWrapper, DurationField, Prefetch
+from django.db.models.functions import RowNumber
+from django.db import connections, transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 #### Models Imports
-from .models import Vendor, PurchaseOrder, HistoricalPerformance
+from .models import (
+    Vendor, PurchaseOrder, ArchivedPurchaseOrder, VendorArchiveTotals, HistoricalPerformance, ChangeLogEntry,
+    WebhookEvent, ReportJob,
+)
+from . import analytics, importers, reports, search, sharding
+from .sketches import TDigest, merge_digests
 
 class LoginAPIView(APIView):
     # Allow any user (authenticated or not) to access this view
@@ -48,12 +68,57 @@ class LoginAPIView(APIView):
     
     
     
+METRIC_FILTER_LOOKUPS = ('gt', 'gte', 'lt', 'lte')
+VENDOR_ORDERING_FIELDS = ('id', 'name') + Vendor.METRIC_FIELDS
+
+
+def filter_and_order_vendors(vendors, query_params):
+    """
+    Apply metric range filters such as `quality_rating_avg__gte=4` and an
+    `ordering` such as `-on_time_delivery_rate,average_response_time`.
+    Returns a Response when a parameter is invalid.
+    """
+    filters = {}
+    for param, value in query_params.items():
+        field, _, lookup = param.partition('__')
+        if field not in Vendor.METRIC_FIELDS:
+            continue
+        if lookup not in METRIC_FILTER_LOOKUPS:
+            return Response(
+                {'error': f"Unsupported filter '{param}'. Use one of: {', '.join(METRIC_FILTER_LOOKUPS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            filters[param] = float(value)
+        except ValueError:
+            return Response({'error': f"'{param}' must be a number."}, status=status.HTTP_400_BAD_REQUEST)
+
+    ordering = [field.strip() for field in query_params.get('ordering', '').split(',') if field.strip()]
+    for field in ordering:
+        if field.lstrip('-') not in VENDOR_ORDERING_FIELDS:
+            return Response(
+                {'error': f"Cannot order by '{field}'. Use one of: {', '.join(VENDOR_ORDERING_FIELDS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    if ordering:
+        # Break ties on the primary key so pages are stable
+        vendors = vendors.order_by(*ordering, 'id')
+    return vendors.filter(**filters)
+
+
 class VendorListCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        vendors = Vendor.objects.all()
-        serializer = VendorSerializer(vendors, many=True)
+        if 'ids' in request.query_params:
+            return get_batch_details(request, Vendor.objects.all(), VendorSerializer, 'Vendor not found')
+        per_shard = []
+        for shard in sharding.get_shards():
+            vendors = filter_and_order_vendors(Vendor.objects.using(shard).all(), request.query_params)
+            if isinstance(vendors, Response):
+                return vendors
+            per_shard.append(vendors)
+        serializer = VendorSerializer(sharding.merge_ordered(per_shard), many=True)
         return Response(serializer.data)
 
     def post(self, request):
@@ -64,12 +129,33 @@ class VendorListCreateAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     
+class VendorImportAPIView(APIView):
+    """
+    Create vendors in bulk from a CSV (`text/csv`, with a header row) or
+    NDJSON (`application/x-ndjson`) request body. The body is read line by
+    line and imported in chunks, so large files are never held in memory.
+    """
+    permission_classes = [IsAuthenticated]
+    CONTENT_TYPES = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson', 'application/jsonl': 'ndjson'}
+
+    def post(self, request):
+        data_format = self.CONTENT_TYPES.get(request.content_type.split(';')[0].strip())
+        if data_format is None:
+            return Response(
+                {'error': f"Content-Type must be one of: {', '.join(self.CONTENT_TYPES)}."},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+        lines = (line.decode('utf-8-sig') for line in request._request)
+        summary = importers.import_vendors(importers.iter_records(lines, data_format))
+        return Response(summary, status=status.HTTP_200_OK)
+
+
 class VendorDetailAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self, vendor_id):
         try:
-            return Vendor.objects.get(pk=vendor_id)
+            return Vendor.objects.using(sharding.shard_for_vendor(vendor_id)).get(pk=vendor_id)
         except Vendor.DoesNotExist:
             return Response({'error': 'Vendor not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -80,33 +166,203 @@ class VendorDetailAPIView(APIView):
         serializer = VendorSerializer(vendor)
         return Response(serializer.data)
 
-    def put(self, request, vendor_id):
+    def put(self, request, vendor_id, partial=False):
         vendor = self.get_object(vendor_id)
         if isinstance(vendor, Response):
             return vendor
-        serializer = VendorSerializer(vendor, data=request.data)
+        serializer = VendorSerializer(vendor, data=request.data, partial=partial)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def patch(self, request, vendor_id):
+        return self.put(request, vendor_id, partial=True)
+
     def delete(self, request, vendor_id):
         vendor = self.get_object(vendor_id)
         if isinstance(vendor, Response):
             return vendor
-        vendor.delete()
+        # Deleting a large order history at once would hold the write lock for
+        # too long; `purge_deleted_vendors` removes it in chunks later
+        vendor.soft_delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+def get_bounded_int_param(request, name, default, maximum):
+    """
+    Read an optional positive integer query parameter capped at `maximum`.
+    Returns a Response when it is invalid.
+    """
+    try:
+        value = int(request.query_params.get(name, default))
+    except ValueError:
+        return Response({'error': f'{name} must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= value <= maximum:
+        return Response({'error': f'{name} must be between 1 and {maximum}.'}, status=status.HTTP_400_BAD_REQUEST)
+    return value
+
+
+class VendorOverviewAPIView(APIView):
+    """
+    Everything a vendor page needs in one request: the vendor, its most recent
+    purchase orders, purchase order counts by status and its recent daily
+    performance. Uses the same number of queries whatever the vendor's size.
+    """
+    permission_classes = [IsAuthenticated]
+    DEFAULT_ORDERS = 10
+    DEFAULT_HISTORY = 30
+    MAX_ORDERS = 100
+    MAX_HISTORY = 365
+
+    def get(self, request, vendor_id):
+        orders_limit = get_bounded_int_param(request, 'orders', self.DEFAULT_ORDERS, self.MAX_ORDERS)
+        if isinstance(orders_limit, Response):
+            return orders_limit
+        history_limit = get_bounded_int_param(request, 'history', self.DEFAULT_HISTORY, self.MAX_HISTORY)
+        if isinstance(history_limit, Response):
+            return history_limit
+
+        vendors = Vendor.objects.using(sharding.shard_for_vendor(vendor_id)).select_related('archive_totals').prefetch_related(
+            Prefetch(
+                'purchase_orders',
+                queryset=PurchaseOrder.objects.order_by('-order_date', '-id')[:orders_limit],
+                to_attr='recent_purchase_orders'
+            ),
+            Prefetch(
+                'historical_performances',
+                queryset=HistoricalPerformance.objects.order_by('-date')[:history_limit],
+                to_attr='recent_performance'
+            ),
+        )
+        vendor = get_object_or_404(vendors, pk=vendor_id)
+
+        status_counts = {
+            value: Count('id', filter=Q(status=value))
+            for value, _ in PurchaseOrder._meta.get_field('status').choices
+        }
+        counts = vendor.purchase_orders.aggregate(
+            total=Count('id'),
+            awaiting_acknowledgment=Count('id', filter=Q(status='pending', acknowledgment_date__isnull=True)),
+            **status_counts
+        )
+        # Archived orders are all closed
+        archived = get_archive_totals(vendor)
+        counts['total'] += archived.orders
+        counts['completed'] += archived.completed_orders
+        counts['canceled'] += archived.orders - archived.completed_orders
+
+        data = {
+            'vendor': VendorSerializer(vendor).data,
+            'recent_purchase_orders': PurchaseOrderSerializer(vendor.recent_purchase_orders, many=True).data,
+            'purchase_order_counts': counts,
+            'performance_history': HistoricalPerformanceSerializer(vendor.recent_performance, many=True).data,
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+
+MAX_BATCH_IDS = 100
+
+
+def get_batch_ids(request):
+    """
+    Read the comma separated `ids` query parameter of the batch endpoints,
+    without duplicates and in the requested order. Returns a Response when it is invalid.
+    """
+    values = [value.strip() for value in request.query_params.get('ids', '').split(',') if value.strip()]
+    if not values or not all(value.isdigit() for value in values):
+        return Response({'error': 'ids must be a comma separated list of integers.'}, status=status.HTTP_400_BAD_REQUEST)
+    ids = list(dict.fromkeys(int(value) for value in values))
+    if len(ids) > MAX_BATCH_IDS:
+        return Response({'error': f'At most {MAX_BATCH_IDS} ids can be requested at once.'}, status=status.HTTP_400_BAD_REQUEST)
+    return ids
+
+
+def get_batch_details(request, queryset, serializer_class, not_found_message):
+    """
+    Detail representations of the objects in `?ids=` from one `IN` query per
+    shard. Ids that do not exist get an error entry instead.
+    """
+    ids = get_batch_ids(request)
+    if isinstance(ids, Response):
+        return ids
+    found = sharding.in_bulk(queryset, ids)
+    results = [
+        {'id': pk, 'data': serializer_class(found[pk]).data} if pk in found else {'id': pk, 'error': not_found_message}
+        for pk in ids
+    ]
+    return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+def get_search_params(request):
+    """
+    Read the `q` and `limit` query parameters shared by the search endpoints.
+    Returns a Response when they are invalid.
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'The q parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = get_bounded_int_param(request, 'limit', search.DEFAULT_LIMIT, search.MAX_LIMIT)
+    if isinstance(limit, Response):
+        return limit
+    return query, limit
+
+
+class VendorSearchAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = get_search_params(request)
+        if isinstance(params, Response):
+            return params
+        query, limit = params
+        vendor_ids = search.search_vendor_ids(query, limit=limit)
+        vendors = sharding.in_bulk(Vendor.objects.all(), vendor_ids)
+        # Keep the ranking returned by the search index
+        serializer = VendorSerializer([vendors[pk] for pk in vendor_ids if pk in vendors], many=True)
+        return Response(serializer.data)
+
+
+def get_include_archived(request):
+    """
+    Whether `?include_archived=` asks for archived purchase orders as well,
+    or a 400 response when its value is not a boolean.
+    """
+    value = request.query_params.get('include_archived', 'false').lower()
+    if value not in ('true', 'false', '1', '0'):
+        return Response({'error': 'include_archived must be true or false.'}, status=status.HTTP_400_BAD_REQUEST)
+    return value in ('true', '1')
+
+
+def serialize_purchase_order(purchase_order):
+    if isinstance(purchase_order, ArchivedPurchaseOrder):
+        return ArchivedPurchaseOrderSerializer(purchase_order).data
+    return PurchaseOrderSerializer(purchase_order).data
+
+
 class PurchaseOrderListCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
+        if 'ids' in request.query_params:
+            return get_batch_details(request, PurchaseOrder.objects.live(), PurchaseOrderSerializer, 'Purchase order not found')
+        include_archived = get_include_archived(request)
+        if isinstance(include_archived, Response):
+            return include_archived
         vendor_id = request.query_params.get('vendor_id', None)
         if vendor_id:
-            purchase_orders = PurchaseOrder.objects.filter(vendor__id=vendor_id)
+            if not vendor_id.isdigit():
+                return Response({'error': 'vendor_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+            shards = [sharding.shard_for_vendor(vendor_id)]
         else:
-            purchase_orders = PurchaseOrder.objects.all()
+            shards = sharding.get_shards()
+        models = (PurchaseOrder, ArchivedPurchaseOrder) if include_archived else (PurchaseOrder,)
+        querysets = [model.objects.using(shard).live() for model in models for shard in shards]
+        if vendor_id:
+            querysets = [queryset.filter(vendor__id=vendor_id) for queryset in querysets]
+        purchase_orders = sharding.merge_ordered(querysets)
+        if include_archived:
+            return Response([serialize_purchase_order(purchase_order) for purchase_order in purchase_orders])
         serializer = PurchaseOrderSerializer(purchase_orders, many=True)
         return Response(serializer.data)
 
@@ -123,177 +379,954 @@ class PurchaseOrderDetailAPIView(APIView):
 
     def get_object(self, po_id):
         try:
-            return PurchaseOrder.objects.get(pk=po_id)
+            return PurchaseOrder.objects.using(sharding.shard_for_id(po_id)).live().get(pk=po_id)
         except PurchaseOrder.DoesNotExist:
             return Response({'error': 'Purchase order not found'}, status=status.HTTP_404_NOT_FOUND)
 
     def get(self, request, po_id):
+        include_archived = get_include_archived(request)
+        if isinstance(include_archived, Response):
+            return include_archived
         purchase_order = self.get_object(po_id)
+        if isinstance(purchase_order, Response) and include_archived:
+            # Archived orders keep their id, so they are on the same shard
+            archived = ArchivedPurchaseOrder.objects.using(sharding.shard_for_id(po_id)).live().filter(pk=po_id).first()
+            if archived is not None:
+                return Response(ArchivedPurchaseOrderSerializer(archived).data)
         if isinstance(purchase_order, Response):
             return purchase_order
         serializer = PurchaseOrderSerializer(purchase_order)
         return Response(serializer.data)
 
-    def put(self, request, po_id):
+    def put(self, request, po_id, partial=False):
         purchase_order = self.get_object(po_id)
         if isinstance(purchase_order, Response):
             return purchase_order
-        serializer = PurchaseOrderSerializer(purchase_order, data=request.data)
+        serializer = PurchaseOrderSerializer(purchase_order, data=request.data, partial=partial)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def patch(self, request, po_id):
+        return self.put(request, po_id, partial=True)
+
     def delete(self, request, po_id):
         purchase_order = self.get_object(po_id)
         if isinstance(purchase_order, Response):
             return purchase_order
         purchase_order.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class PurchaseOrderSearchAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = get_search_params(request)
+        if isinstance(params, Response):
+            return params
+        query, limit = params
+        vendor_id = request.query_params.get('vendor_id', None)
+        if vendor_id is not None and not vendor_id.isdigit():
+            return Response({'error': 'vendor_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        po_ids = search.search_purchase_order_ids(
+            query, vendor_id=int(vendor_id) if vendor_id else None, limit=limit
+        )
+        purchase_orders = sharding.in_bulk(PurchaseOrder.objects.live(), po_ids)
+        serializer = PurchaseOrderSerializer([purchase_orders[pk] for pk in po_ids if pk in purchase_orders], many=True)
+        return Response(serializer.data)
     
     
+def get_archive_totals(vendor):
+    """
+    The totals of a vendor's archived purchase orders, all zero when none
+    are archived. Cached on the vendor instance.
+    """
+    try:
+        return vendor.archive_totals
+    except VendorArchiveTotals.DoesNotExist:
+        return VendorArchiveTotals(vendor_id=vendor.pk)
+
+
 def calculate_on_time_delivery_rate(vendor):
     """
     Calculate and update the on-time delivery rate for a vendor.
     """
-    total_delivered_on_time = PurchaseOrder.objects.filter(vendor=vendor, status='completed', delivery_date__lte=F('order_date')).count()
-    total_completed = PurchaseOrder.objects.filter(vendor=vendor, status='completed').count()
+    archived = get_archive_totals(vendor)
+    total_delivered_on_time = vendor.purchase_orders.filter(status='completed', was_on_time=True).count() + archived.on_time_orders
+    total_completed = vendor.purchase_orders.filter(status='completed').count() + archived.completed_orders
     if total_completed > 0:
         on_time_delivery_rate = (total_delivered_on_time / total_completed) * 100
         vendor.on_time_delivery_rate = on_time_delivery_rate
-        vendor.save()
+        vendor.save(update_fields=['on_time_delivery_rate'])
 
 def calculate_quality_rating_average(vendor):
     """
     Calculate and update the average quality rating for completed POs of a vendor.
     """
-    quality_ratings = PurchaseOrder.objects.filter(
-        vendor=vendor, 
+    archived = get_archive_totals(vendor)
+    quality_ratings = vendor.purchase_orders.filter(
         status='completed', 
         quality_rating__isnull=False
-    ).aggregate(Avg('quality_rating'))
-    vendor.quality_rating_avg = quality_ratings['quality_rating__avg'] or 0
-    vendor.save()
+    ).aggregate(total=Sum('quality_rating'), count=Count('id'))
+    count = quality_ratings['count'] + archived.rated_orders
+    vendor.quality_rating_avg = ((quality_ratings['total'] or 0) + archived.quality_rating_sum) / count if count else 0
+    vendor.save(update_fields=['quality_rating_avg'])
 
 def calculate_average_response_time(vendor):
     """
     Calculate and update the average response time for acknowledged POs of a vendor.
     """
-    response_times = PurchaseOrder.objects.filter(vendor=vendor, acknowledgment_date__isnull=False).annotate(
+    archived = get_archive_totals(vendor)
+    response_times = vendor.purchase_orders.filter(acknowledgment_date__isnull=False).annotate(
         response_time=ExpressionWrapper(F('acknowledgment_date') - F('issue_date'), output_field=DurationField())
-    ).aggregate(avg_response_time=Avg('response_time'))
-    if response_times['avg_response_time']:
-        vendor.average_response_time = response_times['avg_response_time'].total_seconds() / 3600
-        vendor.save()
+    ).aggregate(total=Sum('response_time'), count=Count('id'))
+    count = response_times['count'] + archived.acknowledged_orders
+    total = (response_times['total'].total_seconds() / 3600 if response_times['total'] else 0) + archived.response_time_sum
+    if count and total:
+        vendor.average_response_time = total / count
+        vendor.save(update_fields=['average_response_time'])
+
+def record_response_time(purchase_order):
+    """
+    Add a newly acknowledged purchase order's latency to its vendor's response
+    time digest and to the digest of today's performance record. Called by
+    the `record_acknowledgment` signal.
+    """
+    hours = max((purchase_order.acknowledgment_date - purchase_order.issue_date).total_seconds() / 3600, 0.0)
+    using = purchase_order._state.db
+    with transaction.atomic(using=using):
+        # Writing today's record first makes sure it exists and, on SQLite,
+        # takes the write lock before the reads below
+        update_or_create_daily_performance(purchase_order.vendor_id)
+        vendor = Vendor.all_objects.using(using).select_for_update().get(pk=purchase_order.vendor_id)
+        historical_record = HistoricalPerformance.objects.using(using).select_for_update().get(
+            vendor_id=purchase_order.vendor_id, date=timezone.localdate()
+        )
+        for record in (vendor, historical_record):
+            digest = TDigest.from_dict(record.response_time_digest)
+            digest.add(hours)
+            record.response_time_digest = digest.to_dict()
+            record.save(update_fields=['response_time_digest'])
+
 
 def calculate_fulfillment_rate(vendor):
     """
     Calculate and update the fulfillment rate for a vendor.
     """
-    total_fulfilled = PurchaseOrder.objects.filter(vendor=vendor, status='completed').count()
-    total_orders = PurchaseOrder.objects.filter(vendor=vendor).count()
+    archived = get_archive_totals(vendor)
+    total_fulfilled = vendor.purchase_orders.filter(status='completed').count() + archived.completed_orders
+    total_orders = vendor.purchase_orders.count() + archived.orders
     if total_orders > 0:
         fulfillment_rate = (total_fulfilled / total_orders) * 100
         vendor.fulfillment_rate = fulfillment_rate
-        vendor.save()
+        vendor.save(update_fields=['fulfillment_rate'])
+
+
+def calculate_vendor_metrics_bulk(vendor_ids=None):
+    """
+    Calculate the four vendor metrics for many vendors with one grouped
+    aggregate over purchase orders per shard, counting archived orders
+    through their vendor's archive totals. Returns a dict of vendor id to
+    metric values; vendors without any purchase orders are not included.
+    """
+    if vendor_ids is None:
+        targets = {shard: None for shard in sharding.get_shards()}
+    else:
+        targets = sharding.group_by_shard(vendor_ids)
+    metrics = {}
+    for shard, shard_vendor_ids in targets.items():
+        purchase_orders = PurchaseOrder.objects.using(shard).all()
+        archive_totals = VendorArchiveTotals.objects.using(shard).all()
+        if shard_vendor_ids is not None:
+            purchase_orders = purchase_orders.filter(vendor_id__in=shard_vendor_ids)
+            archive_totals = archive_totals.filter(vendor_id__in=shard_vendor_ids)
+        totals = calculate_order_totals(purchase_orders)
+        for archived in archive_totals:
+            vendor_totals = totals.setdefault(archived.vendor_id, dict.fromkeys(VendorArchiveTotals.TOTAL_FIELDS, 0))
+            for field in VendorArchiveTotals.TOTAL_FIELDS:
+                vendor_totals[field] += getattr(archived, field)
+        metrics.update({vendor_id: calculate_metrics_from_totals(vendor_totals) for vendor_id, vendor_totals in totals.items()})
+    return metrics
+
+
+def calculate_order_totals(purchase_orders):
+    """
+    Per vendor counts and sums the vendor metrics are calculated from, named
+    like the fields of `VendorArchiveTotals`. Works on archived orders too.
+    """
+    completed = Q(status='completed')
+    acknowledged = Q(acknowledgment_date__isnull=False)
+    rows = purchase_orders.values('vendor_id').annotate(
+        orders=Count('id'),
+        completed_orders=Count('id', filter=completed),
+        on_time_orders=Count('id', filter=completed & Q(was_on_time=True)),
+        rated_orders=Count('id', filter=completed & Q(quality_rating__isnull=False)),
+        quality_rating_sum=Sum('quality_rating', filter=completed),
+        acknowledged_orders=Count('id', filter=acknowledged),
+        response_time_sum=Sum(
+            ExpressionWrapper(F('acknowledgment_date') - F('issue_date'), output_field=DurationField()),
+            filter=acknowledged
+        ),
+    ).order_by()
+
+    totals = {}
+    for row in rows:
+        vendor_id = row.pop('vendor_id')
+        row['quality_rating_sum'] = row['quality_rating_sum'] or 0.0
+        row['response_time_sum'] = row['response_time_sum'].total_seconds() / 3600 if row['response_time_sum'] else 0.0
+        totals[vendor_id] = row
+    return totals
+
+
+def calculate_metrics_from_totals(totals):
+    return {
+        'on_time_delivery_rate': totals['on_time_orders'] / totals['completed_orders'] * 100 if totals['completed_orders'] else 0.0,
+        'quality_rating_avg': totals['quality_rating_sum'] / totals['rated_orders'] if totals['rated_orders'] else 0.0,
+        'average_response_time': totals['response_time_sum'] / totals['acknowledged_orders'] if totals['acknowledged_orders'] else 0.0,
+        'fulfillment_rate': totals['completed_orders'] / totals['orders'] * 100 if totals['orders'] else 0.0,
+    }
+
+
+def calculate_vendor_metrics_rows(purchase_orders):
+    """
+    The four vendor metrics of just these purchase orders, per vendor.
+    """
+    return {
+        vendor_id: calculate_metrics_from_totals(totals)
+        for vendor_id, totals in calculate_order_totals(purchase_orders).items()
+    }
+
+
+def refresh_vendor_metrics(vendor_ids):
+    """
+    Recalculate and store the metrics of the given vendors with one grouped
+    aggregate, for purchase orders written without `post_save` signals.
+    """
+    computed = calculate_vendor_metrics_bulk(vendor_ids)
+    no_orders = dict.fromkeys(Vendor.METRIC_FIELDS, 0.0)
+    for shard, shard_vendor_ids in sharding.group_by_shard(vendor_ids).items():
+        vendors = list(Vendor.objects.using(shard).filter(pk__in=shard_vendor_ids).only('id', *Vendor.METRIC_FIELDS))
+        for vendor in vendors:
+            for field, value in computed.get(vendor.id, no_orders).items():
+                setattr(vendor, field, value)
+        with transaction.atomic(using=shard):
+            Vendor.objects.using(shard).bulk_update(vendors, Vendor.METRIC_FIELDS)
+            record_changes(Vendor, [vendor.id for vendor in vendors], 'update', using=shard)
+            for vendor in vendors:
+                update_or_create_daily_performance(vendor.id)
+    # The summary averages vendor metrics
+    mark_dashboard_summary_dirty(Vendor)
+
+
+STATUS_UPDATE_BATCH_SIZE = 500
+
+
+def bulk_set_purchase_order_status(purchase_orders, new_status):
+    """
+    Move the pending orders among `purchase_orders` to `new_status` with
+    batched `UPDATE`s and do the bookkeeping the skipped `post_save`
+    receivers would have done, once per batch or per vendor instead of once
+    per order. Returns the number of updated orders.
+    """
+    now = timezone.now()
+    changes = {'status': new_status}
+    if new_status == 'completed':
+        changes['completed_at'] = now
+        changes['was_on_time'] = Case(When(delivery_date__gte=now, then=Value(True)), default=Value(False))
+
+    using = purchase_orders.db
+    with transaction.atomic(using=using):
+        rows = list(purchase_orders.filter(status='pending').order_by().values_list('id', 'vendor_id'))
+        ids = [pk for pk, _ in rows]
+        for start in range(0, len(ids), STATUS_UPDATE_BATCH_SIZE):
+            batch = ids[start:start + STATUS_UPDATE_BATCH_SIZE]
+            PurchaseOrder.objects.using(using).filter(id__in=batch, status='pending').update(**changes)
+            record_changes(PurchaseOrder, batch, 'update', using=using)
+            events = [
+                WebhookEvent(
+                    vendor_id=purchase_order.vendor_id, event_type='purchase_order.status_changed',
+                    payload={'purchase_order': PurchaseOrderSerializer(purchase_order).data, 'previous_status': 'pending'},
+                )
+                for purchase_order in PurchaseOrder.objects.using(using).filter(id__in=batch).exclude(vendor__webhook_url='')
+            ]
+            WebhookEvent.objects.using(using).bulk_create(events)
+        if rows:
+            refresh_vendor_metrics({vendor_id for _, vendor_id in rows})
+    if rows:
+        mark_dashboard_summary_dirty(PurchaseOrder)
+    return len(rows)
 
     
+# Purchase order fields each vendor metric is calculated from
+METRIC_DEPENDENCIES = {
+    'on_time_delivery_rate': {'status', 'was_on_time'},
+    'quality_rating_avg': {'status', 'quality_rating'},
+    'average_response_time': {'acknowledgment_date', 'issue_date'},
+    'fulfillment_rate': {'status'},
+}
+METRIC_CALCULATIONS = {
+    'on_time_delivery_rate': calculate_on_time_delivery_rate,
+    'quality_rating_avg': calculate_quality_rating_average,
+    'average_response_time': calculate_average_response_time,
+    'fulfillment_rate': calculate_fulfillment_rate,
+}
+# Today's performance record also depends on which orders were placed today
+DAILY_PERFORMANCE_DEPENDENCIES = set().union(*METRIC_DEPENDENCIES.values(), {'order_date', 'vendor'})
+
+
+def stale_vendor_metrics(purchase_order, created):
+    """
+    The vendor metrics a purchase order save may have changed.
+    """
+    if created:
+        stale = {'fulfillment_rate'}
+        if purchase_order.status == 'completed':
+            stale |= {'on_time_delivery_rate', 'quality_rating_avg'}
+        if purchase_order.acknowledgment_date:
+            stale.add('average_response_time')
+        return stale
+    changes = purchase_order.saved_changes
+    if changes is None or 'vendor' in changes:
+        return set(METRIC_DEPENDENCIES)
+    return {metric for metric, fields in METRIC_DEPENDENCIES.items() if fields & changes}
+
+
+def daily_performance_stale(purchase_order, created):
+    """
+    Whether a purchase order save may have changed today's performance record.
+    """
+    changes = purchase_order.saved_changes
+    return created or changes is None or bool(DAILY_PERFORMANCE_DEPENDENCIES & changes)
+
+
+# Vendors whose metrics wait for the outermost defer_vendor_metrics() block of this thread to end
+_deferred_metrics = threading.local()
+
+
+class DeferredVendorMetrics(ContextDecorator):
+    """
+    See `defer_vendor_metrics`.
+    """
+
+    def __enter__(self):
+        depth = getattr(_deferred_metrics, 'depth', 0)
+        if depth == 0:
+            _deferred_metrics.vendor_ids = set()
+        _deferred_metrics.depth = depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _deferred_metrics.depth -= 1
+        if _deferred_metrics.depth == 0:
+            vendor_ids, _deferred_metrics.vendor_ids = _deferred_metrics.vendor_ids, None
+            # Saves made before an error may have been committed, so refresh either way
+            if vendor_ids:
+                refresh_vendor_metrics(vendor_ids)
+        return False
+
+
+def defer_vendor_metrics(func=None):
+    """
+    Context manager, or decorator, for scripts and data migrations that save
+    many purchase orders through the ORM. Inside it, `update_vendor_metrics`
+    only notes the vendors whose metrics a save made stale; when the
+    outermost block exits, each of them is recalculated once with
+    `refresh_vendor_metrics`, along with today's performance record. Nested
+    blocks join the outermost one. Only saves in the current thread are
+    deferred.
+
+        with defer_vendor_metrics():
+            for row in rows:
+                PurchaseOrder.objects.create(**row)
+    """
+    if callable(func):
+        return DeferredVendorMetrics()(func)
+    return DeferredVendorMetrics()
+
+
 @receiver(post_save, sender=PurchaseOrder)
 def update_vendor_metrics(sender, instance, created, **kwargs):
     """
-    Signal to update vendor metrics whenever a Purchase Order is saved.
+    Signal to update the vendor metrics that depend on the fields a Purchase
+    Order save changed. Edits to other fields, such as items, skip it.
     """
-    if instance.status == 'completed':
-        # On-Time Delivery Rate and Quality Rating Average calculation
-        calculate_on_time_delivery_rate(instance.vendor)
-        if instance.quality_rating is not None:
-            calculate_quality_rating_average(instance.vendor)
+    stale = stale_vendor_metrics(instance, created)
+    deferred = getattr(_deferred_metrics, 'vendor_ids', None)
+    if deferred is not None:
+        if daily_performance_stale(instance, created):
+            deferred.add(instance.vendor_id)
+        if not created and 'vendor' in (instance.saved_changes or ()):
+            # The order also left its previous vendor
+            deferred.add(instance.loaded_value('vendor'))
+        return
+    for metric in stale:
+        METRIC_CALCULATIONS[metric](instance.vendor)
+    if daily_performance_stale(instance, created):
+        update_or_create_daily_performance(instance.vendor.id)
+    if not created and 'vendor' in (instance.saved_changes or ()):
+        # The order also left its previous vendor
+        previous_vendor = Vendor.objects.using(instance._state.db).filter(pk=instance.loaded_value('vendor')).first()
+        if previous_vendor is not None:
+            for calculate in METRIC_CALCULATIONS.values():
+                calculate(previous_vendor)
+            update_or_create_daily_performance(previous_vendor.id)
 
-    if instance.acknowledgment_date:
-        # Average Response Time calculation
-        calculate_average_response_time(instance.vendor)
 
-    # Fulfillment Rate is updated upon any status change
-    calculate_fulfillment_rate(instance.vendor)
-    update_or_create_daily_performance(instance.vendor.id)
-    
-def update_or_create_daily_performance(vendor_id):
-    # Check if the vendor exists
-    try:
-        vendor = Vendor.objects.get(pk=vendor_id)
-    except Vendor.DoesNotExist:
-        print("Vendor not found")
+@receiver(post_save, sender=PurchaseOrder)
+def record_acknowledgment(sender, instance, created, **kwargs):
+    """
+    Signal to add a purchase order's response time to the digests when it is
+    first acknowledged, whether by the acknowledge endpoint, the admin or
+    any other save.
+    """
+    if instance.acknowledgment_date is None:
         return
+    if created or (
+        'acknowledgment_date' in (instance.saved_changes or ())
+        and instance.loaded_value('acknowledgment_date') is None
+    ):
+        record_response_time(instance)
 
-    # Determine today's date
-    today = timezone.localdate()
 
-    # Fetch today's performance record, if it exists
-    historical_record, created = HistoricalPerformance.objects.get_or_create(
-        vendor=vendor,
-        date=today,
-        defaults={
-            'on_time_delivery_rate': 0,
-            'quality_rating_avg': 0,
-            'average_response_time': 0,
-            'fulfillment_rate': 0,
-        }
-    )
+@receiver(post_save, sender=Vendor)
+def index_vendor_for_search(sender, instance, using, **kwargs):
+    """
+    Signal to keep the vendor search index in sync with the vendor table.
+    """
+    if instance.deleted_at is not None:
+        search.remove_vendor(instance.pk, using=using)
+        return
+    if instance.saved_changes is not None and not instance.saved_changes & {'name', 'vendor_code', 'address'}:
+        return
+    search.index_vendor(instance, using=using)
 
-    # Calculate the metrics
-    orders = PurchaseOrder.objects.filter(vendor=vendor, order_date__date=today)
-    total_completed = orders.filter(status='completed').count()
 
-    if total_completed > 0:
-        on_time_delivery_rate = 100 * orders.filter(delivery_date__lte=F('order_date')).count() / total_completed
-        quality_rating_avg = orders.aggregate(avg_quality=Avg('quality_rating'))['avg_quality'] or 0
-
-        response_times = orders.filter(acknowledgment_date__isnull=False).annotate(
-            response_time=ExpressionWrapper(F('acknowledgment_date') - F('issue_date'), output_field=DurationField())
-        ).aggregate(avg_response_time=Avg('response_time'))
-        average_response_time = response_times['avg_response_time'].total_seconds() / 3600 if response_times['avg_response_time'] else 0
-
-        fulfillment_rate = 100 * orders.filter(vendor=vendor,status="completed").count() / total_completed
-
-        # Update the historical record with new data
-        historical_record.on_time_delivery_rate = on_time_delivery_rate
-        historical_record.quality_rating_avg = quality_rating_avg
-        historical_record.average_response_time = average_response_time
-        historical_record.fulfillment_rate = fulfillment_rate
-        historical_record.save()
-    else:
+@receiver(post_delete, sender=Vendor)
+def remove_vendor_from_search(sender, instance, using, **kwargs):
+    search.remove_vendor(instance.pk, using=using)
+
+
+@receiver(post_save, sender=PurchaseOrder)
+def index_purchase_order_for_search(sender, instance, using, **kwargs):
+    """
+    Signal to keep the purchase order search index in sync with the purchase order table.
+    """
+    if instance.saved_changes is not None and not instance.saved_changes & {'po_number', 'vendor'}:
         return
-        
-        
+    search.index_purchase_order(instance, using=using)
+
+
+@receiver(post_delete, sender=PurchaseOrder)
+def remove_purchase_order_from_search(sender, instance, using, **kwargs):
+    search.remove_purchase_order(instance.pk, using=using)
+
+
+# Today's figures are computed from the vendor's orders placed today by the
+# statement itself, so concurrent saves can neither collide on the
+# (vendor, date) pair nor overwrite each other's figures with stale ones.
+DAILY_PERFORMANCE_UPSERT = """
+    INSERT INTO {performance} (
+        vendor_id, date, on_time_delivery_rate, quality_rating_avg,
+        average_response_time, fulfillment_rate, response_time_digest,
+        period, completed_orders, rated_orders, acknowledged_orders
+    )
+    SELECT %s, %s,
+        CASE WHEN completed > 0 THEN 100.0 * on_time / completed ELSE 0 END,
+        CASE WHEN completed > 0 THEN COALESCE(quality_rating_avg, 0) ELSE 0 END,
+        CASE WHEN completed > 0 THEN COALESCE(average_response_time, 0) ELSE 0 END,
+        CASE WHEN completed > 0 THEN 100.0 ELSE 0 END,
+        '{{}}',
+        'day',
+        completed,
+        CASE WHEN completed > 0 THEN rated ELSE 0 END,
+        CASE WHEN completed > 0 THEN acknowledged ELSE 0 END
+    FROM (
+        SELECT
+            COUNT(CASE WHEN status = 'completed' THEN 1 END) AS completed,
+            COUNT(CASE WHEN status = 'completed' AND was_on_time THEN 1 END) AS on_time,
+            COUNT(quality_rating) AS rated,
+            COUNT(acknowledgment_date) AS acknowledged,
+            AVG(quality_rating) AS quality_rating_avg,
+            AVG(CASE WHEN acknowledgment_date IS NOT NULL THEN {response_hours} END) AS average_response_time
+        FROM {purchase_order}
+        WHERE vendor_id = %s AND order_date >= %s AND order_date < %s
+    ) AS stats
+    WHERE EXISTS (SELECT 1 FROM {vendor} WHERE id = %s)
+    ON CONFLICT (vendor_id, date) DO UPDATE SET
+        on_time_delivery_rate = excluded.on_time_delivery_rate,
+        quality_rating_avg = excluded.quality_rating_avg,
+        average_response_time = excluded.average_response_time,
+        fulfillment_rate = excluded.fulfillment_rate,
+        completed_orders = excluded.completed_orders,
+        rated_orders = excluded.rated_orders,
+        acknowledged_orders = excluded.acknowledged_orders
+"""
+# Acknowledgment latency in hours; SQLite's julianday() is precise to the millisecond
+RESPONSE_HOURS_SQL = {
+    'sqlite': "(julianday(acknowledgment_date) - julianday(issue_date)) * 24",
+    'postgresql': "EXTRACT(EPOCH FROM acknowledgment_date - issue_date) / 3600",
+}
+
+
+def update_or_create_daily_performance(vendor_id):
+    """
+    Write the vendor's performance record for today with one atomic
+    `INSERT ... ON CONFLICT DO UPDATE`. Does nothing for unknown vendors.
+    """
+    connection = connections[sharding.shard_for_vendor(vendor_id)]
+    today = timezone.localdate()
+    start = timezone.make_aware(datetime.datetime.combine(today, datetime.time()))
+    end = timezone.make_aware(datetime.datetime.combine(today + datetime.timedelta(days=1), datetime.time()))
+    sql = DAILY_PERFORMANCE_UPSERT.format(
+        performance=connection.ops.quote_name(HistoricalPerformance._meta.db_table),
+        purchase_order=connection.ops.quote_name(PurchaseOrder._meta.db_table),
+        vendor=connection.ops.quote_name(Vendor._meta.db_table),
+        response_hours=RESPONSE_HOURS_SQL[connection.vendor],
+    )
+    params = [
+        vendor_id, connection.ops.adapt_datefield_value(today),
+        vendor_id, connection.ops.adapt_datetimefield_value(start), connection.ops.adapt_datetimefield_value(end),
+        vendor_id,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def get_performance_data(performance):
+    """
+    The figures of one daily performance record as returned by the performance endpoints.
+    """
+    return {
+        'on_time_delivery_rate': performance.on_time_delivery_rate,
+        'quality_rating_avg': performance.quality_rating_avg,
+        'average_response_time': performance.average_response_time,
+        'fulfillment_rate': performance.fulfillment_rate,
+        'response_time_percentiles': TDigest.from_dict(performance.response_time_digest).percentiles(),
+    }
+
+
 class VendorPerformanceAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, vendor_id):
-        vendor = get_object_or_404(Vendor, pk=vendor_id)
+        vendor = get_object_or_404(Vendor.objects.using(sharding.shard_for_vendor(vendor_id)), pk=vendor_id)
+        if 'start' in request.query_params or 'end' in request.query_params:
+            return self.get_response_time_range(request, vendor)
         today = timezone.localdate()
-        performance = HistoricalPerformance.objects.filter(vendor=vendor, date=today).first()
+        performance = vendor.historical_performances.filter(date=today).first()
 
         if performance:
-            data = {
-                'on_time_delivery_rate': performance.on_time_delivery_rate,
-                'quality_rating_avg': performance.quality_rating_avg,
-                'average_response_time': performance.average_response_time,
-                'fulfillment_rate': performance.fulfillment_rate
-            }
-            return Response(data, status=status.HTTP_200_OK)
+            return Response(get_performance_data(performance), status=status.HTTP_200_OK)
         else:
             return Response({'error': 'No performance data available for today.'}, status=status.HTTP_404_NOT_FOUND)
+
+    def get_response_time_range(self, request, vendor):
+        """
+        Response time percentiles over a date range, merged from the daily digests.
+        """
+        today = timezone.localdate()
+        try:
+            start = datetime.date.fromisoformat(request.query_params.get('start', today.isoformat()))
+            end = datetime.date.fromisoformat(request.query_params.get('end', today.isoformat()))
+        except ValueError:
+            return Response({'error': 'start and end must be dates in YYYY-MM-DD format.'}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response({'error': 'start must not be after end.'}, status=status.HTTP_400_BAD_REQUEST)
+        # Weekly and monthly rollups of old records count in full when they overlap the range
+        digests = vendor.historical_performances.overlapping(start, end).values_list('response_time_digest', flat=True)
+        digest = merge_digests(digests)
+        data = {
+            'start': start,
+            'end': end,
+            'acknowledged_orders': digest.count,
+            'response_time_percentiles': digest.percentiles(),
+        }
+        return Response(data, status=status.HTTP_200_OK)
         
         
+class VendorBatchPerformanceAPIView(APIView):
+    """
+    Today's performance and recent daily history of many vendors at once.
+    Vendors and their history are read with one `IN` query each per shard;
+    ids that do not exist get an error entry instead of failing the request.
+    """
+    permission_classes = [IsAuthenticated]
+    DEFAULT_HISTORY = 30
+    MAX_HISTORY = 365
+
+    def get(self, request):
+        ids = get_batch_ids(request)
+        if isinstance(ids, Response):
+            return ids
+        history_limit = get_bounded_int_param(request, 'history', self.DEFAULT_HISTORY, self.MAX_HISTORY)
+        if isinstance(history_limit, Response):
+            return history_limit
+
+        found = set()
+        history = {}
+        for shard, shard_ids in sharding.group_by_shard(ids).items():
+            found.update(Vendor.objects.using(shard).filter(pk__in=shard_ids).values_list('id', flat=True))
+            # The most recent `history_limit` records of each vendor
+            records = HistoricalPerformance.objects.using(shard).filter(vendor_id__in=shard_ids).annotate(
+                position=Window(RowNumber(), partition_by=F('vendor_id'), order_by=F('date').desc())
+            ).filter(position__lte=history_limit).order_by('vendor_id', '-date')
+            for record in records:
+                history.setdefault(record.vendor_id, []).append(record)
+
+        today = timezone.localdate()
+        results = []
+        for pk in ids:
+            if pk not in found:
+                results.append({'id': pk, 'error': 'Vendor not found'})
+                continue
+            records = history.get(pk, [])
+            results.append({
+                'id': pk,
+                'performance': get_performance_data(records[0]) if records and records[0].date == today else None,
+                'history': HistoricalPerformanceSerializer(records, many=True).data,
+            })
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+class VendorScoresAPIView(APIView):
+    """
+    What-if scoring of all vendors from the in-memory purchase order snapshot,
+    e.g. with a different on-time tolerance or a weighted composite score.
+    """
+    permission_classes = [IsAuthenticated]
+    DEFAULT_LIMIT = 100
+    MAX_LIMIT = 1000
+
+    def get(self, request):
+        limit = get_bounded_int_param(request, 'limit', self.DEFAULT_LIMIT, self.MAX_LIMIT)
+        if isinstance(limit, Response):
+            return limit
+        tolerance = request.query_params.get('on_time_tolerance', None)
+        weights = {}
+        try:
+            if tolerance is not None:
+                tolerance = datetime.timedelta(hours=float(tolerance))
+            for item in filter(None, request.query_params.get('weights', '').split(',')):
+                metric, weight = item.split(':')
+                weights[metric.strip()] = float(weight)
+        except ValueError:
+            return Response(
+                {'error': 'on_time_tolerance must be a number of hours and weights a list of metric:weight pairs.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        unknown = set(weights) - set(Vendor.METRIC_FIELDS)
+        if unknown:
+            return Response({'error': f"Unknown metrics: {', '.join(sorted(unknown))}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        snapshot = analytics.get_snapshot()
+        scores = analytics.score_vendors(snapshot, on_time_tolerance=tolerance, composites={'score': weights} if weights else None)
+        if weights:
+            vendor_ids = sorted(scores, key=lambda vendor_id: (-scores[vendor_id]['score'], vendor_id))
+        else:
+            vendor_ids = sorted(scores)
+        return Response({
+            'snapshot_at': snapshot.refreshed_at,
+            'purchase_orders': int(snapshot.live().sum()),
+            'results': [{'vendor_id': vendor_id, **scores[vendor_id]} for vendor_id in vendor_ids[:limit]],
+        }, status=status.HTTP_200_OK)
+
+
+CHANGE_LOG_MODELS = {Vendor: 'vendor', PurchaseOrder: 'purchase_order'}
+
+
+def record_changes(model, object_ids, action, using='default'):
+    """
+    Append change log entries for rows written without signals, e.g. by
+    `bulk_create` or `bulk_update`.
+    """
+    label = CHANGE_LOG_MODELS[model]
+    ChangeLogEntry.objects.using(using).bulk_create(
+        [ChangeLogEntry(model=label, object_id=pk, action=action) for pk in object_ids]
+    )
+
+
+@receiver(post_save, sender=Vendor)
+@receiver(post_save, sender=PurchaseOrder)
+def log_saved_change(sender, instance, created, using, **kwargs):
+    """
+    Signal to append a change log entry in the transaction of the save.
+    """
+    if created:
+        action = 'create'
+    elif sender is Vendor and 'deleted_at' in instance.saved_changes and instance.deleted_at is not None:
+        # A soft delete is a delete for change feed clients
+        action = 'delete'
+    else:
+        action = 'update'
+    ChangeLogEntry.objects.using(using).create(model=CHANGE_LOG_MODELS[sender], object_id=instance.pk, action=action)
+
+
+@receiver(post_delete, sender=Vendor)
+@receiver(post_delete, sender=PurchaseOrder)
+def log_deleted_change(sender, instance, using, **kwargs):
+    ChangeLogEntry.objects.using(using).create(
+        model=CHANGE_LOG_MODELS[sender], object_id=instance.pk, action='delete'
+    )
+
+
+@receiver(post_save, sender=PurchaseOrder)
+def enqueue_webhook_events(sender, instance, created, using, **kwargs):
+    """
+    Signal to add purchase order events to the webhook outbox. Delivery is
+    left to the `send_webhooks` worker so no vendor HTTP call happens here.
+    """
+    previous_status = instance.loaded_value('status')
+    if created:
+        event_type = 'purchase_order.created'
+    elif 'status' in (instance.saved_changes or ()):
+        event_type = 'purchase_order.status_changed'
+    else:
+        return
+    if not instance.vendor.webhook_url:
+        return
+    payload = {'purchase_order': PurchaseOrderSerializer(instance).data}
+    if event_type == 'purchase_order.status_changed':
+        payload['previous_status'] = previous_status
+    WebhookEvent.objects.using(using).create(vendor_id=instance.vendor_id, event_type=event_type, payload=payload)
+
+
+class ChangeFeedAPIView(APIView):
+    """
+    Page through the change log after a cursor. Entries for the same object
+    within a page are collapsed into one that carries its current state.
+    With several vendor shards the cursor holds one position per shard,
+    joined with dots, and entries are merged in order of their change time.
+    """
+    permission_classes = [IsAuthenticated]
+    DEFAULT_LIMIT = 500
+    MAX_LIMIT = 5000
+    SERIALIZERS = {'vendor': (Vendor, VendorSerializer), 'purchase_order': (PurchaseOrder, PurchaseOrderSerializer)}
+
+    def parse_cursor(self, since, shards):
+        positions = since.split('.')
+        if not all(position.isdigit() for position in positions):
+            return None
+        if positions == ['0']:
+            return dict.fromkeys(shards, 0)
+        if len(positions) != len(shards):
+            return None
+        return dict(zip(shards, map(int, positions)))
+
+    def get(self, request):
+        shards = sharding.get_shards()
+        positions = self.parse_cursor(request.query_params.get('since', '0'), shards)
+        if positions is None:
+            return Response({'error': 'since must be a cursor returned by this endpoint.'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = get_bounded_int_param(request, 'limit', self.DEFAULT_LIMIT, self.MAX_LIMIT)
+        if isinstance(limit, Response):
+            return limit
+
+        model = request.query_params.get('model', None)
+        if model is not None and model not in self.SERIALIZERS:
+            return Response({'error': f"model must be one of: {', '.join(self.SERIALIZERS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        per_shard = []
+        for shard, position in positions.items():
+            entries = ChangeLogEntry.objects.using(shard).filter(id__gt=position).order_by('id')
+            if model is not None:
+                entries = entries.filter(model=model)
+            per_shard.append(list(entries[:limit + 1]))
+        has_more = sum(map(len, per_shard)) > limit
+        entries = per_shard[0][:limit] if len(per_shard) == 1 else list(
+            islice(heapq.merge(*per_shard, key=lambda entry: entry.changed_at), limit)
+        )
+        for entry in entries:
+            positions[entry._state.db] = max(positions[entry._state.db], entry.id)
+
+        latest = {}
+        for entry in entries:
+            key = (entry.model, entry.object_id)
+            # A create followed by updates in the same page is still a create for the client
+            action = 'create' if key in latest and latest[key]['action'] == 'create' and entry.action == 'update' else entry.action
+            latest.pop(key, None)
+            latest[key] = {
+                'cursor': entry.id, 'model': entry.model, 'object_id': entry.object_id,
+                'action': action, 'changed_at': entry.changed_at, 'data': None,
+            }
+
+        for label, (model_class, serializer_class) in self.SERIALIZERS.items():
+            ids = [object_id for (entry_model, object_id), change in latest.items()
+                   if entry_model == label and change['action'] not in ('delete', 'archive')]
+            for pk, obj in sharding.in_bulk(model_class.objects.all(), ids).items():
+                latest[(label, pk)]['data'] = serializer_class(obj).data
+
+        data = {
+            'results': list(latest.values()),
+            'next_cursor': '.'.join(str(position) for position in positions.values()),
+            'has_more': has_more,
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+
+DASHBOARD_SUMMARY_CACHE_KEY = 'vendor:dashboard-summary'
+DASHBOARD_SUMMARY_DIRTY_KEY = 'vendor:dashboard-summary:dirty'
+DASHBOARD_SUMMARY_LOCK_KEY = 'vendor:dashboard-summary:lock'
+# Longest a recalculation may hold the lock, in case its process dies
+DASHBOARD_SUMMARY_LOCK_SECONDS = 60
+
+
+def calculate_dashboard_summary():
+    """
+    Calculate the global procurement figures shown on the ops dashboard with
+    one aggregate over purchase orders, one over the archive totals of
+    archived orders and one over vendors on each shard.
+    """
+    now = timezone.now()
+    pending = Q(status='pending')
+    status_counts = {
+        value: Count('id', filter=Q(status=value))
+        for value, _ in PurchaseOrder._meta.get_field('status').choices
+    }
+    purchase_orders = Counter()
+    vendor_sums = Counter()
+    # Sums and counts add up across shards; averages are taken at the end
+    for shard in sharding.get_shards():
+        purchase_orders.update(PurchaseOrder.objects.using(shard).live().aggregate(
+            total=Count('id'),
+            pending_acknowledgements=Count('id', filter=pending & Q(acknowledgment_date__isnull=True)),
+            overdue_deliveries=Count('id', filter=pending & Q(delivery_date__lt=now)),
+            **status_counts
+        ))
+        # Archived orders are all closed
+        archived = VendorArchiveTotals.objects.using(shard).filter(vendor__deleted_at__isnull=True).aggregate(
+            orders=Sum('orders'), completed=Sum('completed_orders')
+        )
+        archived_orders, archived_completed = archived['orders'] or 0, archived['completed'] or 0
+        purchase_orders.update({
+            'total': archived_orders, 'completed': archived_completed, 'canceled': archived_orders - archived_completed,
+        })
+        vendor_sums.update({key: value or 0 for key, value in Vendor.objects.using(shard).aggregate(
+            total=Count('id'), **{field: Sum(field) for field in Vendor.METRIC_FIELDS}
+        ).items()})
+    vendors = {'total': vendor_sums['total']}
+    for field in Vendor.METRIC_FIELDS:
+        vendors[f'{field}_avg'] = vendor_sums[field] / vendor_sums['total'] if vendor_sums['total'] else 0
+    return {
+        'purchase_orders': {
+            'total': purchase_orders.pop('total'),
+            **{value: purchase_orders.pop(value) for value in status_counts},
+        },
+        'pending_acknowledgements': purchase_orders['pending_acknowledgements'],
+        'overdue_deliveries': purchase_orders['overdue_deliveries'],
+        'vendors': vendors,
+        'generated_at': now,
+    }
+
+
+def get_dashboard_summary():
+    """
+    Return the cached dashboard summary. Once it is older than
+    `DASHBOARD_SUMMARY_CACHE_SECONDS` or marked dirty, the caller that takes
+    the lock recalculates it while the others keep getting the stale
+    summary, so a burst of viewers costs one recalculation. Only a cold
+    cache is recalculated by every caller.
+    """
+    cached = cache.get_many([DASHBOARD_SUMMARY_CACHE_KEY, DASHBOARD_SUMMARY_DIRTY_KEY])
+    entry = cached.get(DASHBOARD_SUMMARY_CACHE_KEY)
+    if entry is not None:
+        if not cached.get(DASHBOARD_SUMMARY_DIRTY_KEY) and entry['fresh_until'] > time.time():
+            return entry['summary']
+        if not cache.add(DASHBOARD_SUMMARY_LOCK_KEY, True, DASHBOARD_SUMMARY_LOCK_SECONDS):
+            return entry['summary']
+    try:
+        # Cleared first, so changes made during the recalculation mark it dirty again
+        cache.delete(DASHBOARD_SUMMARY_DIRTY_KEY)
+        summary = calculate_dashboard_summary()
+        # Kept past its freshness, to be served while the next recalculation runs
+        cache.set(DASHBOARD_SUMMARY_CACHE_KEY, {
+            'summary': summary, 'fresh_until': time.time() + settings.DASHBOARD_SUMMARY_CACHE_SECONDS,
+        }, None)
+    finally:
+        if entry is not None:
+            cache.delete(DASHBOARD_SUMMARY_LOCK_KEY)
+    return summary
+
+
+@receiver(post_save, sender=PurchaseOrder)
+@receiver(post_delete, sender=PurchaseOrder)
+@receiver(post_save, sender=Vendor)
+@receiver(post_delete, sender=Vendor)
+def mark_dashboard_summary_dirty(sender, **kwargs):
+    """
+    Signal to mark the cached dashboard summary dirty whenever the figures
+    change. Vendor saves of metrics only are skipped: they follow a
+    purchase order change, which has marked it already.
+    """
+    update_fields = kwargs.get('update_fields')
+    if sender is Vendor and update_fields and set(update_fields) <= set(Vendor.METRIC_FIELDS):
+        return
+    cache.set(DASHBOARD_SUMMARY_DIRTY_KEY, True, None)
+
+
+class DashboardSummaryAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(get_dashboard_summary(), status=status.HTTP_200_OK)
+
+
 class PurchaseOrderAcknowledgeAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, po_id):
-        purchase_order = get_object_or_404(PurchaseOrder, pk=po_id)
+        purchase_order = get_object_or_404(PurchaseOrder.objects.using(sharding.shard_for_id(po_id)).live(), pk=po_id)
 
         if not purchase_order.acknowledgment_date:
             purchase_order.acknowledgment_date = timezone.now()
             purchase_order.save()
             return Response({'message': 'Purchase order acknowledged successfully.'}, status=status.HTTP_200_OK)
         else:
-            return Response({'error': 'Purchase order already acknowledged.'}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({'error': 'Purchase order already acknowledged.'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ReportJobListCreateAPIView(APIView):
+    """
+    Request a report to be built in the background, or list your recent
+    report jobs. Poll the job until it is completed, then download it.
+    """
+    permission_classes = [IsAuthenticated]
+    LIST_LIMIT = 50
+
+    def get(self, request):
+        jobs = ReportJob.objects.filter(requested_by=request.user).order_by('-created_at', '-id')[:self.LIST_LIMIT]
+        serializer = ReportJobSerializer(jobs, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        serializer = ReportJobSerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save(requested_by=request.user)
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ReportJobDetailAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(ReportJob, pk=job_id, requested_by=request.user)
+        serializer = ReportJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class ReportJobDownloadAPIView(APIView):
+    """
+    Stream the file of a completed report job.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(ReportJob, pk=job_id, requested_by=request.user)
+        if job.status != 'completed':
+            return Response({'error': f"Report is {job.status}, not completed."}, status=status.HTTP_409_CONFLICT)
+        try:
+            report = open(reports.report_path(job.file_name), 'rb')
+        except FileNotFoundError:
+            return Response({'error': 'Report file no longer exists.'}, status=status.HTTP_410_GONE)
+        return FileResponse(report, as_attachment=True, filename=job.file_name, content_type='application/x-ndjson')
@@ -0,0 +1,211 @@
+"""
+Delivery of the purchase order webhook outbox.
+
+Signal receivers only insert `WebhookEvent` rows; nothing here runs on the
+request path. `dispatch_due_events()` is called by the `send_webhooks`
+worker. It claims due events by moving them to `sending`, so two workers
+never send the same event, and hands each vendor's events to a thread pool
+as one task. The task sends the vendor's batches in order and stops at the
+first failure; the pool size bounds how many vendors are sent to at once.
+Failed batches are retried with exponential backoff until `MAX_ATTEMPTS`
+is reached. A vendor's later events wait until the failed ones are
+delivered or given up, so every vendor receives its events in order.
+
+Every request carries an `X-Webhook-Signature` header: the hex HMAC-SHA256
+of `"<X-Webhook-Timestamp>.<body>"` keyed with the vendor's webhook secret.
+"""
+import hashlib
+import hmac
+import json
+import random
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import sharding
+from .models import WebhookEvent
+
+DEFAULTS = {
+    'BATCH_SIZE': 50,
+    'MAX_WORKERS': 8,
+    'MAX_ATTEMPTS': 8,
+    'RETRY_BASE_SECONDS': 30,
+    'RETRY_MAX_SECONDS': 3600,
+    'TIMEOUT_SECONDS': 10,
+    'CLAIM_TIMEOUT_SECONDS': 15 * 60,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'WEBHOOKS', {}).get(name, DEFAULTS[name])
+
+
+def sign(secret, timestamp, body):
+    message = f"{timestamp}.".encode() + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff with jitter, in seconds, after `attempts` failed attempts.
+    """
+    delay = min(get_setting('RETRY_BASE_SECONDS') * 2 ** (attempts - 1), get_setting('RETRY_MAX_SECONDS'))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def post_batch(url, secret, events):
+    """
+    POST one batch of events. Returns None on a 2xx response, otherwise the error.
+    """
+    body = json.dumps({
+        'events': [
+            {'id': event.id, 'type': event.event_type, 'created_at': event.created_at, 'data': event.payload}
+            for event in events
+        ]
+    }, cls=DjangoJSONEncoder).encode()
+    timestamp = str(int(timezone.now().timestamp()))
+    request = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'X-Webhook-Timestamp': timestamp,
+        'X-Webhook-Signature': f"sha256={sign(secret, timestamp, body)}",
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=get_setting('TIMEOUT_SECONDS')):
+            return None
+    except urllib.error.HTTPError as error:
+        return f"HTTP {error.code}"
+    except (urllib.error.URLError, OSError) as error:
+        return str(getattr(error, 'reason', error))
+
+
+def dispatch_due_events(limit=1000):
+    """
+    Send up to `limit` due events from each vendor shard and record the
+    results. The vendors of all shards share one pool. Database access
+    stays on the calling thread; the pool threads only make HTTP requests.
+    Returns the number of delivered and failed events.
+    """
+    claimed = {}
+    for shard in sharding.get_shards():
+        release_stale_claims(shard)
+        claimed[shard] = claim_due_events(shard, limit)
+    by_vendor = defaultdict(list)
+    for events in claimed.values():
+        for event in events:
+            by_vendor[event.vendor_id].append(event)
+    if not by_vendor:
+        return {'delivered': 0, 'failed': 0}
+
+    with ThreadPoolExecutor(max_workers=get_setting('MAX_WORKERS')) as executor:
+        results = [result for vendor_results in executor.map(send_vendor_events, by_vendor.values()) for result in vendor_results]
+
+    totals = {'delivered': 0, 'failed': 0}
+    for shard, events in claimed.items():
+        if not events:
+            continue
+        shard_results = [(batch, error) for batch, error in results if batch[0]._state.db == shard]
+        for key, value in record_results(shard, events, shard_results).items():
+            totals[key] += value
+    return totals
+
+
+def release_stale_claims(using):
+    """
+    Return events claimed longer than `CLAIM_TIMEOUT_SECONDS` ago to
+    `pending`: the worker sending them has stopped. They may be sent twice.
+    """
+    cutoff = timezone.now() - timedelta(seconds=get_setting('CLAIM_TIMEOUT_SECONDS'))
+    return WebhookEvent.objects.using(using).filter(status='sending', claimed_at__lt=cutoff).update(
+        status='pending', claimed_by='', claimed_at=None
+    )
+
+
+def claim_due_events(using, limit):
+    """
+    Move up to `limit` due events to `sending` for this dispatcher and
+    return them oldest first. Vendors with an event waiting for a retry or
+    being sent by another dispatcher are skipped so their order holds.
+    Events of deleted vendors stay pending until the vendor is purged.
+    """
+    now = timezone.now()
+    events = WebhookEvent.objects.using(using)
+    blocked = events.filter(Q(status='sending') | Q(status='pending', next_attempt_at__gt=now)).values('vendor_id')
+    due = events.filter(
+        status='pending', next_attempt_at__lte=now, vendor__deleted_at__isnull=True
+    ).exclude(vendor_id__in=blocked)
+    ids = list(due.order_by('id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    claim = uuid.uuid4().hex
+    # Only rows still pending and unblocked are taken, so a concurrent dispatcher's claim wins
+    due.filter(id__in=ids).update(status='sending', claimed_by=claim, claimed_at=now)
+    return list(events.filter(status='sending', claimed_by=claim).select_related('vendor').order_by('id'))
+
+
+def send_vendor_events(events):
+    """
+    Send one vendor's events in batches, in order, stopping at the first
+    failed batch. Returns `(batch, error)` for each batch that was tried.
+    """
+    vendor = events[0].vendor
+    batch_size = get_setting('BATCH_SIZE')
+    results = []
+    for start in range(0, len(events), batch_size):
+        batch = events[start:start + batch_size]
+        if vendor.webhook_url:
+            error = post_batch(vendor.webhook_url, vendor.webhook_secret, batch)
+        else:
+            error = "Vendor has no webhook URL"
+        results.append((batch, error))
+        if error is not None:
+            break
+    return results
+
+
+def record_results(using, events, results):
+    """
+    Store the outcome of sending the claimed `events` of one shard and
+    release their claim. Returns the number of delivered and failed events.
+    """
+    delivered = failed = 0
+    tried = set()
+    max_attempts = get_setting('MAX_ATTEMPTS')
+    with transaction.atomic(using=using):
+        for batch, error in results:
+            ids = [event.id for event in batch]
+            tried.update(ids)
+            if error is None:
+                WebhookEvent.objects.using(using).filter(id__in=ids).update(
+                    status='delivered', delivered_at=timezone.now(), attempts=F('attempts') + 1, last_error='',
+                    claimed_by='', claimed_at=None
+                )
+                delivered += len(batch)
+                continue
+            failed += len(batch)
+            for event in batch:
+                event.attempts += 1
+                event.last_error = error
+                event.claimed_by = ''
+                event.claimed_at = None
+                if event.attempts >= max_attempts:
+                    event.status = 'failed'
+                else:
+                    event.status = 'pending'
+                    event.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(event.attempts))
+            WebhookEvent.objects.using(using).bulk_update(
+                batch, ['attempts', 'last_error', 'status', 'next_attempt_at', 'claimed_by', 'claimed_at']
+            )
+        # Batches behind a failed one were not sent; they wait for its retry
+        WebhookEvent.objects.using(using).filter(id__in=[event.id for event in events if event.id not in tried]).update(
+            status='pending', claimed_by='', claimed_at=None
+        )
+    return {'delivered': delivered, 'failed': failed}
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,17 +48,74 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
     ),
+    # Per token and per view token buckets, see Vendor/throttling.py
+    'DEFAULT_THROTTLE_CLASSES': (
+        'Vendor.throttling.TokenBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'read': '600/min',
+        'write': '120/min',
+    },
+}
+
+# Seconds the dashboard summary is served from the cache before it is
+# recalculated. Purchase order changes mark it for recalculation at once.
+DASHBOARD_SUMMARY_CACHE_SECONDS = 30
+
+# Purchase order webhook delivery (see Vendor/webhooks.py and the
+# `send_webhooks` management command).
+WEBHOOKS = {
+    'BATCH_SIZE': 50,
+    'MAX_WORKERS': 8,
+    'MAX_ATTEMPTS': 8,
+    'RETRY_BASE_SECONDS': 30,
+    'RETRY_MAX_SECONDS': 3600,
+    'TIMEOUT_SECONDS': 10,
+    'CLAIM_TIMEOUT_SECONDS': 15 * 60,
+}
+
+# Sampled request capture for load testing (see Vendor/capture.py and the
+# `replay` management command). Set REQUEST_CAPTURE_RATE=0.05 to record 5%
+# of requests.
+REQUEST_CAPTURE_RATE = float(os.environ.get('REQUEST_CAPTURE_RATE', '0'))
+REQUEST_CAPTURE = {
+    'ENABLED': REQUEST_CAPTURE_RATE > 0,
+    'SAMPLE_RATE': REQUEST_CAPTURE_RATE,
+    'PATH': BASE_DIR / 'captures' / 'requests-{pid}.ndjson',
+    'MAX_BYTES': 50 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    'MAX_BODY_BYTES': 64 * 1024,
+}
+
+# Background report jobs (see Vendor/reports.py and the `run_report_jobs`
+# management command).
+REPORTS = {
+    'PATH': BASE_DIR / 'reports',
+    'WORKERS': 4,
+    'VENDORS_PER_TASK': 100,
+    'CLAIM_TIMEOUT': 2 * 60 * 60,
+}
+
+# Concurrent identical GET requests to these views share one response (see
+# Vendor/coalescing.py). An empty list turns coalescing off.
+REQUEST_COALESCING = {
+    'VIEWS': ['vendor-list-create', 'vendor-performance', 'vendor-overview', 'vendor-scores', 'dashboard-summary'],
+    'TIMEOUT': 30,
 }
 
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Removes itself unless REQUEST_CAPTURE is enabled
+    'Vendor.capture.RequestCaptureMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Last, so every other middleware still sees each coalesced request
+    'Vendor.coalescing.RequestCoalescingMiddleware',
 ]
 
 ROOT_URLCONF = 'VendorManagementSystem.urls'
@@ -91,6 +149,19 @@ DATABASES = {
     }
 }
 
+# Vendor data can be split by vendor across several SQLite files to spread
+# write load, see Vendor/sharding.py. Set VENDOR_SHARD_COUNT=4 to add the
+# databases shard1 to shard3 next to default.
+VENDOR_SHARD_COUNT = int(os.environ.get('VENDOR_SHARD_COUNT', '1'))
+VENDOR_SHARDS = ['default'] + [f'shard{i}' for i in range(1, VENDOR_SHARD_COUNT)]
+for alias in VENDOR_SHARDS[1:]:
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_{alias}.sqlite3',
+    }
+
+DATABASE_ROUTERS = ['Vendor.sharding.VendorShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators